@@ -0,0 +1,148 @@
+import argparse
+import base64
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import makebase64
+from bench_throughput import current_commit
+
+
+def make_input(path, size_mb, block=1024 * 1024):
+    """Write size_mb of random bytes, a block at a time."""
+    with open(path, "wb") as outfile:
+        for _ in range(size_mb):
+            outfile.write(os.urandom(block))
+
+def file_digest(path, block=4 * 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as infile:
+        while chunk := infile.read(block):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_all_encode(input_file, output_file):
+    """The old convert_to_base64: the whole input and output in memory at once."""
+    with open(input_file, "rb") as infile:
+        encoded = base64.b64encode(infile.read())
+    with open(output_file, "wb") as outfile:
+        outfile.write(encoded)
+
+def run_case(case, input_file, output_file, processes, results):
+    """Child process: run one case and report its time and peak memory."""
+    started = time.perf_counter()
+    if case == "read_all":
+        read_all_encode(input_file, output_file)
+    elif case == "encode":
+        makebase64.encode_file(input_file, output_file, processes=processes)
+    else:
+        makebase64.decode_file(input_file, output_file, processes=processes)
+    seconds = time.perf_counter() - started
+
+    peak_mb = None
+    if resource is not None:
+        # Worker processes count too; each one's peak is reported separately by the OS
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+        peak_mb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                      resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / scale
+    results.put((seconds, peak_mb))
+
+def measure(case, input_file, output_file, processes=1):
+    """Run a case in a fresh process so its peak RSS is its own."""
+    results = multiprocessing.Queue()
+    child = multiprocessing.Process(target=run_case, args=(case, input_file, output_file, processes, results))
+    child.start()
+    seconds, peak_mb = results.get()
+    child.join()
+    return seconds, peak_mb
+
+
+def run_benchmark(size_mb=256, processes=None):
+    """
+    Encode and decode a random file with the old read-everything approach,
+    the streaming codec and the multi-process mode; every output is checked
+    against the input.
+
+    :param size_mb: Input size in MB.
+    :param processes: Workers for the parallel cases (default: one per core).
+    """
+    processes = processes or os.cpu_count() or 1
+    workdir = tempfile.mkdtemp(prefix="pychatter-b64bench-")
+    try:
+        source = os.path.join(workdir, "input.bin")
+        make_input(source, size_mb)
+        source_digest = file_digest(source)
+        reference = os.path.join(workdir, "reference.b64")
+
+        cases = {}
+        for name, case, input_file, workers in (
+            ("read_all_encode", "read_all", source, 1),
+            ("stream_encode", "encode", source, 1),
+            (f"parallel_encode_x{processes}", "encode", source, processes),
+            ("stream_decode", "decode", reference, 1),
+            (f"parallel_decode_x{processes}", "decode", reference, processes),
+        ):
+            output = reference if name == "read_all_encode" else os.path.join(workdir, f"{name}.out")
+            seconds, peak_mb = measure(case, input_file, output, workers)
+            if case == "decode":
+                correct = file_digest(output) == source_digest
+            else:
+                correct = file_digest(output) == file_digest(reference)
+            cases[name] = {
+                "seconds": round(seconds, 3),
+                "input_mb_per_s": round(os.path.getsize(input_file) / (1024 * 1024) / seconds, 1),
+                "rss_peak_mb": round(peak_mb, 1) if peak_mb is not None else None,
+                "correct": correct,
+            }
+            if output != reference:
+                os.remove(output)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "benchmark": "base64",
+        "commit": current_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "params": {"size_mb": size_mb, "processes": processes, "chunk_size": makebase64.CHUNK_SIZE},
+        "cases": cases,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Base64 file encode/decode throughput and peak memory.")
+    parser.add_argument("-s", "--size-mb", type=int, default=256, help="Size of the random input file in MB.")
+    parser.add_argument("-j", "--processes", type=int, help="Workers for the parallel cases (default: one per core).")
+    parser.add_argument("-o", "--output", help="Write the JSON result here (default: bench_results/base64-<commit>-<time>.json).")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.size_mb, args.processes)
+
+    output = args.output
+    if not output:
+        os.makedirs("bench_results", exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join("bench_results", f"base64-{result['commit'] or 'nogit'}-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as outfile:
+        json.dump(result, outfile, indent=2)
+
+    print(f"{args.size_mb} MB input, chunk {makebase64.CHUNK_SIZE // 1024} KB")
+    for name, timing in result["cases"].items():
+        status = "" if timing["correct"] else "  OUTPUT MISMATCH"
+        print(f"  {name:<22} {timing['seconds']:>8.3f}s  {timing['input_mb_per_s']:>8.1f} MB/s  "
+              f"peak RSS {timing['rss_peak_mb']} MB{status}")
+    print(f"Saved results to '{output}'.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+import numpy as np
+
+import pychatter
+import conversation_stats
+import maintenance
+import message_cache
+from bench_throughput import current_commit, percentile
+from chat_node import ChatNode, init_db
+
+
+WORDS = ("hey", "ok", "lunch", "build", "deploy", "is", "the", "server", "down", "again", "meeting", "at",
+         "noon", "thanks", "sure", "check", "this", "logs", "look", "fine", "ping", "me", "later", "done")
+URLS = ("https://example.com/ticket/4711", "http://intranet.local/wiki/Runbook", "https://github.com/rubysash/pychatter")
+
+
+# Synthetic data
+def message_pool(rng, size=20000):
+    """Pre-built message texts with a long-tailed length distribution, some with links."""
+    lengths = np.clip(rng.lognormal(mean=2.0, sigma=0.8, size=size).astype(int), 1, 200)
+    pool = []
+    for length in lengths:
+        words = rng.choice(WORDS, size=length)
+        text = " ".join(words)
+        if rng.random() < 0.05:
+            text += " " + URLS[rng.integers(len(URLS))]
+        pool.append(text)
+    return pool
+
+def generate(db_path, messages, connections, days=365, skew=1.1, seed=42, chunk=500000):
+    """
+    Fill a database with a synthetic history.
+
+    Conversation sizes follow a Zipf-like distribution (a few busy peers,
+    a long tail of quiet ones) and timestamps are spread over `days` days.
+    Indexes are dropped during the load and rebuilt by init_db afterwards,
+    which is much faster than maintaining them row by row.
+
+    :return: Seconds taken.
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+
+    init_db(db_path)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA synchronous = OFF")
+    cursor.execute("DROP INDEX IF EXISTS idx_messages_ip_timestamp")
+    cursor.execute("DROP INDEX IF EXISTS idx_messages_timestamp")
+
+    # Saved connections: distinct IPs, mostly on the default port
+    ips = [f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}" for n in range(1, connections + 1)]
+    ports = np.where(rng.random(connections) < 0.8, pychatter.DEFAULT_PORT, rng.integers(1024, 65535, connections))
+    cursor.executemany(
+        "INSERT OR IGNORE INTO connections (ip, port, color) VALUES (?, ?, ?)",
+        [(ip, int(port), pychatter.COLOR_MAPPINGS[pychatter.assign_color(f"{ip}:{port}")]) for ip, port in zip(ips, ports)]
+    )
+
+    weights = 1.0 / np.arange(1, connections + 1) ** skew
+    weights /= weights.sum()
+    pool = message_pool(rng)
+
+    end = datetime.datetime.now().replace(microsecond=0)
+    span = days * 86400
+    start_epoch = np.datetime64(end - datetime.timedelta(days=days), "s")
+
+    written = 0
+    while written < messages:
+        count = min(chunk, messages - written)
+        # Each chunk covers its own slice of the time span, so rows go in roughly time order
+        offsets = np.sort(rng.integers(written * span // messages, (written + count) * span // messages + 1, count))
+        timestamps = np.char.replace(np.datetime_as_string(start_epoch + offsets, unit="s"), "T", " ").tolist()
+        peers = rng.choice(connections, size=count, p=weights)
+        # Outgoing rows use the saved port, incoming rows an ephemeral source port
+        row_ports = np.where(rng.random(count) < 0.5, ports[peers], rng.integers(49152, 65535, count)).tolist()
+        texts = rng.integers(len(pool), size=count).tolist()
+        statuses = np.where(rng.random(count) < 0.01, "failure", "success").tolist()
+        peers = peers.tolist()
+
+        cursor.executemany(
+            "INSERT INTO messages (timestamp, ip, port, message, delivery_status) VALUES (?, ?, ?, ?, ?)",
+            zip(timestamps, (ips[peer] for peer in peers), row_ports, (pool[text] for text in texts), statuses)
+        )
+        conn.commit()
+        written += count
+        print(f"  {written:,}/{messages:,} messages", file=sys.stderr)
+
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    conn.close()
+
+    init_db(db_path)  # Recreate the indexes
+    conversation_stats.rebuild_stats(db_path)
+    sqlite_call(db_path, "ANALYZE", ())
+    return time.perf_counter() - started
+
+
+# Query benchmark
+def query_plan(db_path, query, params):
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()]
+    finally:
+        conn.close()
+
+def time_call(func, repeat, setup=None):
+    """Run func `repeat` times and return timing stats in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+def run_queries(db_path, repeat=20):
+    """
+    Time every query the app issues against the given database.
+    History pages are timed against SQLite (the recent-message cache is
+    cleared before each call) and, separately, from a warm cache.
+    """
+    pychatter.DB_PATH = db_path
+    writer = ChatNode(db_path, update_views=True)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    total = cursor.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    busiest, busiest_count = cursor.execute(
+        "SELECT ip, message_count FROM connection_stats ORDER BY message_count DESC LIMIT 1").fetchone()
+    quietest = cursor.execute("SELECT ip FROM connection_stats ORDER BY message_count ASC LIMIT 1").fetchone()[0]
+    busiest_key = f"{busiest}:{cursor.execute('SELECT port FROM connections WHERE ip = ?', (busiest,)).fetchone()[0]}"
+    quietest_key = f"{quietest}:{cursor.execute('SELECT port FROM connections WHERE ip = ?', (quietest,)).fetchone()[0]}"
+    deep_cursor = cursor.execute(
+        "SELECT timestamp, id FROM messages WHERE ip = ? ORDER BY timestamp, id LIMIT 1 OFFSET ?",
+        (busiest, busiest_count // 10)).fetchone()
+    all_deep_cursor = cursor.execute(
+        "SELECT timestamp, id FROM messages ORDER BY timestamp, id LIMIT 1 OFFSET ?", (total // 10,)).fetchone()
+    conn.close()
+
+    cold = message_cache.invalidate
+    cases = {
+        "fetch_connection_colors": (pychatter.fetch_connection_colors, None),
+        "get_connections": (pychatter.get_connections, None),
+        "history_newest_page_busiest": (lambda: pychatter.fetch_history_page(busiest_key), cold),
+        "history_newest_page_quietest": (lambda: pychatter.fetch_history_page(quietest_key), cold),
+        "history_newest_page_all": (lambda: pychatter.fetch_history_page("All Messages"), cold),
+        "history_page_before_deep_busiest": (lambda: pychatter.fetch_history_page(busiest_key, before=deep_cursor), cold),
+        "history_page_before_deep_all": (lambda: pychatter.fetch_history_page("All Messages", before=all_deep_cursor), cold),
+        "history_new_rows_after_deep_busiest": (lambda: pychatter.fetch_new_rows(busiest_key, deep_cursor[1]), None),
+        "history_newest_page_busiest_cached": (lambda: pychatter.fetch_history_page(busiest_key), None),
+        "bind_log_click_lookup": (lambda: sqlite_call(db_path, "SELECT ip, port FROM connections WHERE ip = ? LIMIT 1", (busiest,)), None),
+        "clear_logs_delete_busiest": (lambda: rolled_back(db_path, "DELETE FROM messages WHERE ip = ?", (busiest,)), None),
+        "save_message": (lambda: writer.save_message(
+            datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), busiest, 50000, "benchmark row", incoming=True), None),
+        "load_stats": (lambda: conversation_stats.load_stats(db_path), None),
+        "rebuild_stats_busiest": (lambda: conversation_stats.rebuild_stats(db_path, [busiest]), None),
+        "retention_expiry_cursor": (lambda: expiry_cursor(
+            db_path, busiest, {"max_rows": busiest_count // 2, "max_age_days": 30}), None),
+    }
+
+    plans = {
+        "history_page_ip": query_plan(db_path,
+            "SELECT id FROM messages WHERE ip = ? AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT 100",
+            (busiest, *deep_cursor)),
+        "history_page_all": query_plan(db_path,
+            "SELECT id FROM messages WHERE (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT 100",
+            all_deep_cursor),
+        "new_rows_ip": query_plan(db_path,
+            "SELECT id FROM messages WHERE id > ? AND ip = ? ORDER BY id LIMIT 100",
+            (deep_cursor[1], busiest)),
+        "clear_logs_delete": query_plan(db_path, "DELETE FROM messages WHERE ip = ?", (busiest,)),
+        "bind_log_click_lookup": query_plan(db_path, "SELECT ip, port FROM connections WHERE ip = ? LIMIT 1", (busiest,)),
+    }
+
+    results = {}
+    for name, (func, setup) in cases.items():
+        repeats = 3 if name.startswith("clear_logs") or name.startswith("rebuild") else repeat
+        results[name] = time_call(func, repeats, setup)
+        print(f"  {name}: {results[name]['median_ms']}ms median", file=sys.stderr)
+
+    return {
+        "total_messages": total,
+        "busiest_connection": {"key": busiest_key, "messages": busiest_count},
+        "queries": results,
+        "query_plans": plans,
+        # Plans that read a whole table or sort their result instead of walking an index
+        "full_scans": sorted(name for name, plan in plans.items()
+                             if any(step.startswith("SCAN") or "USE TEMP B-TREE" in step for step in plan)),
+    }
+
+def sqlite_call(db_path, query, params):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+
+def expiry_cursor(db_path, ip, policy):
+    conn = sqlite3.connect(db_path)
+    try:
+        return maintenance.expiry_cursor(conn.cursor(), ip, policy)
+    finally:
+        conn.close()
+
+def rolled_back(db_path, query, params):
+    """Run a destructive statement for timing only and undo it."""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(query, params)
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a large synthetic chat history and time the app's queries against it.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    gen = subparsers.add_parser("generate", help="Fill a database with synthetic history.")
+    gen.add_argument("--db", default="bench_chat.db", help="Database to create (must not exist).")
+    gen.add_argument("-n", "--messages", type=int, default=1_000_000, help="Number of messages.")
+    gen.add_argument("-c", "--connections", type=int, default=5000, help="Number of saved connections.")
+    gen.add_argument("--days", type=int, default=365, help="Days of history to spread messages over.")
+    gen.add_argument("--skew", type=float, default=1.1, help="Zipf exponent; higher means busier top peers.")
+    gen.add_argument("--seed", type=int, default=42, help="Random seed.")
+
+    run = subparsers.add_parser("run", help="Time the app's queries against a database.")
+    run.add_argument("--db", default="bench_chat.db", help="Database to benchmark (it is modified slightly).")
+    run.add_argument("--repeat", type=int, default=20, help="Timed runs per query.")
+    run.add_argument("-o", "--output", help="Write the JSON result here (default: bench_results/db-<commit>-<time>.json).")
+
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        if os.path.exists(args.db):
+            parser.error(f"'{args.db}' already exists; pick a new path so real history is never touched.")
+        seconds = generate(args.db, args.messages, args.connections, args.days, args.skew, args.seed)
+        print(f"Generated {args.messages:,} messages over {args.connections:,} connections in {seconds:.1f}s "
+              f"({args.messages / seconds:,.0f} rows/s) into '{args.db}'.")
+        return
+
+    if not os.path.exists(args.db):
+        parser.error(f"'{args.db}' does not exist; create it with the generate command first.")
+    result = {
+        "benchmark": "db",
+        "commit": current_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "db_path": os.path.abspath(args.db),
+        "db_size_mb": round(os.path.getsize(args.db) / (1024 * 1024), 1),
+        **run_queries(args.db, args.repeat),
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs("bench_results", exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join("bench_results", f"db-{result['commit'] or 'nogit'}-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as outfile:
+        json.dump(result, outfile, indent=2)
+
+    print(f"{result['total_messages']:,} messages, {result['db_size_mb']} MB")
+    for name, timing in result["queries"].items():
+        print(f"  {name:<40} median {timing['median_ms']:>9.3f}ms  p95 {timing['p95_ms']:>9.3f}ms")
+    if result["full_scans"]:
+        print(f"WARNING: full table scans or temporary sorts in {', '.join(result['full_scans'])}")
+    print(f"Saved results to '{output}'.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import argparse
+import datetime
+import functools
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import pychatter
+from bench_throughput import current_commit, free_port, percentile
+
+
+# GUI functions whose time on the Tk thread is measured
+TIMED_CALLBACKS = (
+    "fetch_and_display_logs", "append_new_logs", "load_older_logs", "log_callback", "refresh_connections",
+    "update_connection_badges", "on_connection_select", "make_links_clickable", "poll_logs", "switch_log_view",
+)
+
+
+def start_virtual_display(width=1280, height=1024):
+    """
+    Start Xvfb on a free display number and point DISPLAY at it.
+    Returns the Xvfb process, or None if a display is already available.
+    """
+    if os.environ.get("DISPLAY"):
+        return None
+    xvfb = shutil.which("Xvfb")
+    if not xvfb:
+        raise RuntimeError("No DISPLAY and Xvfb is not installed (e.g. apt install xvfb).")
+
+    for display in range(99, 140):
+        if os.path.exists(f"/tmp/.X11-unix/X{display}") or os.path.exists(f"/tmp/.X{display}-lock"):
+            continue
+        process = subprocess.Popen(
+            [xvfb, f":{display}", "-screen", "0", f"{width}x{height}x24", "-nolisten", "tcp"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        deadline = time.monotonic() + 5.0
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                break  # Display number taken after all; try the next one
+            if os.path.exists(f"/tmp/.X11-unix/X{display}"):
+                os.environ["DISPLAY"] = f":{display}"
+                return process
+            time.sleep(0.05)
+        process.kill()
+    raise RuntimeError("Could not start Xvfb on any display between :99 and :139.")
+
+def instrument(samples):
+    """
+    Replace the GUI functions on pychatter with wrappers that record how
+    long each call held the Tk thread. create_gui's bindings look the
+    functions up by name, so they pick up the wrappers.
+    """
+    originals = {}
+    for name in TIMED_CALLBACKS:
+        func = getattr(pychatter, name)
+        originals[name] = func
+        samples[name] = []
+
+        def wrapper(*args, __func=func, __name=name, **kwargs):
+            started = time.perf_counter()
+            try:
+                return __func(*args, **kwargs)
+            finally:
+                samples[__name].append(time.perf_counter() - started)
+
+        setattr(pychatter, name, functools.wraps(func)(wrapper))
+    return originals
+
+def find_widgets(root):
+    """Collect the widgets the scenario drives from the real create_gui() window."""
+    found = {"text": None, "listbox": None, "buttons": {}, "entries": []}
+    pending = [root]
+    while pending:
+        widget = pending.pop()
+        pending.extend(widget.winfo_children())
+        widget_class = widget.winfo_class()
+        if widget_class == "Text" and found["text"] is None:
+            found["text"] = widget
+        elif widget_class == "Listbox":
+            found["listbox"] = widget
+        elif widget_class == "TButton":
+            found["buttons"][str(widget.cget("text"))] = widget
+        elif widget_class == "TEntry":
+            found["entries"].append(widget)
+    return found
+
+def seed_connections(db_path, connections):
+    """Save the peers the flood will come from, so they appear in the listbox."""
+    pychatter.init_db(db_path)
+    keys = []
+    for n in range(connections):
+        ip = f"127.0.{n // 250}.{n % 250 + 1}"
+        pychatter.save_connection(ip, pychatter.DEFAULT_PORT, pychatter.assign_color(ip))
+        keys.append(f"{ip}:{pychatter.DEFAULT_PORT}")
+    return keys
+
+def flood(port, messages, rate, sizes, stop_event, sent_counter):
+    """Send messages to the local listener from a background thread, like remote peers would."""
+    interval = 1.0 / rate if rate else 0.0
+    for seq in range(messages):
+        if stop_event.is_set():
+            return
+        size = sizes[seq % len(sizes)]
+        payload = f"flood {seq} https://example.com/{seq} " + "x" * max(0, size - 40)
+        try:
+            with socket.create_connection(("127.0.0.1", port)) as client_socket:
+                client_socket.sendall(payload.encode())
+            sent_counter[0] += 1
+        except OSError:
+            pass
+        if interval:
+            time.sleep(interval)
+
+def summarize(values_seconds):
+    ms = sorted(value * 1000 for value in values_seconds)
+    if not ms:
+        return {"count": 0}
+    return {
+        "count": len(ms),
+        "total_ms": round(sum(ms), 3),
+        "mean_ms": round(sum(ms) / len(ms), 3),
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+def run_benchmark(messages=2000, rate=200, connections=20, switches=100, sizes=(40, 200, 800),
+                  probe_ms=10, history=0, settle=3.0):
+    """
+    Build the real window, drive it with a message flood and view switches,
+    and measure Tk callback time and event-loop latency.
+
+    :param messages: Messages sent to the listener during the flood.
+    :param rate: Flood rate in messages per second (0 for as fast as possible).
+    :param connections: Saved connections shown in the listbox.
+    :param switches: Listbox selection changes, spread over the flood.
+    :param probe_ms: Interval of the after() probe measuring event-loop lateness.
+    :param history: Synthetic messages to preload (uses bench_db's generator).
+    :param settle: Seconds to keep running after the flood finishes.
+    """
+    workdir = tempfile.mkdtemp(prefix="pychatter-guibench-")
+    db_path = os.path.join(workdir, "gui.db")
+    if history:
+        import bench_db
+        bench_db.generate(db_path, history, connections)
+    pychatter.DB_PATH = db_path
+    keys = seed_connections(db_path, connections)
+
+    samples = {}
+    originals = instrument(samples)
+
+    app = pychatter.create_gui()
+    widgets = find_widgets(app)
+    listbox = widgets["listbox"]
+
+    port = free_port()
+    for entry in widgets["entries"]:
+        if entry.get() == str(pychatter.DEFAULT_PORT):
+            entry.delete(0, "end")
+            entry.insert(0, str(port))
+    widgets["buttons"]["Start Server"].invoke()
+
+    lateness = []
+    stop_event = threading.Event()
+    sent_counter = [0]
+
+    def probe(expected):
+        now = time.perf_counter()
+        lateness.append(max(0.0, now - expected))
+        if not stop_event.is_set():
+            app.after(probe_ms, probe, time.perf_counter() + probe_ms / 1000)
+
+    switch_interval_ms = max(1, int(1000 * (messages / rate if rate else 5.0) / max(1, switches)))
+    switch_state = {"done": 0}
+
+    def switch_view():
+        if stop_event.is_set() or switch_state["done"] >= switches:
+            return
+        index = 1 + switch_state["done"] % max(1, listbox.size() - 1)
+        listbox.selection_clear(0, "end")
+        listbox.selection_set(index)
+        listbox.event_generate("<<ListboxSelect>>")
+        switch_state["done"] += 1
+        app.after(switch_interval_ms, switch_view)
+
+    def flood_thread():
+        flood(port, messages, rate, list(sizes), stop_event, sent_counter)
+        time.sleep(settle)
+        app.after(0, app.quit)
+
+    started = time.perf_counter()
+    app.after(probe_ms, probe, time.perf_counter() + probe_ms / 1000)
+    app.after(100, switch_view)
+    threading.Thread(target=flood_thread, daemon=True).start()
+    app.mainloop()
+    stop_event.set()
+    wall = time.perf_counter() - started
+
+    pychatter.node.stop()
+    app.destroy()
+    for name, func in originals.items():
+        setattr(pychatter, name, func)
+
+    return {
+        "benchmark": "gui",
+        "commit": current_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "params": {
+            "messages": messages, "rate": rate, "connections": len(keys), "switches": switches,
+            "sizes": list(sizes), "probe_ms": probe_ms, "history": history,
+        },
+        "messages_sent": sent_counter[0],
+        "view_switches": switch_state["done"],
+        "duration_s": round(wall, 3),
+        "event_loop_lateness": summarize(lateness),
+        "callbacks": {name: summarize(values) for name, values in samples.items()},
+        # Poll and selection callbacks include the render functions they call
+        "tk_busy_percent": round(100 * (sum(samples["poll_logs"]) + sum(samples["on_connection_select"])) / wall, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure GUI render cost and event-loop latency under a virtual display.")
+    parser.add_argument("-n", "--messages", type=int, default=2000, help="Messages in the flood.")
+    parser.add_argument("-r", "--rate", type=float, default=200, help="Flood rate in messages/s (0 = unthrottled).")
+    parser.add_argument("-c", "--connections", type=int, default=20, help="Saved connections in the listbox.")
+    parser.add_argument("--switches", type=int, default=100, help="View switches during the flood.")
+    parser.add_argument("-s", "--sizes", default="40,200,800", help="Comma-separated message sizes in bytes.")
+    parser.add_argument("--history", type=int, default=0, help="Synthetic messages to preload into the database.")
+    parser.add_argument("--probe-ms", type=int, default=10, help="after() probe interval for event-loop lateness.")
+    parser.add_argument("-o", "--output", help="Write the JSON result here (default: bench_results/gui-<commit>-<time>.json).")
+    args = parser.parse_args()
+
+    xvfb = start_virtual_display()
+    try:
+        result = run_benchmark(args.messages, args.rate, args.connections, args.switches,
+                               [int(size) for size in args.sizes.split(",")], args.probe_ms, args.history)
+    finally:
+        if xvfb:
+            xvfb.terminate()
+
+    output = args.output
+    if not output:
+        os.makedirs("bench_results", exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join("bench_results", f"gui-{result['commit'] or 'nogit'}-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as outfile:
+        json.dump(result, outfile, indent=2)
+
+    lateness = result["event_loop_lateness"]
+    print(f"{result['messages_sent']} messages, {result['view_switches']} view switches in {result['duration_s']}s")
+    print(f"Event loop lateness ms: p50 {lateness.get('p50_ms')}  p95 {lateness.get('p95_ms')}  "
+          f"p99 {lateness.get('p99_ms')}  max {lateness.get('max_ms')}")
+    for name, timing in result["callbacks"].items():
+        if timing["count"]:
+            print(f"  {name:<26} n={timing['count']:<6} mean {timing['mean_ms']:>8.3f}ms  "
+                  f"p95 {timing['p95_ms']:>8.3f}ms  max {timing['max_ms']:>8.3f}ms")
+    print(f"Saved results to '{output}'.")
+
+if __name__ == "__main__":
+    main()
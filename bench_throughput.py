@@ -0,0 +1,278 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+import sharding
+from chat_node import ChatNode
+from config import COALESCE_MAX_MESSAGES
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def current_commit():
+    """Short hash of the checked-out commit, so results can be compared across commits."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def peak_rss_mb(children=False):
+    """
+    Peak resident set size in MB, if the platform reports it.
+
+    :param children: Report the largest finished child process (such as a
+                     listener shard) instead of this process.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KB elsewhere
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+def wait_for_listener(port, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return True  # The probe connection arrives as an empty message and is ignored
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def run_benchmark(peers, messages, sizes, interval=0.0, use_send_path=False, timeout=60.0, use_queue=False, shards=0,
+                  coalesce=COALESCE_MAX_MESSAGES):
+    """
+    Drive a local listener with simulated peers and measure end-to-end cost.
+
+    Each peer thread sends `messages` messages over loopback exactly as a remote
+    pychatter would (one connection per message) to a ChatNode on a temporary
+    database. Latency is measured from just before the send to the moment
+    save_messages has committed the row.
+
+    :param peers: Number of concurrent simulated peers.
+    :param messages: Messages sent by each peer.
+    :param sizes: Message sizes in bytes, picked at random per message.
+    :param interval: Pause between messages of one peer, in seconds.
+    :param use_send_path: Send through ChatNode.send_message (which also
+                          persists the outgoing copy) instead of raw sockets.
+    :param use_queue: Send through ChatNode.queue_message, so bursts to the
+                      listener are coalesced into shared writes.
+    :param shards: Run the listener as this many SO_REUSEPORT processes.
+    :param coalesce: Messages per write the queued sender may coalesce.
+    :return: Result dict ready to be written as JSON.
+    """
+    workdir = tempfile.mkdtemp(prefix="pychatter-bench-")
+    db_path = os.path.join(workdir, "bench.db")
+    server_log = deque(maxlen=50)  # Recent listener status lines, for error reports
+    node = ChatNode(db_path, log_callback=server_log.append, shards=shards)
+    node.init_db()
+    sender = ChatNode(db_path, coalesce_max_messages=coalesce)  # Outgoing copies for --send-path land in the same database
+
+    sent_at = {}
+    latencies = []
+    persisted = threading.Semaphore(0)
+    lock = threading.Lock()
+    send_errors = [0]
+
+    # Time rows as the listening node commits them
+    def on_persisted(row):
+        done = time.perf_counter()
+        key = row[4].split(" ", 1)[0]
+        with lock:
+            start = sent_at.pop(key, None)
+            if start is not None:
+                latencies.append(done - start)
+        if start is not None:
+            persisted.release()
+
+    node.message_callback = on_persisted
+    port = free_port()
+    if not node.start(port) or not wait_for_listener(port):
+        raise RuntimeError(f"Listener did not come up on port {port}: {list(server_log)[-3:]}")
+
+    def failed(key):
+        with lock:
+            if sent_at.pop(key, None) is not None:
+                send_errors[0] += 1
+
+    def peer(peer_id):
+        rng = random.Random(peer_id)
+        for seq in range(messages):
+            key = f"{peer_id}-{seq}"
+            payload = f"{key} " + "x" * max(0, rng.choice(sizes) - len(key) - 1)
+            with lock:
+                sent_at[key] = time.perf_counter()
+            try:
+                if use_queue:
+                    sender.queue_message("127.0.0.1", port, payload, callback=lambda error, key=key: error and failed(key))
+                elif use_send_path:
+                    if sender.send_message("127.0.0.1", port, payload) is not None:
+                        raise OSError("send failed")
+                else:
+                    with socket.create_connection(("127.0.0.1", port)) as client_socket:
+                        client_socket.sendall(payload.encode())
+            except OSError:
+                with lock:
+                    sent_at.pop(key, None)
+                    send_errors[0] += 1
+            if interval:
+                time.sleep(interval)
+
+    cpu_before = os.times()
+    wall_start = time.perf_counter()
+
+    threads = [threading.Thread(target=peer, args=(peer_id,), daemon=True) for peer_id in range(peers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    expected = peers * messages - send_errors[0]
+    deadline = time.monotonic() + timeout
+    received = 0
+    while received < expected and persisted.acquire(timeout=max(0.0, deadline - time.monotonic())):
+        received += 1
+
+    wall = time.perf_counter() - wall_start
+    cpu_after = os.times()
+    cpu_seconds = (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system)
+
+    sender.close()
+    node.close()
+
+    # Shard processes only report their CPU time and RSS once they have been
+    # joined, which node.close() does. Their time includes their startup.
+    shard_cpu_seconds = shard_rss_peak_mb = None
+    if shards > 1 and sharding.reuse_port_supported():
+        cpu_joined = os.times()
+        shard_cpu_seconds = ((cpu_joined.children_user - cpu_before.children_user)
+                             + (cpu_joined.children_system - cpu_before.children_system))
+        cpu_seconds += shard_cpu_seconds
+        shard_rss_peak_mb = peak_rss_mb(children=True)
+
+    latencies.sort()
+    ms = [value * 1000 for value in latencies]
+    return {
+        "benchmark": "throughput",
+        "commit": current_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "params": {
+            "peers": peers,
+            "messages_per_peer": messages,
+            "sizes": sizes,
+            "interval": interval,
+            "send_path": use_send_path,
+            "queue": use_queue,
+            "shards": shards,
+            "coalesce": coalesce if use_queue else None,
+        },
+        "messages_sent": peers * messages - send_errors[0],
+        "messages_persisted": received,
+        "send_errors": send_errors[0],
+        "duration_s": round(wall, 4),
+        "throughput_msgs_per_s": round(received / wall, 1) if wall else None,
+        "latency_ms": {
+            "mean": round(sum(ms) / len(ms), 3) if ms else None,
+            "p50": round(percentile(ms, 50), 3) if ms else None,
+            "p95": round(percentile(ms, 95), 3) if ms else None,
+            "p99": round(percentile(ms, 99), 3) if ms else None,
+            "max": round(ms[-1], 3) if ms else None,
+        },
+        "cpu_seconds": round(cpu_seconds, 3),
+        "cpu_percent": round(100 * cpu_seconds / wall, 1) if wall else None,
+        "rss_peak_mb": round(peak_rss_mb(), 1) if resource else None,
+        "shard_cpu_seconds": round(shard_cpu_seconds, 3) if shard_cpu_seconds is not None else None,
+        "shard_rss_peak_mb": round(shard_rss_peak_mb, 1) if shard_rss_peak_mb is not None else None,
+        "db_path": db_path,
+    }
+
+def compare(result, baseline):
+    """Print how a run differs from a saved baseline run."""
+    print(f"Compared with {baseline.get('commit')} ({baseline.get('date')}):")
+    rows = [
+        ("throughput_msgs_per_s", result["throughput_msgs_per_s"], baseline.get("throughput_msgs_per_s")),
+        ("latency p50 ms", result["latency_ms"]["p50"], baseline.get("latency_ms", {}).get("p50")),
+        ("latency p99 ms", result["latency_ms"]["p99"], baseline.get("latency_ms", {}).get("p99")),
+        ("cpu_percent", result["cpu_percent"], baseline.get("cpu_percent")),
+        ("rss_peak_mb", result["rss_peak_mb"], baseline.get("rss_peak_mb")),
+    ]
+    for name, new, old in rows:
+        if new is None or not old:
+            print(f"  {name}: {new} (baseline {old})")
+        else:
+            print(f"  {name}: {new} vs {old} ({(new - old) / old:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure end-to-end message throughput and latency over loopback.")
+    parser.add_argument("-p", "--peers", type=int, default=4, help="Concurrent simulated peers.")
+    parser.add_argument("-m", "--messages", type=int, default=100, help="Messages sent by each peer.")
+    parser.add_argument("-s", "--sizes", default="32,256,1000", help="Comma-separated message sizes in bytes.")
+    parser.add_argument("--interval", type=float, default=0.0, help="Seconds between messages of one peer.")
+    parser.add_argument("--send-path", action="store_true", help="Send through ChatNode.send_message.")
+    parser.add_argument("--queue-path", action="store_true",
+                        help="Send through ChatNode.queue_message, which coalesces bursts to the same peer.")
+    parser.add_argument("--coalesce", type=int, default=COALESCE_MAX_MESSAGES, metavar="N",
+                        help="With --queue-path, send up to N messages to the listener per write.")
+    parser.add_argument("--shards", type=int, default=0, help="Run the listener as N SO_REUSEPORT processes.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for rows to be persisted.")
+    parser.add_argument("-o", "--output", help="Write the JSON result here (default: bench_results/throughput-<commit>-<time>.json).")
+    parser.add_argument("--compare", help="Baseline JSON result to compare against.")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    result = run_benchmark(args.peers, args.messages, sizes, args.interval, args.send_path, args.timeout,
+                           args.queue_path, args.shards, args.coalesce)
+
+    output = args.output
+    if not output:
+        os.makedirs("bench_results", exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join("bench_results", f"throughput-{result['commit'] or 'nogit'}-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as outfile:
+        json.dump(result, outfile, indent=2)
+
+    latency = result["latency_ms"]
+    print(f"{result['messages_persisted']}/{result['messages_sent']} messages persisted in {result['duration_s']}s "
+          f"({result['throughput_msgs_per_s']} msg/s)")
+    print(f"Latency ms: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    print(f"CPU {result['cpu_percent']}%  peak RSS {result['rss_peak_mb']} MB")
+    if result["shard_cpu_seconds"] is not None:
+        print(f"  of which listener shards: CPU {result['shard_cpu_seconds']}s  largest shard peak RSS {result['shard_rss_peak_mb']} MB")
+    print(f"Saved results to '{output}'.")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            compare(result, json.load(baseline_file))
+
+if __name__ == "__main__":
+    main()
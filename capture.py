@@ -0,0 +1,92 @@
+import struct
+import threading
+import time
+
+
+# Capture format: a magic line, then one record per message. Each record is
+# a fixed header (direction, microseconds since the capture started, port
+# and the byte lengths of its fields) followed by the IP and identity as
+# UTF-8 and the payload bytes exactly as they went over the socket.
+CAPTURE_MAGIC = b"PYCHATTER-CAPTURE-1\n"
+RECORD_HEADER = struct.Struct("<cQHBBI")  # direction, offset_us, port, len(ip), len(identity), len(payload)
+
+INBOUND = b"I"
+OUTBOUND = b"O"
+
+
+class CapturedMessage:
+    """One recorded message; offset is seconds since the capture started."""
+    __slots__ = ("direction", "offset", "ip", "port", "identity", "payload")
+
+    def __init__(self, direction, offset, ip, port, identity, payload):
+        self.direction = direction
+        self.offset = offset
+        self.ip = ip
+        self.port = port
+        self.identity = identity
+        self.payload = payload
+
+
+class TrafficCapture:
+    """
+    Appends messages to a capture file with their timing relative to the
+    first record. Safe to share between the listener's client threads and
+    the sender; writes are buffered and flushed on close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(CAPTURE_MAGIC)
+        self.lock = threading.Lock()
+        self.started = None
+        self.count = 0
+
+    def record(self, direction, ip, port, payload, identity=""):
+        """
+        :param direction: INBOUND or OUTBOUND.
+        :param payload: The bytes received or sent.
+        """
+        now = time.perf_counter()
+        ip_bytes = ip.encode("utf-8")
+        identity_bytes = identity.encode("utf-8")
+        with self.lock:
+            if self.file is None:
+                return  # Closed while a handler was still running
+            if self.started is None:
+                self.started = now
+            offset_us = max(0, int((now - self.started) * 1_000_000))
+            self.file.write(RECORD_HEADER.pack(direction, offset_us, port, len(ip_bytes), len(identity_bytes), len(payload))
+                            + ip_bytes + identity_bytes + payload)
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_capture(path):
+    """
+    Read a capture file record by record.
+
+    :return: Generator of CapturedMessage, in recorded order.
+    :raises ValueError: If the file is not a capture or a record is cut short.
+    """
+    header_size = RECORD_HEADER.size
+    with open(path, "rb") as infile:
+        if infile.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"'{path}' is not a pychatter capture file.")
+        while True:
+            header = infile.read(header_size)
+            if not header:
+                break
+            if len(header) < header_size:
+                raise ValueError("Truncated record header in capture file.")
+            direction, offset_us, port, ip_len, identity_len, payload_len = RECORD_HEADER.unpack(header)
+            body = infile.read(ip_len + identity_len + payload_len)
+            if len(body) < ip_len + identity_len + payload_len:
+                raise ValueError("Truncated record in capture file.")
+            yield CapturedMessage(direction, offset_us / 1_000_000, body[:ip_len].decode("utf-8"), port,
+                                  body[ip_len:ip_len + identity_len].decode("utf-8"), body[ip_len + identity_len:])
@@ -0,0 +1,607 @@
+import datetime
+import queue
+import socket
+import sqlite3
+import struct
+import threading
+import time
+
+import capture
+import conversation_stats
+import input_history
+import maintenance
+import message_cache
+import metrics
+import sharding
+from pipeline import STOP, ChatMessage, Pipeline, decode_utf8
+from priority import PriorityLanes, classify, split_message
+from config import (
+    COALESCE_MAX_BYTES,
+    COALESCE_MAX_MESSAGES,
+    COALESCE_WINDOW_MS,
+    DB_PATH,
+    DEFAULT_PORT,
+    MAX_MESSAGE_BYTES,
+    RECEIVE_TIMEOUT,
+)
+
+
+# Metrics for the engine hot paths, shared by every node in the process
+accepted_connections = metrics.counter("connections_accepted_total", "Incoming connections accepted by the listener")
+accept_errors = metrics.counter("accept_errors_total", "Errors raised while accepting connections")
+active_handlers = metrics.gauge("client_handlers_active", "handle_client threads currently running")
+received_messages = metrics.counter("messages_received_total", "Messages received from peers")
+sent_messages = metrics.counter("messages_sent_total", "Messages sent to peers")
+failed_sends = metrics.counter("send_failures_total", "Messages that could not be delivered")
+coalesced_writes = metrics.counter("coalesced_writes_total", "Outbound writes that carried several messages")
+db_write_seconds = metrics.histogram("db_write_seconds", "Time to persist one message, or one coalesced batch, in save_messages")
+
+
+# Coalesced writes: the magic line, then each message as a 4-byte big-endian
+# length and its UTF-8 bytes. Single messages still go out bare, so peers
+# running older versions only misread bursts.
+BATCH_MAGIC = b"\x00PYCHATTER-BATCH-1\n"
+BATCH_LENGTH = struct.Struct(">I")
+
+def pack_batch(payloads):
+    """Frame several message payloads for one write."""
+    return BATCH_MAGIC + b"".join(BATCH_LENGTH.pack(len(payload)) + payload for payload in payloads)
+
+def unpack_batch(data):
+    """
+    Split a received write back into its messages.
+
+    :return: List of payloads; a bare message (or a malformed batch) comes back whole.
+    """
+    if not data.startswith(BATCH_MAGIC):
+        return [data]
+    payloads = []
+    offset = len(BATCH_MAGIC)
+    while offset < len(data):
+        if offset + BATCH_LENGTH.size > len(data):
+            return [data]
+        (length,) = BATCH_LENGTH.unpack_from(data, offset)
+        offset += BATCH_LENGTH.size
+        if offset + length > len(data):
+            return [data]
+        payloads.append(data[offset:offset + length])
+        offset += length
+    return payloads
+
+
+# SQLite Database Setup
+def init_db(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    # WAL lets the GUI read while server threads write, and incremental
+    # auto_vacuum lets maintenance hand freed pages back a little at a time
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute("PRAGMA auto_vacuum")
+    if cursor.fetchone()[0] != 2:
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        cursor.execute("VACUUM")  # One-off rebuild so the new mode takes effect
+
+    # Check if the connections table exists
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS connections (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ip TEXT,
+        port INTEGER,
+        color TEXT,
+        UNIQUE(ip, port)
+    )
+    """)
+
+    # Ensure the messages table exists with its current schema
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        ip TEXT,
+        port INTEGER,
+        message TEXT,
+        delivery_status TEXT DEFAULT 'success',
+        identity TEXT DEFAULT '',
+        incoming INTEGER
+    )
+    """)
+
+    # Older databases predate per-identity tagging; their rows keep an
+    # empty identity and a NULL direction
+    cursor.execute("PRAGMA table_info(messages)")
+    columns = {column[1] for column in cursor.fetchall()}
+    if "identity" not in columns:
+        cursor.execute("ALTER TABLE messages ADD COLUMN identity TEXT DEFAULT ''")
+    if "incoming" not in columns:
+        cursor.execute("ALTER TABLE messages ADD COLUMN incoming INTEGER")
+
+    # Per-conversation summary maintained by save_messages
+    conversation_stats.create_stats_table(cursor)
+
+    # Sent-message input history (see input_history.py)
+    input_history.create_history_table(cursor)
+
+    # Keyset pagination indexes: one per-connection, one for "All Messages"
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_ip_timestamp ON messages (ip, timestamp, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp, id)")
+    # Live tail of one connection: rows after the last id shown, in id order
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_ip_id ON messages (ip, id)")
+
+    conn.commit()
+    conn.close()
+
+
+class ChatNode:
+    """
+    One chat endpoint: a listener, an outbound sender and the database they
+    write to. Holds no Tk state, so several nodes can run in one process and
+    tools can drive one without the GUI; the GUI is just one user of a node.
+
+    Received messages go through self.pipeline (see pipeline.py), which
+    decodes and persists them; register plugins on it to filter, enrich,
+    notify or render. Events are also reported through callbacks, called
+    from the listener, pipeline or sender threads:
+
+    - log_callback(text): status lines, and outgoing messages as the log view shows them.
+    - message_callback(row): a message was persisted; row is the (id, timestamp,
+      ip, port, message, delivery_status, identity, incoming) tuple history pages use.
+
+    Several nodes can share one database as separate identities, each on its
+    own port; every row they store is tagged with the identity's name.
+
+    start_capture() records everything the node receives and sends to a
+    capture file, which replay.py can play back against a local node.
+
+    queue_message() sends in the background through self.outbox, which
+    serves control, interactive and bulk traffic by weighted fair
+    scheduling (see priority.py); bulk messages go out in chunks, so a
+    large paste does not delay short messages queued after it. Messages
+    queued for the same peer within COALESCE_WINDOW_MS share one
+    connection, one write and one transaction (see send_batch) when
+    coalesce_max_messages allows it; only peers that split batches may
+    be sent them, so it is off by default.
+
+    With shards > 1 the listener runs as that many processes sharing the
+    port through SO_REUSEPORT (see sharding.py). They decode and store
+    messages themselves and this node takes each stored message over in
+    relay_stored, from its enrich stage on; decode and filter plugins
+    registered here do not see them.
+    """
+
+    def __init__(self, db_path=DB_PATH, listen_port=DEFAULT_PORT, log_callback=None, message_callback=None,
+                 update_views=False, host="0.0.0.0", backlog=10, identity="", reuse_port=False, shards=0,
+                 coalesce_max_messages=COALESCE_MAX_MESSAGES):
+        """
+        :param db_path: SQLite database this node stores messages in.
+        :param listen_port: Port start() listens on unless given another one.
+        :param log_callback: Receives status lines and formatted messages.
+        :param message_callback: Receives each persisted message row.
+        :param update_views: Keep the process-wide recent-message cache and
+                             conversation summaries in step with this node's
+                             writes. Only the node whose database the GUI
+                             shows should set this.
+        :param host: Address the listener binds to.
+        :param backlog: Pending connections the listener queues.
+        :param identity: Name this node's traffic is tagged with ("" for the default identity).
+        :param reuse_port: Bind with SO_REUSEPORT, so other processes can listen on the same port.
+        :param shards: Listener processes to spread incoming connections over;
+                       0 or 1 listens in this process.
+        :param coalesce_max_messages: Messages to one peer queue_message may send
+                                      in one write; 1 (the default) sends each on
+                                      its own, as peers before batching expect.
+        """
+        self.db_path = db_path
+        self.identity = identity
+        self.listen_port = listen_port
+        self.log_callback = log_callback
+        self.message_callback = message_callback
+        self.update_views = update_views
+        self.host = host
+        self.backlog = backlog
+        self.reuse_port = reuse_port
+        self.shards = shards
+        self.coalesce_max_messages = coalesce_max_messages
+
+        self.server_socket = None
+        self.server_thread = None
+        self.shard_group = None  # ListenerShards while sharded
+        self.stop_event = threading.Event()
+        self.running = False
+        self.capture = None  # TrafficCapture while recording
+        self.outbox = PriorityLanes()
+        self.sender_thread = None
+        self.sender_lock = threading.Lock()
+
+        self.pipeline = Pipeline(log_callback=self.log)
+        self.pipeline.register("decode", decode_utf8)
+        self.pipeline.register("persist", self.persist, batch=True)
+
+    def log(self, text):
+        if self.log_callback:
+            self.log_callback(f"[{self.identity}] {text}" if self.identity else text)
+
+    def init_db(self):
+        init_db(self.db_path)
+
+    # Client/Server Related
+    def start(self, listen_port=None):
+        """
+        Bind the listener and accept connections on a background thread,
+        each client handled on its own thread.
+
+        :param listen_port: Port to listen on; defaults to the node's listen_port.
+        :return: True if the listener is running, False if it could not bind.
+        """
+        if self.running:
+            self.log("Server is already running.")
+            return True
+        if listen_port is not None:
+            self.listen_port = listen_port
+
+        if self.shards > 1:
+            if sharding.reuse_port_supported():
+                return self.start_shards()
+            self.log("SO_REUSEPORT is not available here; listening in a single process.")
+
+        # Bind here rather than on the thread so the caller learns about a busy port
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            if self.reuse_port:
+                server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            server_socket.bind((self.host, self.listen_port))
+            server_socket.listen(self.backlog)
+            server_socket.settimeout(1.0)  # Timeout for accept(), to notice stop()
+        except OSError as e:
+            server_socket.close()
+            self.log(f"Error starting server: {e}")
+            return False
+
+        self.server_socket = server_socket
+        self.pipeline.start()
+        self.stop_event.clear()
+        self.running = True
+        self.server_thread = threading.Thread(target=self.serve, args=(server_socket,), daemon=True)
+        self.server_thread.start()
+        self.log(f"Server listening on port {self.listen_port}...")
+        return True
+
+    def start_shards(self):
+        """Start listening through self.shards listener processes."""
+        self.pipeline.start()  # Already running while the shards come up: early arrivals are relayed through it
+        shard_group = sharding.ListenerShards(self, self.shards)
+        if not shard_group.start(self.listen_port):
+            self.pipeline.stop()  # The shards are stopped and their relay thread has ended
+            return False
+        self.shard_group = shard_group
+        self.stop_event.clear()
+        self.running = True
+        self.log(f"Server listening on port {self.listen_port} with {self.shards} listener processes...")
+        return True
+
+    def serve(self, server_socket):
+        """
+        The main server loop that accepts incoming connections
+        and starts a new thread to handle each client.
+        """
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    conn, addr = server_socket.accept()  # Wait for a connection
+                    accepted_connections.inc()
+                    self.log(f"New connection from {addr[0]}:{addr[1]}")
+                    threading.Thread(target=self.handle_client, args=(conn, addr), daemon=True).start()
+                except socket.timeout:
+                    continue  # Allow the loop to check the stop event
+                except OSError as e:
+                    if self.stop_event.is_set():
+                        break  # Socket closed by stop()
+                    accept_errors.inc()
+                    self.log(f"Error accepting client: {e}")
+        except Exception as e:
+            self.log(f"Fatal server error: {e}")
+        finally:
+            server_socket.close()
+            self.log("Server thread exiting.")
+
+    def stop(self, wait=False):
+        """
+        Stop the listener.
+
+        :param wait: Also wait for the listener thread to exit. Don't wait
+                     from the Tk thread, since the listener's last log line
+                     may be waiting for that thread.
+        """
+        if not self.running:
+            return
+        self.log("Server stopping...")
+        self.stop_event.set()
+        if self.shard_group is not None:
+            # Shards finish their messages first, relaying log lines meanwhile,
+            # so only the caller that asked to wait blocks on them
+            if wait:
+                self.shard_group.stop()
+            else:
+                threading.Thread(target=self.shard_group.stop, name="shard-stop", daemon=True).start()
+            self.shard_group = None
+        if self.server_socket:
+            try:
+                self.server_socket.close()
+            except OSError as e:
+                self.log(f"Error closing server socket: {e}")
+            finally:
+                self.server_socket = None
+        if wait and self.server_thread and self.server_thread is not threading.current_thread():
+            self.server_thread.join()
+        self.server_thread = None
+        self.running = False
+
+    def close(self):
+        """
+        Stop the listener, let the pipeline and the outbox finish the
+        messages they hold and end any capture.
+        """
+        self.stop(wait=True)
+        self.pipeline.stop()
+        with self.sender_lock:
+            if self.sender_thread is not None:
+                self.outbox.put_last(STOP)
+                self.sender_thread.join()
+                self.sender_thread = None
+        self.stop_capture()
+
+    def start_capture(self, path_or_capture):
+        """
+        Record received and sent messages with their timing.
+
+        :param path_or_capture: A file path, or a TrafficCapture to share with other nodes.
+        """
+        if isinstance(path_or_capture, capture.TrafficCapture):
+            self.capture = path_or_capture
+        else:
+            self.capture = capture.TrafficCapture(path_or_capture)
+        self.log(f"Capturing traffic to {self.capture.path}")
+
+    def stop_capture(self):
+        """Stop recording and close the capture file."""
+        if self.capture is not None:
+            self.capture.close()
+            self.log(f"Captured {self.capture.count} messages to {self.capture.path}")
+            self.capture = None
+
+    def handle_client(self, conn, addr):
+        """
+        Handles communication with a single client.
+        Reads the message until the peer closes the connection (at most
+        MAX_MESSAGE_BYTES) and hands it to the pipeline, stamped with the
+        arrival time and classed by size. A coalesced write is split back
+        into its messages.
+        """
+        active_handlers.inc()
+        try:
+            conn.settimeout(RECEIVE_TIMEOUT)
+            chunks = []
+            size = 0
+            while size < MAX_MESSAGE_BYTES:
+                try:
+                    chunk = conn.recv(min(65536, MAX_MESSAGE_BYTES - size))
+                except socket.timeout:
+                    break  # The peer went quiet without closing; take what arrived
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+            data = b"".join(chunks)
+            if data:
+                if self.capture is not None:
+                    self.capture.record(capture.INBOUND, addr[0], addr[1], data, self.identity)
+                payloads = unpack_batch(data)
+                received_messages.inc(len(payloads))
+                timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                for payload in payloads:
+                    self.pipeline.submit(ChatMessage(timestamp, addr[0], addr[1], raw=payload, identity=self.identity,
+                                                     priority=classify(len(payload))))
+        except Exception as e:
+            self.log(f"Error handling client {addr}: {e}")
+        finally:
+            conn.close()
+            active_handlers.dec()
+
+    def send_message(self, ip, port, message):
+        """
+        Deliver a message to a peer and store the outgoing copy, marked
+        "failure" if it could not be delivered.
+
+        :return: None on success, or the exception that made the send fail.
+        """
+        return self.send_batch(ip, port, [message])
+
+    def send_batch(self, ip, port, messages):
+        """
+        Deliver several messages to one peer over a single connection and
+        store the outgoing copies in one transaction. The peer splits the
+        write back into separate messages; a single message goes out bare.
+
+        :return: None on success, or the exception that made the send fail
+                 (every message of the batch is then stored as "failure").
+        """
+        payloads = [message.encode() for message in messages]
+        if self.capture is not None:
+            for payload in payloads:
+                self.capture.record(capture.OUTBOUND, ip, port, payload, self.identity)
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
+                client_socket.connect((ip, port))
+                client_socket.sendall(payloads[0] if len(payloads) == 1 else pack_batch(payloads))
+        except Exception as e:
+            failed_sends.inc(len(messages))
+            timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.log(f"[{timestamp}] Failed to send {len(messages)} message(s) to {ip}:{port}. Error: {e}")
+            self.save_messages([(timestamp, ip, port, message, "failure", False) for message in messages])
+            return e
+
+        sent_messages.inc(len(messages))
+        if len(messages) > 1:
+            coalesced_writes.inc()
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for message in messages:
+            self.log(f"[{timestamp}] {ip}:{port}: {message}")
+        self.save_messages([(timestamp, ip, port, message, "success", False) for message in messages])
+        return None
+
+    def queue_message(self, ip, port, message, priority=None, callback=None):
+        """
+        Send a message in the background. Bulk messages are split into
+        frames of at most BULK_CHUNK_SIZE bytes, each sent and stored as its
+        own message, so interactive messages can go out between them.
+
+        :param priority: One of priority.PRIORITIES; by default classed by size.
+        :param callback: Called from the sender thread with None once every
+                         frame was delivered, or with the first error (later
+                         frames of the message are then not sent).
+        """
+        priority = priority or classify(len(message.encode()))
+        frames = split_message(message) if priority == "bulk" else [message]
+        transfer = {"remaining": len(frames), "error": None, "callback": callback}
+        with self.sender_lock:
+            if self.sender_thread is None:
+                self.sender_thread = threading.Thread(target=self.send_queued, name="chat-sender", daemon=True)
+                self.sender_thread.start()
+        for frame in frames:
+            self.outbox.put((ip, port, frame, transfer), priority=priority, size=len(frame.encode()))
+
+    def send_queued(self):
+        """
+        Sender thread: take frames in the order the outbox schedules them,
+        gather what arrives for the same peer within COALESCE_WINDOW_MS and
+        deliver each peer's frames with one send_batch.
+        """
+        while True:
+            item = self.outbox.get()
+            if item is STOP:
+                return
+            batches, stopping = self.gather_batches(item, max_messages=self.coalesce_max_messages)
+            for (ip, port), items in batches:
+                self.deliver_batch(ip, port, items)
+            if stopping:
+                return
+
+    def gather_batches(self, item, window_ms=COALESCE_WINDOW_MS, max_messages=COALESCE_MAX_MESSAGES,
+                       max_bytes=COALESCE_MAX_BYTES):
+        """
+        Collect outbox frames for up to window_ms after item (at most
+        max_messages in all), grouped by peer; a group that would pass
+        max_bytes is closed and the peer's next frames start a new one.
+
+        :return: ([((ip, port), items), ...] in order of each group's first
+                 frame, True if the stop sentinel was taken meanwhile).
+        """
+        batches = []
+        open_batches = {}  # (ip, port) -> [items, bytes] still accepting frames
+        deadline = time.monotonic() + window_ms / 1000
+        taken = 0
+        while True:
+            ip, port, frame, transfer = item
+            size = len(frame.encode())
+            batch = open_batches.get((ip, port))
+            if batch is None or len(batch[0]) >= max_messages or batch[1] + size > max_bytes:
+                batch = open_batches[(ip, port)] = [[], 0]
+                batches.append(((ip, port), batch[0]))
+            batch[0].append(item)
+            batch[1] += size
+            taken += 1
+            if taken >= max_messages:
+                return batches, False
+            try:
+                item = self.outbox.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                return batches, False
+            if item is STOP:
+                return batches, True
+
+    def deliver_batch(self, ip, port, items):
+        """Send one peer's gathered frames and report finished transfers to their callbacks."""
+        live = [item for item in items if item[3]["error"] is None]  # Skip the rest of failed transfers
+        error = self.send_batch(ip, port, [frame for _, _, frame, _ in live]) if live else None
+        for _, _, _, transfer in items:
+            if transfer["error"] is None:
+                transfer["error"] = error
+            transfer["remaining"] -= 1
+            if transfer["remaining"] == 0 and transfer["callback"]:
+                try:
+                    transfer["callback"](transfer["error"])
+                except Exception as e:
+                    self.log(f"Error in send callback: {e}")
+
+    def relay_stored(self, row):
+        """
+        Take over a message a listener shard has stored: update the views,
+        report it and run it through the enrich stage onwards.
+
+        :param row: The stored (id, timestamp, ip, port, message, delivery_status, identity, incoming) row.
+        """
+        row_id, timestamp, ip, port, text, delivery_status, identity, incoming = row
+        received_messages.inc()
+        if self.update_views:
+            conversation_stats.apply_recorded(ip, timestamp, text[:conversation_stats.PREVIEW_LENGTH], 1 if incoming else 0)
+            message_cache.add(row)
+        maintenance.note_activity()
+        if self.message_callback:
+            self.message_callback(row)
+        message = ChatMessage(timestamp, ip, port, text=text, incoming=bool(incoming), delivery_status=delivery_status,
+                              identity=identity, priority=classify(len(text.encode())))
+        message.id = row_id  # Already stored, so persist passes it by
+        self.pipeline.submit(message, "enrich")
+
+    # Database Save Functions
+    def persist(self, messages):
+        """Pipeline persist plugin (batch): store received messages in one transaction."""
+        messages = [message for message in messages if message.id is None]
+        if not messages:
+            return
+        ids = self.save_messages([(message.timestamp, message.ip, message.port, message.text,
+                                   message.delivery_status, message.incoming) for message in messages])
+        for message, row_id in zip(messages, ids):
+            message.id = row_id
+
+    def save_message(self, timestamp, ip, port, message, delivery_status="success", incoming=False):
+        """
+        Store one message together with its conversation summary update.
+
+        :return: The new row's id.
+        """
+        return self.save_messages([(timestamp, ip, port, message, delivery_status, incoming)])[0]
+
+    def save_messages(self, entries):
+        """
+        Store several messages, with their conversation summary updates, in
+        a single transaction.
+
+        :param entries: (timestamp, ip, port, message, delivery_status, incoming) tuples.
+        :return: The new rows' ids, in order.
+        """
+        started = time.perf_counter()
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        rows = []
+        recorded = []
+        for timestamp, ip, port, message, delivery_status, incoming in entries:
+            cursor.execute(
+                "INSERT INTO messages (timestamp, ip, port, message, delivery_status, identity, incoming) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (timestamp, ip, port, message, delivery_status, self.identity, int(incoming))
+            )
+            rows.append((cursor.lastrowid, timestamp, ip, port, message, delivery_status, self.identity, int(incoming)))
+            recorded.append(conversation_stats.record_message(cursor, ip, timestamp, message, incoming))
+        conn.commit()
+        conn.close()
+
+        if self.update_views:
+            for row, summary in zip(rows, recorded):
+                conversation_stats.apply_recorded(*summary)
+                message_cache.add(row)
+        maintenance.note_activity()
+        db_write_seconds.observe(time.perf_counter() - started)
+        if self.message_callback:
+            for row in rows:
+                self.message_callback(row)
+        return [row[0] for row in rows]
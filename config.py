@@ -1,6 +1,102 @@
 # config.py
 DEFAULT_PORT = 6443
 
+# SQLite database holding connections and message history
+DB_PATH = "chat_app.db"
+
+# Number of messages fetched per history page (initial view and each scroll-back)
+HISTORY_PAGE_SIZE = 100
+
+# In-memory cache of the newest messages per conversation, in front of SQLite
+RECENT_CACHE_PER_CONVERSATION = 500
+RECENT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# Local metrics endpoint (JSON at /, Prometheus text at /metrics); None disables it
+STATS_PORT = None
+
+# Opt-in profiling (also set with --profile / PYCHATTER_PROFILE, --slow-ms / PYCHATTER_SLOW_MS)
+PROFILE_DIR = "profiles"
+PROFILE_SLOW_MS = 50
+
+# History retention, keyed by "ip:port" (or bare IP) with "*" as the default.
+# Each policy may set "max_age_days" and/or "max_rows"; expired messages are
+# moved into compressed monthly files in ARCHIVE_DIR. Empty keeps everything.
+# Example: {"*": {"max_age_days": 365}, "10.0.0.5:6443": {"max_rows": 10000}}
+RETENTION_POLICIES = {}
+ARCHIVE_DIR = "archive"
+RETENTION_BATCH_SIZE = 5000
+
+# Clearing a conversation's logs deletes in batches on a background thread,
+# pausing between them so incoming messages can be stored meanwhile
+PURGE_BATCH_SIZE = 2000
+PURGE_PAUSE_SECONDS = 0.01
+
+# Background maintenance (retention, incremental vacuum, ANALYZE, WAL checkpoint)
+MAINTENANCE_INTERVAL = 300     # seconds between passes at most
+MAINTENANCE_IDLE_SECONDS = 60  # only run after this long without new messages
+
+# Extra identities hosted by the same window, name -> listen port. Each gets
+# its own listener and its traffic is tagged with the name in the database.
+# The port in the window's server field belongs to the default identity.
+# Example: {"ops": 6443, "dev": 6444}
+IDENTITIES = {}
+
+# Live log view buffer. Once the rendered history passes either cap, whole
+# rows are trimmed from the far end in one batch, down to (1 - LOG_TRIM_FRACTION)
+# of the caps; trimmed rows are reloaded from the database by scrolling back.
+LOG_MAX_LINES = 5000
+LOG_MAX_CHARS = 2_000_000
+LOG_TRIM_FRACTION = 0.2
+LOG_MAX_STATUS_LINES = 200     # transient status lines kept between polls
+LOG_VIEWS_MAX = 8              # conversations whose rendered view is kept for instant switching
+
+# Sent-message input history, per connection (Up/Down and Ctrl-R in the message box)
+INPUT_HISTORY_SIZE = 5000          # lines kept per connection, in memory and in the database
+INPUT_HISTORY_CONNECTIONS = 20     # connections whose history stays loaded
+
+# Incoming message pipeline (see pipeline.py): worker threads per stage.
+# 0 workers means the owner drains the stage itself (the GUI renders on the Tk thread).
+# Every stage before persist has 1 worker so it can't reorder messages: within
+# a traffic class (see priority.py) they are stored in arrival order, while
+# interactive messages may still overtake bulk ones. More workers on a stage
+# before persist trade that ordering for throughput.
+PIPELINE_WORKERS = {"decode": 1, "filter": 1, "enrich": 1, "persist": 1, "notify": 1, "render": 0}
+PIPELINE_QUEUE_SIZE = 1000     # messages waiting per stage before handlers block
+PIPELINE_BATCH_SIZE = 200       # messages a stage with batch plugins (persist) takes at once
+RENDER_BATCH = 200             # rendered messages per Tk tick at most
+RENDER_INTERVAL_MS = 50
+
+# Notifications: messages arriving within one window share a single sound and title update
+NOTIFY_COALESCE_MS = 500
+FLASH_INTERVAL_MS = 500        # title blink period while the window is unfocused
+TITLE_MAX_PEERS = 3            # peers named in the title's unread summary
+
+# Traffic classes (see priority.py): lanes are served by deficit round robin
+PRIORITY_WEIGHTS = {"control": 8, "interactive": 4, "bulk": 1}
+PRIORITY_QUANTUM = 4096        # bytes a weight-1 lane may take per round
+BULK_THRESHOLD = 4096          # messages larger than this many bytes are bulk
+BULK_CHUNK_SIZE = 16384        # bulk messages are sent as frames of at most this many bytes
+MAX_MESSAGE_BYTES = 1024 * 1024  # a received message is cut off after this many bytes
+RECEIVE_TIMEOUT = 10.0         # seconds a peer may stay silent before its message is taken as complete
+
+# Listener processes sharing the port through SO_REUSEPORT (see sharding.py),
+# so decoding and storing scale past one interpreter's GIL. 0 listens in the
+# window's own process; also set with --shards.
+LISTENER_SHARDS = 0
+
+# Outbound coalescing: messages queued for the same peer within this window go
+# out in one connection and one write, and are stored in one transaction.
+# Peers still see separate messages, but only if they run a version that
+# splits batches; older ones store a burst as one garbled message. Off
+# (1 message per write) by default; raise it, e.g. to 100, once every peer
+# you talk to is up to date.
+COALESCE_WINDOW_MS = 5
+COALESCE_MAX_MESSAGES = 1
+COALESCE_MAX_BYTES = 64 * 1024
+
+# Incoming messages containing any of these words (case-insensitive) are highlighted
+ALERT_KEYWORDS = []
+
 # Standard color palette with exact mappings
 COLOR_MAPPINGS = {
     "red": "#FF0000",
@@ -0,0 +1,206 @@
+import sqlite3
+import threading
+
+from config import DB_PATH
+
+
+PREVIEW_LENGTH = 80
+
+# In-memory summary per IP, kept current by the message write path so the
+# connections list never has to query the messages table
+conversation_stats = {}
+stats_lock = threading.Lock()
+stats_version = 0  # Bumped on every change so the GUI can skip needless redraws
+
+
+class ConversationStats:
+    """Summary of one conversation (all messages exchanged with an IP)."""
+    __slots__ = ("message_count", "last_timestamp", "last_preview", "unread_count")
+
+    def __init__(self, message_count=0, last_timestamp=None, last_preview="", unread_count=0):
+        self.message_count = message_count
+        self.last_timestamp = last_timestamp
+        self.last_preview = last_preview
+        self.unread_count = unread_count
+
+
+def create_stats_table(cursor):
+    """Create the connection_stats table if it does not exist yet."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS connection_stats (
+        ip TEXT PRIMARY KEY,
+        message_count INTEGER DEFAULT 0,
+        last_timestamp TEXT,
+        last_preview TEXT,
+        unread_count INTEGER DEFAULT 0
+    )
+    """)
+
+def record_message(cursor, ip, timestamp, message, incoming=False):
+    """
+    Update the summary for a newly saved message.
+    Runs on the caller's cursor so the update commits in the same transaction
+    as the message insert; call apply_recorded() after the commit.
+    """
+    preview = message[:PREVIEW_LENGTH]
+    unread = 1 if incoming else 0
+    cursor.execute(
+        """
+        INSERT INTO connection_stats (ip, message_count, last_timestamp, last_preview, unread_count)
+        VALUES (?, 1, ?, ?, ?)
+        ON CONFLICT(ip) DO UPDATE SET
+            message_count = message_count + 1,
+            last_timestamp = MAX(IFNULL(last_timestamp, ''), excluded.last_timestamp),
+            last_preview = CASE WHEN excluded.last_timestamp >= IFNULL(last_timestamp, '')
+                                THEN excluded.last_preview ELSE last_preview END,
+            unread_count = unread_count + excluded.unread_count
+        """,
+        (ip, timestamp, preview, unread)
+    )
+    return ip, timestamp, preview, unread
+
+def apply_recorded(ip, timestamp, preview, unread):
+    """Mirror a committed record_message() into the in-memory summary."""
+    global stats_version
+    with stats_lock:
+        stats = conversation_stats.get(ip)
+        if stats is None:
+            stats = conversation_stats[ip] = ConversationStats()
+        stats.message_count += 1
+        stats.unread_count += unread
+        if stats.last_timestamp is None or timestamp >= stats.last_timestamp:
+            stats.last_timestamp = timestamp
+            stats.last_preview = preview
+        stats_version += 1
+
+def load_stats(db_path=DB_PATH):
+    """
+    Load the summary table into memory at startup.
+    Databases created before the table existed are backfilled once.
+    """
+    global stats_version
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT ip, message_count, last_timestamp, last_preview, unread_count FROM connection_stats")
+        rows = cursor.fetchall()
+        needs_backfill = not rows and cursor.execute("SELECT 1 FROM messages LIMIT 1").fetchone() is not None
+    finally:
+        conn.close()
+
+    if needs_backfill:
+        rebuild_stats(db_path)
+        return
+
+    with stats_lock:
+        conversation_stats.clear()
+        for ip, count, last_timestamp, preview, unread in rows:
+            conversation_stats[ip] = ConversationStats(count, last_timestamp, preview or "", unread)
+        stats_version += 1
+
+def rebuild_stats(db_path=DB_PATH, ips=None):
+    """
+    Recompute counts and latest message from the messages table.
+    Used after bulk changes (imports, retention, deletes); unread counts are kept.
+
+    :param ips: Only rebuild these IPs, or every IP when None.
+    """
+    global stats_version
+    query = """
+        SELECT ip, COUNT(*), MAX(timestamp),
+               (SELECT message FROM messages AS latest
+                WHERE latest.ip = m.ip ORDER BY timestamp DESC, id DESC LIMIT 1)
+        FROM messages AS m
+        {where}
+        GROUP BY ip
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        if ips is None:
+            cursor.execute(query.format(where=""))
+            rows = cursor.fetchall()
+            cursor.execute("DELETE FROM connection_stats WHERE ip NOT IN (SELECT DISTINCT ip FROM messages)")
+        else:
+            ips = list(ips)
+            rows = []
+            for ip in ips:
+                cursor.execute(query.format(where="WHERE ip = ?"), (ip,))
+                rows.extend(cursor.fetchall())
+            found = {row[0] for row in rows}
+            cursor.executemany("DELETE FROM connection_stats WHERE ip = ?", [(ip,) for ip in ips if ip not in found])
+
+        cursor.executemany(
+            """
+            INSERT INTO connection_stats (ip, message_count, last_timestamp, last_preview)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(ip) DO UPDATE SET
+                message_count = excluded.message_count,
+                last_timestamp = excluded.last_timestamp,
+                last_preview = excluded.last_preview
+            """,
+            [(ip, count, last_timestamp, (preview or "")[:PREVIEW_LENGTH]) for ip, count, last_timestamp, preview in rows]
+        )
+        conn.commit()
+
+        cursor.execute("SELECT ip, message_count, last_timestamp, last_preview, unread_count FROM connection_stats")
+        table = cursor.fetchall()
+    finally:
+        conn.close()
+
+    with stats_lock:
+        conversation_stats.clear()
+        for ip, count, last_timestamp, preview, unread in table:
+            conversation_stats[ip] = ConversationStats(count, last_timestamp, preview or "", unread)
+        stats_version += 1
+
+def mark_read(ip, db_path=DB_PATH):
+    """Reset the unread counter for an IP, in memory and in the table."""
+    global stats_version
+    with stats_lock:
+        stats = conversation_stats.get(ip)
+        if stats is None or stats.unread_count == 0:
+            return
+        stats.unread_count = 0
+        stats_version += 1
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("UPDATE connection_stats SET unread_count = 0 WHERE ip = ?", (ip,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def forget(ip, cursor=None):
+    """Drop the summary for an IP whose messages were all deleted."""
+    global stats_version
+    if cursor is not None:
+        cursor.execute("DELETE FROM connection_stats WHERE ip = ?", (ip,))
+    with stats_lock:
+        conversation_stats.pop(ip, None)
+        stats_version += 1
+
+def get_stats(ip):
+    """Return the ConversationStats for an IP, or None if it has no messages."""
+    return conversation_stats.get(ip)
+
+def total_unread():
+    """Unread messages across every conversation."""
+    with stats_lock:
+        return sum(stats.unread_count for stats in conversation_stats.values())
+
+def unread_by_ip():
+    """(ip, unread_count) of every conversation with unread messages, most unread first."""
+    with stats_lock:
+        unread = [(ip, stats.unread_count) for ip, stats in conversation_stats.items() if stats.unread_count]
+    return sorted(unread, key=lambda item: item[1], reverse=True)
+
+def sort_by_activity(connection_keys):
+    """
+    Order "ip:port" keys by most recent message first.
+    Connections without any messages keep their order at the end.
+    """
+    def activity(key):
+        stats = conversation_stats.get(key.split(":")[0])
+        return stats.last_timestamp if stats and stats.last_timestamp else ""
+    return sorted(connection_keys, key=activity, reverse=True)
@@ -0,0 +1,299 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import struct
+import sys
+
+import conversation_stats
+import message_cache
+from chat_node import init_db
+from config import DB_PATH
+
+
+FORMATS = ("jsonl", "csv", "bin")
+
+# Rows are pulled from SQLite and written out in chunks of this size
+EXPORT_CHUNK_SIZE = 5000
+# Rows per transaction when importing
+IMPORT_CHUNK_SIZE = 10000
+
+CSV_FIELDS = ["table", "timestamp", "ip", "port", "message", "delivery_status", "color", "identity", "incoming"]
+
+# Binary format: a magic line, then one record per row. Each record is a fixed
+# header (kind, port, direction and the byte lengths of its strings) followed
+# by the UTF-8 strings. Messages use the "status" slot for delivery_status,
+# connections use it for their color and leave timestamp/message empty.
+# Version 1 files predate identity and direction; they are still read.
+BINARY_MAGIC = b"PYCHATTER-HISTORY-2\n"
+BINARY_MAGIC_V1 = b"PYCHATTER-HISTORY-1\n"
+# kind, port, len(timestamp), len(ip), len(status), len(message), len(identity), incoming (-1 if unknown)
+RECORD_HEADER = struct.Struct("<cHBBBIBb")
+RECORD_HEADER_V1 = struct.Struct("<cHBBBI")  # kind, port, len(timestamp), len(ip), len(status), len(message)
+
+
+def detect_format(path, fmt=None):
+    """Pick the file format from an explicit choice or the file extension."""
+    if fmt:
+        return fmt
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    return {"json": "jsonl", "jsonl": "jsonl", "csv": "csv"}.get(extension, "bin")
+
+def normalize_end(end):
+    """Treat a bare date as the end of that day so --end is inclusive."""
+    if end and len(end) == 10:
+        return f"{end} 23:59:59"
+    return end
+
+
+# Export
+def iter_rows(cursor, query, params=()):
+    """Yield rows in chunks without ever materializing the full result."""
+    cursor.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+        if not rows:
+            break
+        yield rows
+
+def export_history(output_file, fmt=None, db_path=DB_PATH, ip=None, start=None, end=None, tables=("connections", "messages")):
+    """
+    Stream connections and messages from the database into a file.
+    Memory use is bounded by EXPORT_CHUNK_SIZE regardless of history size.
+
+    :param output_file: Path of the export file ("-" for stdout).
+    :param fmt: "jsonl", "csv" or "bin"; guessed from the extension if omitted.
+    :param ip: Only export this IP's connections and messages.
+    :param start: Earliest message timestamp, inclusive.
+    :param end: Latest message timestamp, inclusive.
+    :return: Number of rows written.
+    """
+    fmt = detect_format(output_file, fmt)
+    end = normalize_end(end)
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    written = 0
+
+    binary = fmt == "bin"
+    if output_file == "-":
+        outfile = sys.stdout.buffer if binary else sys.stdout
+    else:
+        outfile = open(output_file, "wb" if binary else "w", encoding=None if binary else "utf-8", newline="" if fmt == "csv" else None)
+
+    try:
+        writer = None
+        if fmt == "csv":
+            writer = csv.writer(outfile)
+            writer.writerow(CSV_FIELDS)
+        elif binary:
+            outfile.write(BINARY_MAGIC)
+
+        if "connections" in tables:
+            query = "SELECT ip, port, color FROM connections"
+            params = ()
+            if ip:
+                query += " WHERE ip = ?"
+                params = (ip,)
+            for rows in iter_rows(cursor, query, params):
+                if fmt == "jsonl":
+                    outfile.writelines(
+                        json.dumps({"table": "connections", "ip": r_ip, "port": port, "color": color}) + "\n"
+                        for r_ip, port, color in rows
+                    )
+                elif fmt == "csv":
+                    writer.writerows(["connections", "", r_ip, port, "", "", color, "", ""] for r_ip, port, color in rows)
+                else:
+                    outfile.write(b"".join(pack_record(b"C", "", r_ip, port, color or "", "", "", None) for r_ip, port, color in rows))
+                written += len(rows)
+
+        if "messages" in tables:
+            conditions, params = [], []
+            if ip:
+                conditions.append("ip = ?")
+                params.append(ip)
+            if start:
+                conditions.append("timestamp >= ?")
+                params.append(start)
+            if end:
+                conditions.append("timestamp <= ?")
+                params.append(end)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            query = (f"SELECT timestamp, ip, port, message, delivery_status, identity, incoming "
+                     f"FROM messages {where} ORDER BY timestamp, id")
+
+            for rows in iter_rows(cursor, query, params):
+                if fmt == "jsonl":
+                    outfile.writelines(
+                        json.dumps({"table": "messages", "timestamp": ts, "ip": r_ip, "port": port,
+                                    "message": message, "delivery_status": status,
+                                    "identity": identity or "", "incoming": incoming}) + "\n"
+                        for ts, r_ip, port, message, status, identity, incoming in rows
+                    )
+                elif fmt == "csv":
+                    writer.writerows(["messages", ts, r_ip, port, message, status, "", identity or "", "" if incoming is None else incoming]
+                                     for ts, r_ip, port, message, status, identity, incoming in rows)
+                else:
+                    outfile.write(b"".join(pack_record(b"M", ts, r_ip, port, status or "", message, identity or "", incoming)
+                                           for ts, r_ip, port, message, status, identity, incoming in rows))
+                written += len(rows)
+    finally:
+        if outfile not in (sys.stdout, sys.stdout.buffer):
+            outfile.close()
+        conn.close()
+    return written
+
+def pack_record(kind, timestamp, ip, port, status, message, identity, incoming):
+    """Encode one row in the binary export format."""
+    timestamp, ip, status, message, identity = (value.encode("utf-8") for value in (timestamp, ip, status, message, identity))
+    direction = -1 if incoming is None else int(incoming)
+    return (RECORD_HEADER.pack(kind, port, len(timestamp), len(ip), len(status), len(message), len(identity), direction)
+            + timestamp + ip + status + message + identity)
+
+
+# Import
+def read_jsonl(infile):
+    for line in infile:
+        if line.strip():
+            yield json.loads(line)
+
+def read_csv(infile):
+    for row in csv.DictReader(infile):
+        row["port"] = int(row["port"])
+        incoming = row.get("incoming")  # Absent from files exported before it was added
+        row["incoming"] = int(incoming) if incoming else None
+        yield row
+
+def read_binary(infile):
+    magic = infile.read(len(BINARY_MAGIC))
+    if magic == BINARY_MAGIC:
+        record_header = RECORD_HEADER
+    elif magic == BINARY_MAGIC_V1:
+        record_header = RECORD_HEADER_V1
+    else:
+        raise ValueError("Not a pychatter binary history file.")
+    header_size = record_header.size
+    while True:
+        header = infile.read(header_size)
+        if not header:
+            break
+        if len(header) < header_size:
+            raise ValueError("Truncated record header in binary history file.")
+        if record_header is RECORD_HEADER:
+            kind, port, ts_len, ip_len, status_len, message_len, identity_len, direction = record_header.unpack(header)
+        else:
+            kind, port, ts_len, ip_len, status_len, message_len = record_header.unpack(header)
+            identity_len, direction = 0, -1
+        body_size = ts_len + ip_len + status_len + message_len + identity_len
+        body = infile.read(body_size)
+        if len(body) < body_size:
+            raise ValueError("Truncated record body in binary history file.")
+        timestamp, ip, status, message, identity = (
+            body[offset:offset + length].decode("utf-8") for offset, length in (
+                (0, ts_len), (ts_len, ip_len), (ts_len + ip_len, status_len),
+                (ts_len + ip_len + status_len, message_len), (len(body) - identity_len, identity_len)))
+        if kind == b"C":
+            yield {"table": "connections", "ip": ip, "port": port, "color": status}
+        else:
+            yield {"table": "messages", "timestamp": timestamp, "ip": ip, "port": port,
+                   "message": message, "delivery_status": status,
+                   "identity": identity, "incoming": None if direction < 0 else direction}
+
+def import_history(input_file, fmt=None, db_path=DB_PATH, ip=None, start=None, end=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Stream an export file into the database in chunked transactions.
+    Connections are merged on (ip, port); messages are appended with new ids.
+    Files exported before identity and direction were recorded import with
+    the default identity and an unknown direction.
+
+    :return: Number of rows imported.
+    """
+    fmt = detect_format(input_file, fmt)
+    end = normalize_end(end)
+
+    readers = {"jsonl": read_jsonl, "csv": read_csv, "bin": read_binary}
+    if fmt == "bin":
+        infile = open(input_file, "rb")
+    else:
+        infile = open(input_file, "r", encoding="utf-8", newline="" if fmt == "csv" else None)
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    imported = 0
+    messages, connections = [], []
+
+    def flush():
+        nonlocal imported
+        if connections:
+            cursor.executemany(
+                "INSERT INTO connections (ip, port, color) VALUES (?, ?, ?) "
+                "ON CONFLICT(ip, port) DO UPDATE SET color = excluded.color",
+                connections
+            )
+        if messages:
+            cursor.executemany(
+                "INSERT INTO messages (timestamp, ip, port, message, delivery_status, identity, incoming) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                messages
+            )
+        conn.commit()
+        imported += len(connections) + len(messages)
+        connections.clear()
+        messages.clear()
+
+    try:
+        for record in readers[fmt](infile):
+            if ip and record["ip"] != ip:
+                continue
+            if record["table"] == "connections":
+                connections.append((record["ip"], int(record["port"]), record["color"]))
+            else:
+                timestamp = record["timestamp"]
+                if (start and timestamp < start) or (end and timestamp > end):
+                    continue
+                messages.append((timestamp, record["ip"], int(record["port"]),
+                                 record["message"], record["delivery_status"] or "success",
+                                 record.get("identity") or "", record.get("incoming")))
+            if len(messages) + len(connections) >= chunk_size:
+                flush()
+        flush()
+    finally:
+        infile.close()
+        conn.close()
+
+    conversation_stats.rebuild_stats(db_path)
+    message_cache.invalidate()
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream chat history to and from JSONL, CSV or binary files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for name, help_text in (("export", "Export history to a file."), ("import", "Import history from a file.")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("file", help="Path of the history file (\"-\" for stdout on export).")
+        sub.add_argument("--format", choices=FORMATS, help="File format (default: from the extension, else bin).")
+        sub.add_argument("--db", default=DB_PATH, help="Path to the chat database.")
+        sub.add_argument("--ip", help="Only this connection's IP.")
+        sub.add_argument("--start", help="Earliest message timestamp, e.g. 2024-01-31.")
+        sub.add_argument("--end", help="Latest message timestamp, e.g. 2024-12-31 (inclusive).")
+    subparsers.choices["import"].add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE,
+                                              help="Rows per import transaction.")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            count = export_history(args.file, args.format, args.db, args.ip, args.start, args.end)
+            print(f"Exported {count} rows to '{args.file}'.", file=sys.stderr)
+        else:
+            init_db(args.db)  # Make sure the target has the current schema
+            count = import_history(args.file, args.format, args.db, args.ip, args.start, args.end, args.chunk_size)
+            print(f"Imported {count} rows from '{args.file}'.", file=sys.stderr)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import sqlite3
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
+
+from config import DB_PATH, INPUT_HISTORY_CONNECTIONS, INPUT_HISTORY_SIZE
+
+
+class InputHistory:
+    """
+    Recent input lines of one connection.
+    entries is a ring of (seq, text) in the order they were sent; index holds
+    the same pairs as (text, seq) sorted by text, so all lines starting with a
+    prefix form one contiguous slice found with bisect.
+    """
+    __slots__ = ("entries", "index", "position")
+
+    def __init__(self, maxlen):
+        self.entries = deque(maxlen=maxlen)
+        self.index = []
+        self.position = 0  # Up/Down cursor into entries; len(entries) is the empty new line
+
+
+# Connection key ("ip:port") -> InputHistory, least recently used first
+input_histories = OrderedDict()
+history_lock = threading.Lock()
+
+
+def create_history_table(cursor):
+    """Create the input_history table if it does not exist yet."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS input_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        connection TEXT,
+        text TEXT
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_input_history_connection ON input_history (connection, id)")
+
+def remember(history, seq, text):
+    """Append to the ring and the sorted index, dropping the evicted line from both."""
+    if len(history.entries) == history.entries.maxlen:
+        old_seq, old_text = history.entries[0]
+        del history.index[bisect_left(history.index, (old_text, old_seq))]
+    history.entries.append((seq, text))
+    insort(history.index, (text, seq))
+    history.position = len(history.entries)
+
+def get_history(connection, db_path=DB_PATH):
+    """
+    Return a connection's history, loading its newest INPUT_HISTORY_SIZE
+    lines from SQLite on first use. Only INPUT_HISTORY_CONNECTIONS
+    connections are kept in memory; the least recently used is dropped.
+    """
+    with history_lock:
+        history = input_histories.get(connection)
+        if history is not None:
+            input_histories.move_to_end(connection)
+            return history
+
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT id, text FROM input_history WHERE connection = ? ORDER BY id DESC LIMIT ?",
+            (connection, INPUT_HISTORY_SIZE)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    history = InputHistory(INPUT_HISTORY_SIZE)
+    history.entries.extend(reversed(rows))
+    history.index = sorted((text, seq) for seq, text in rows)  # One sort instead of an insort per line
+    history.position = len(history.entries)
+
+    with history_lock:
+        input_histories[connection] = history
+        while len(input_histories) > INPUT_HISTORY_CONNECTIONS:
+            input_histories.popitem(last=False)
+    return history
+
+def add(connection, text, db_path=DB_PATH):
+    """
+    Store a sent line. Repeating the previous line is not stored twice, and
+    lines beyond INPUT_HISTORY_SIZE are pruned from the table as well.
+    """
+    history = get_history(connection, db_path)
+    if history.entries and history.entries[-1][1] == text:
+        history.position = len(history.entries)
+        return
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO input_history (connection, text) VALUES (?, ?)", (connection, text))
+        seq = cursor.lastrowid
+        if len(history.entries) == history.entries.maxlen:
+            # The ring is full, so its oldest line marks the table's cut-off too
+            cursor.execute("DELETE FROM input_history WHERE connection = ? AND id <= ?",
+                           (connection, history.entries[0][0]))
+        conn.commit()
+    finally:
+        conn.close()
+
+    with history_lock:
+        remember(history, seq, text)
+
+def step(connection, direction, db_path=DB_PATH):
+    """
+    Move through a connection's history like Up/Down in a shell.
+
+    :param direction: -1 for older, +1 for newer.
+    :return: The line to show, or "" past the newest line, or None if there is no history.
+    """
+    history = get_history(connection, db_path)
+    if not history.entries:
+        return None
+    history.position = max(0, min(len(history.entries), history.position + direction))
+    if history.position == len(history.entries):
+        return ""
+    return history.entries[history.position][1]
+
+def search(connection, prefix, before=None, db_path=DB_PATH):
+    """
+    Find the newest line starting with prefix, for incremental Ctrl-R search.
+    The candidates come from one bisect into the sorted index, so the cost
+    depends on the number of matches, not the size of the history.
+
+    :param before: Only consider lines older than this seq (to step to the next match).
+    :return: (seq, text) of the match, or None.
+    """
+    history = get_history(connection, db_path)
+    with history_lock:
+        if not prefix:
+            # Everything matches; the newest line is at the end of the ring
+            for seq, text in reversed(history.entries):
+                if before is None or seq < before:
+                    return seq, text
+            return None
+
+        index = history.index
+        start = bisect_left(index, (prefix,))
+        best = None
+        for position in range(start, len(index)):
+            text, seq = index[position]
+            if not text.startswith(prefix):
+                break
+            if (before is None or seq < before) and (best is None or seq > best[0]):
+                best = (seq, text)
+    return best
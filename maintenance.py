@@ -0,0 +1,369 @@
+import argparse
+import datetime
+import glob
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import conversation_stats
+import message_cache
+from config import (
+    ARCHIVE_DIR,
+    DB_PATH,
+    MAINTENANCE_IDLE_SECONDS,
+    MAINTENANCE_INTERVAL,
+    PURGE_BATCH_SIZE,
+    PURGE_PAUSE_SECONDS,
+    RETENTION_BATCH_SIZE,
+    RETENTION_POLICIES,
+)
+
+
+# Time of the last message written, used to detect idle periods
+last_activity = time.monotonic()
+
+# Event to signal the maintenance thread to stop
+maintenance_stop_event = threading.Event()
+maintenance_thread = None
+
+
+def note_activity():
+    """
+    Record that the live database was just written to.
+    Called from the message write path so maintenance waits for quiet periods.
+    """
+    global last_activity
+    last_activity = time.monotonic()
+
+
+# Retention
+def resolve_policy(ip, policies=None):
+    """
+    Return the retention policy that applies to an IP.
+    Policies are keyed like the connections list ("ip:port") or by bare IP,
+    with "*" as the default for everything else. Messages are grouped by IP
+    in the log view, so an "ip:port" key covers every message for that IP.
+
+    :param ip: The IP address of the conversation.
+    :param policies: Mapping of keys to {"max_age_days": int, "max_rows": int}.
+    :return: The matching policy dict, or None if history is kept forever.
+    """
+    policies = RETENTION_POLICIES if policies is None else policies
+    for key, policy in policies.items():
+        if key != "*" and key.split(":")[0] == ip:
+            return policy
+    return policies.get("*")
+
+def expiry_cursor(cursor, ip, policy, now=None):
+    """
+    Compute the (timestamp, id) cursor below which rows for an IP are expired.
+    Returns None when nothing is expired under the policy.
+    """
+    boundaries = []
+
+    max_age_days = policy.get("max_age_days")
+    if max_age_days:
+        now = now or datetime.datetime.now()
+        cutoff = (now - datetime.timedelta(days=max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+        boundaries.append((cutoff, 0))  # ids start at 1, so this is "timestamp < cutoff"
+
+    max_rows = policy.get("max_rows")
+    if max_rows:
+        cursor.execute(
+            "SELECT timestamp, id FROM messages WHERE ip = ? ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET ?",
+            (ip, max_rows)
+        )
+        row = cursor.fetchone()
+        if row:
+            boundaries.append((row[0], row[1] + 1))  # Includes the first row past the limit
+
+    return max(boundaries) if boundaries else None
+
+def archive_rows(rows, archive_dir=ARCHIVE_DIR):
+    """
+    Append rows to the monthly gzip archive partitions.
+    Each call adds a new gzip member, which gzip readers treat as one stream.
+
+    :param rows: Iterable of (id, timestamp, ip, port, message, delivery_status, identity, incoming).
+    :param archive_dir: Directory holding the archive partitions.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    partitions = {}
+    for row_id, timestamp, ip, port, message, delivery_status, identity, incoming in rows:
+        record = {
+            "id": row_id,
+            "timestamp": timestamp,
+            "ip": ip,
+            "port": port,
+            "message": message,
+            "delivery_status": delivery_status,
+            "identity": identity,
+            "incoming": incoming,
+        }
+        partitions.setdefault(timestamp[:7], []).append(json.dumps(record) + "\n")
+
+    for month, lines in partitions.items():
+        path = os.path.join(archive_dir, f"messages-{month}.jsonl.gz")
+        with gzip.open(path, "at", encoding="utf-8") as archive_file:
+            archive_file.writelines(lines)
+
+def apply_retention(db_path=DB_PATH, archive_dir=ARCHIVE_DIR, policies=None, batch_size=RETENTION_BATCH_SIZE, stop_event=None):
+    """
+    Move expired messages from the live database into the archive.
+    Works in bounded batches, each archived first and then deleted in its own
+    short transaction, so server threads are never locked out for long.
+
+    :return: Number of rows archived.
+    """
+    policies = RETENTION_POLICIES if policies is None else policies
+    if not policies:
+        return 0
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    archived = 0
+    archived_ips = set()
+    try:
+        if "*" in policies:
+            cursor.execute("SELECT DISTINCT ip FROM messages")
+            ips = [row[0] for row in cursor.fetchall()]
+        else:
+            ips = list({key.split(":")[0] for key in policies})
+
+        for ip in ips:
+            policy = resolve_policy(ip, policies)
+            if not policy:
+                continue
+            boundary = expiry_cursor(cursor, ip, policy)
+            if boundary is None:
+                continue
+
+            while not (stop_event and stop_event.is_set()):
+                cursor.execute(
+                    """
+                    SELECT id, timestamp, ip, port, message, delivery_status, identity, incoming
+                    FROM messages
+                    WHERE ip = ? AND (timestamp, id) < (?, ?)
+                    ORDER BY timestamp, id
+                    LIMIT ?
+                    """,
+                    (ip, boundary[0], boundary[1], batch_size)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                archive_rows(rows, archive_dir)
+                cursor.executemany("DELETE FROM messages WHERE id = ?", [(row[0],) for row in rows])
+                conn.commit()
+                archived += len(rows)
+                archived_ips.add(ip)
+    finally:
+        conn.close()
+
+    if archived_ips:
+        conversation_stats.rebuild_stats(db_path, archived_ips)
+        message_cache.invalidate(archived_ips)
+    return archived
+
+
+# Purging a conversation
+def purge_conversation(ip, db_path=DB_PATH, batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE_SECONDS,
+                       progress=None, stop_event=None):
+    """
+    Delete every message stored for an IP, in batches of batch_size rows,
+    each in its own short transaction with a pause after it, so message
+    writers are never locked out for long. Messages that arrive while the
+    purge runs are kept. The freed pages are handed back afterwards with
+    vacuum_incrementally.
+
+    :param progress: Called with (deleted, total) after each batch.
+    :param stop_event: Set it to stop after the current batch; the rows
+                       deleted so far stay deleted.
+    :return: Number of rows deleted.
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    deleted = 0
+    try:
+        cursor.execute("SELECT COUNT(*), MAX(id) FROM messages WHERE ip = ?", (ip,))
+        total, last_id = cursor.fetchone()
+        while last_id is not None and not (stop_event and stop_event.is_set()):
+            cursor.execute(
+                "DELETE FROM messages WHERE id IN (SELECT id FROM messages WHERE ip = ? AND id <= ? LIMIT ?)",
+                (ip, last_id, batch_size)
+            )
+            conn.commit()
+            if not cursor.rowcount:
+                break
+            deleted += cursor.rowcount
+            if progress:
+                progress(deleted, total)
+            time.sleep(pause)  # Let waiting writers in between batches
+    finally:
+        conn.close()
+
+    if deleted:
+        conversation_stats.rebuild_stats(db_path, [ip])  # Drops the summary, or recounts what was kept
+        message_cache.invalidate([ip])
+        vacuum_incrementally(db_path, stop_event=stop_event)
+    return deleted
+
+def vacuum_incrementally(db_path=DB_PATH, pages=1000, pause=PURGE_PAUSE_SECONDS, stop_event=None):
+    """
+    Hand free pages back to the file system, pages at a time, each step in
+    its own short transaction. Does nothing unless the database uses
+    incremental auto_vacuum (init_db switches it over; a full VACUUM here
+    would lock writers out for the whole rebuild).
+
+    :return: Pages freed.
+    """
+    conn = sqlite3.connect(db_path, timeout=1.0)
+    freed = 0
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:  # 2: INCREMENTAL
+            return 0
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        while free_pages and not (stop_event and stop_event.is_set()):
+            conn.executescript(f"PRAGMA incremental_vacuum({pages})")  # Steps to completion; execute() frees one page
+            remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if remaining >= free_pages:
+                break  # Nothing was freed; don't spin
+            freed += free_pages - remaining
+            free_pages = remaining
+            time.sleep(pause)
+    except sqlite3.OperationalError:
+        pass  # Busy; the next maintenance pass frees the rest
+    finally:
+        conn.close()
+    return freed
+
+
+# Archive search
+def search_archive(term=None, ip=None, start=None, end=None, archive_dir=ARCHIVE_DIR):
+    """
+    Search archived messages on demand, streaming one partition at a time.
+    Only partitions whose month overlaps the requested range are opened.
+
+    :param term: Case-insensitive substring to look for in the message text.
+    :param ip: Only return messages for this IP.
+    :param start: Earliest timestamp ("YYYY-MM-DD[ HH:MM:SS]"), inclusive.
+    :param end: Latest timestamp ("YYYY-MM-DD[ HH:MM:SS]"), inclusive.
+    :return: Generator of archived message dicts, oldest partition first.
+    """
+    term = term.lower() if term else None
+    seen_ids = set()  # A crash between archive and delete can archive a row twice
+
+    for path in sorted(glob.glob(os.path.join(archive_dir, "messages-*.jsonl.gz"))):
+        month = os.path.basename(path)[len("messages-"):len("messages-YYYY-MM")]
+        if (start and month < start[:7]) or (end and month > end[:7]):
+            continue
+
+        with gzip.open(path, "rt", encoding="utf-8") as archive_file:
+            for line in archive_file:
+                record = json.loads(line)
+                if record["id"] in seen_ids:
+                    continue
+                if ip and record["ip"] != ip:
+                    continue
+                if start and record["timestamp"] < start:
+                    continue
+                if end and record["timestamp"][:len(end)] > end:
+                    continue
+                if term and term not in record["message"].lower():
+                    continue
+                seen_ids.add(record["id"])
+                yield record
+
+
+# Background maintenance
+def run_maintenance(db_path=DB_PATH, archive_dir=ARCHIVE_DIR, log_callback=print, stop_event=None):
+    """
+    Run one maintenance pass: retention, incremental vacuum, statistics
+    refresh and a WAL checkpoint. Each step is cheap and bounded.
+    """
+    archived = apply_retention(db_path, archive_dir, stop_event=stop_event)
+    if archived:
+        log_callback(f"Maintenance archived {archived} expired messages.")
+
+    conn = sqlite3.connect(db_path, timeout=1.0)
+    try:
+        conn.executescript("PRAGMA incremental_vacuum(1000)")  # Free up to 1000 pages per pass
+        conn.execute("PRAGMA analysis_limit = 400")  # Keep ANALYZE bounded on large tables
+        conn.execute("ANALYZE")
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    except sqlite3.OperationalError as e:
+        # Busy databases are simply retried on the next idle period
+        log_callback(f"Maintenance skipped a step: {e}")
+    finally:
+        conn.close()
+
+def start_maintenance(log_callback=print, db_path=DB_PATH, archive_dir=ARCHIVE_DIR,
+                      interval=MAINTENANCE_INTERVAL, idle_seconds=MAINTENANCE_IDLE_SECONDS):
+    """
+    Start the background maintenance thread.
+    A pass runs at most every `interval` seconds, and only once no message
+    has been written for `idle_seconds`.
+    """
+    global maintenance_thread
+
+    def maintenance_loop():
+        last_run = 0.0
+        while not maintenance_stop_event.wait(1.0):
+            now = time.monotonic()
+            if now - last_run < interval or now - last_activity < idle_seconds:
+                continue
+            try:
+                run_maintenance(db_path, archive_dir, log_callback, maintenance_stop_event)
+            except Exception as e:
+                log_callback(f"Maintenance error: {e}")
+            last_run = time.monotonic()
+
+    if maintenance_thread and maintenance_thread.is_alive():
+        return
+
+    maintenance_stop_event.clear()
+    maintenance_thread = threading.Thread(target=maintenance_loop, daemon=True)
+    maintenance_thread.start()
+
+def stop_maintenance():
+    """Signal the maintenance thread to stop after its current batch."""
+    maintenance_stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply retention policies and search the message archive.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run one maintenance pass now.")
+    run_parser.add_argument("--db", default=DB_PATH, help="Path to the chat database.")
+    run_parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="Directory for archive partitions.")
+
+    purge_parser = subparsers.add_parser("purge", help="Delete every stored message for an IP, in batches.")
+    purge_parser.add_argument("ip", help="IP whose messages to delete.")
+    purge_parser.add_argument("--db", default=DB_PATH, help="Path to the chat database.")
+
+    search_parser = subparsers.add_parser("search", help="Search archived messages.")
+    search_parser.add_argument("term", nargs="?", help="Text to search for (case-insensitive).")
+    search_parser.add_argument("--ip", help="Only messages for this IP.")
+    search_parser.add_argument("--start", help="Earliest timestamp, e.g. 2024-01-31.")
+    search_parser.add_argument("--end", help="Latest timestamp, e.g. 2024-12-31.")
+    search_parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="Directory for archive partitions.")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run_maintenance(args.db, args.archive_dir)
+        print("Maintenance pass complete.")
+    elif args.command == "purge":
+        deleted = purge_conversation(args.ip, args.db, progress=lambda done, total: print(f"\rDeleted {done}/{total}", end=""))
+        print(f"\nDeleted {deleted} messages for {args.ip}.")
+    else:
+        for record in search_archive(args.term, args.ip, args.start, args.end, args.archive_dir):
+            print(f"[{record['timestamp']}] {record['ip']}:{record['port']}: {record['message']}")
+
+if __name__ == "__main__":
+    main()
@@ -1,196 +1,118 @@
-import numpy as np
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import wave
 
-def generate_notification_sounds():
-    """
-    Generate and save two different notification sounds:
-    1. A soft click for sent messages
-    2. A gentle chime for received messages
-    Both sounds remain gentle and non-intrusive
-    """
-    # Parameters for the sounds
-    sample_rate = 44100
-    duration = 0.1  # 100ms total duration
-    t = np.linspace(0, duration, int(sample_rate * duration), False)
-
-    # Generate sent sound (soft click)
-    click_duration = 0.02  # 20ms
-    click_samples = int(sample_rate * click_duration)
-    fade_in = np.linspace(0, 1, click_samples)
-    fade_out = np.exp(-t[:click_samples] * 200)
-    click = fade_in * fade_out * np.sin(2 * np.pi * 800 * t[:click_samples])
-   
-    sent_sound = np.zeros(int(sample_rate * duration))
-    sent_sound[:click_samples] = click * 0.75
-
-    # Generate received sound (gentle chime)
-    chime_freq1 = 1000  # Higher frequency for chime
-    chime_freq2 = 1700  # Second frequency for harmonics
-    fade_envelope = np.exp(-t * 40)  # Slower fade out for chime
-    
-    chime = (np.sin(2 * np.pi * chime_freq1 * t) * 0.6 +  # Main tone
-             np.sin(2 * np.pi * chime_freq2 * t) * 0.4)   # Harmonic
-    received_sound = chime * fade_envelope * 0.5  # Gentle volume
-
-    # Convert to 16-bit integers
-    sent_sound = (sent_sound * 32767).astype(np.int16)
-    received_sound = (received_sound * 32767).astype(np.int16)
-
-    # Save as WAV files
-    import wave
-    
-    # Save sent sound
-    with wave.open('sent.wav', 'w') as wav_file:
-        wav_file.setnchannels(1)  # Mono
-        wav_file.setsampwidth(2)  # 2 bytes per sample (16-bit)
-        wav_file.setframerate(sample_rate)
-        wav_file.writeframes(sent_sound.tobytes())
-        
-    # Save received sound
-    with wave.open('received.wav', 'w') as wav_file:
-        wav_file.setnchannels(1)  # Mono
-        wav_file.setsampwidth(2)  # 2 bytes per sample (16-bit)
-        wav_file.setframerate(sample_rate)
-        wav_file.writeframes(received_sound.tobytes())
+import sounds
 
-def generate_notification_sounds4():
-    """
-    Generate and save two different notification sounds:
-    1. A soft click for sent messages
-    2. A reversed soft click for received messages
-    Both sounds are very gentle and non-intrusive
-    """
-    # Parameters for the sounds
-    sample_rate = 44100
-    duration = 0.05  # 50ms total duration
-    t = np.linspace(0, duration, int(sample_rate * duration), False)
-    
-    # Generate sent sound (soft click)
-    click_duration = 0.02  # 20ms
-    click_samples = int(sample_rate * click_duration)
-    fade_in = np.linspace(0, 1, click_samples)
-    fade_out = np.exp(-t[:click_samples] * 200)
-    click = fade_in * fade_out * np.sin(2 * np.pi * 800 * t[:click_samples])
-   
-    sent_sound = np.zeros(int(sample_rate * duration))
-    sent_sound[:click_samples] = click * 0.75  # Increased amplitude to 75%
-    
-    # Generate received sound (reversed soft click with slight modification)
-    received_sound = np.zeros(int(sample_rate * duration))
-    reversed_click = np.flip(click) * 0.75  # Increased amplitude to 75%
-    received_sound[-click_samples:] = reversed_click  # Put it at the end of the duration
-    
-    # Convert to 16-bit integers
-    sent_sound = (sent_sound * 32767).astype(np.int16)
-    received_sound = (received_sound * 32767).astype(np.int16)
-    
-    # Save as WAV files
-    import wave
-    
-    # Save sent sound
-    with wave.open('sent.wav', 'w') as wav_file:
-        wav_file.setnchannels(1)  # Mono
-        wav_file.setsampwidth(2)  # 2 bytes per sample (16-bit)
-        wav_file.setframerate(sample_rate)
-        wav_file.writeframes(sent_sound.tobytes())
-        
-    # Save received sound
-    with wave.open('received.wav', 'w') as wav_file:
-        wav_file.setnchannels(1)  # Mono
-        wav_file.setsampwidth(2)  # 2 bytes per sample (16-bit)
-        wav_file.setframerate(sample_rate)
-        wav_file.writeframes(received_sound.tobytes())
 
-def generate_notification_sounds3():
-    """
-    Generate and save two different notification sounds:
-    1. A soft click for sent messages
-    2. A reversed soft click for received messages
-    Both sounds are very gentle and non-intrusive
-    """
-    # Parameters for the sounds
-    sample_rate = 44100
-    duration = 0.05  # 50ms total duration
-    t = np.linspace(0, duration, int(sample_rate * duration), False)
-
-    # Generate sent sound (soft click)
-    click_duration = 0.02  # 20ms
-    click_samples = int(sample_rate * click_duration)
-    fade_in = np.linspace(0, 1, click_samples)
-    fade_out = np.exp(-t[:click_samples] * 200)
-    click = fade_in * fade_out * np.sin(2 * np.pi * 800 * t[:click_samples])
-    
-    sent_sound = np.zeros(int(sample_rate * duration))
-    sent_sound[:click_samples] = click * 0.25  # Reduce amplitude to 25%
-
-    # Generate received sound (reversed soft click with slight modification)
-    received_sound = np.zeros(int(sample_rate * duration))
-    reversed_click = np.flip(click) * 0.25  # Reverse the click and keep same amplitude
-    received_sound[-click_samples:] = reversed_click  # Put it at the end of the duration
-
-    # Convert to 16-bit integers
-    sent_sound = (sent_sound * 32767).astype(np.int16)
-    received_sound = (received_sound * 32767).astype(np.int16)
-
-    # Save as WAV files
-    import wave
-
-    # Save sent sound
-    with wave.open('sent.wav', 'w') as wav_file:
-        wav_file.setnchannels(1)  # Mono
-        wav_file.setsampwidth(2)  # 2 bytes per sample (16-bit)
-        wav_file.setframerate(sample_rate)
-        wav_file.writeframes(sent_sound.tobytes())
+PACK_DIR = "sound_packs"
 
-    # Save received sound
-    with wave.open('received.wav', 'w') as wav_file:
-        wav_file.setnchannels(1)  # Mono
-        wav_file.setsampwidth(2)  # 2 bytes per sample (16-bit)
-        wav_file.setframerate(sample_rate)
-        wav_file.writeframes(received_sound.tobytes())
+# Received-chime variants step through two octaves of the pentatonic scale,
+# then move to a brighter harmonic for the next round of notes
+VARIANT_OCTAVES = 2
+VARIANT_HARMONICS = (1.5, 1.7, 2.0, 2.5, 3.0, 3.5, 4.0, 5.0, 6.0, 8.0)
 
-def generate_notification_sounds2():
+
+def pack_specs(preset="chime", variants=0, sample_rates=(sounds.SAMPLE_RATE,), volume=1.0):
     """
-    Generate and save two different notification sounds:
-    1. A soft click for sent messages
-    2. A gentle ding for received messages
+    Describe every sound of a pack as (file name, render() parameters).
+
+    :param preset: Name in sounds.PRESETS for the sent and received sounds.
+    :param variants: Extra received chimes, each a different note or timbre.
+    :param sample_rates: Render every sound once per rate; the rate is added
+                         to the file names when there is more than one.
+    :param volume: Scales every sound's amplitude.
     """
-    # Parameters for the sounds
-    sample_rate = 44100
-    duration = 0.1  # 100ms
-    t = np.linspace(0, duration, int(sample_rate * duration), False)
-
-    # Generate sent sound (soft click)
-    sent_sound = np.zeros(int(sample_rate * duration))
-    click_duration = 0.02  # 20ms
-    click_samples = int(sample_rate * click_duration)
-    click = np.exp(-t[:click_samples] * 200) * np.sin(2 * np.pi * 1000 * t[:click_samples])
-    sent_sound[:click_samples] = click * 0.3  # Reduce amplitude to 30%
-
-    # Generate received sound (gentle ding)
-    received_freq = 1000  # 1kHz
-    fade = np.exp(-t * 20)  # Exponential decay
-    ding = np.sin(2 * np.pi * received_freq * t) * fade
-    received_sound = ding * 0.3  # Reduce amplitude to 30%
-
-    # Convert to 16-bit integers
-    sent_sound = (sent_sound * 32767).astype(np.int16)
-    received_sound = (received_sound * 32767).astype(np.int16)
-
-    # Save as WAV files
-    import wave
-
-    # Save sent sound
-    with wave.open('sent.wav', 'w') as wav_file:
+    base = [("sent", sounds.PRESETS[preset]["sent"]), ("received", sounds.PRESETS[preset]["received"])]
+    chime = sounds.PRESETS["chime"]["received"]
+    notes = VARIANT_OCTAVES * len(sounds.PENTATONIC_STEPS)
+    for index, frequency in enumerate(sounds.scale_frequencies(variants, octaves=VARIANT_OCTAVES)):
+        harmonic = VARIANT_HARMONICS[(index // notes) % len(VARIANT_HARMONICS)]
+        base.append((f"variant-{index:03d}", dict(chime, frequency=round(float(frequency), 3), harmonic=harmonic)))
+
+    specs = []
+    for rate in sample_rates:
+        suffix = f"-{rate}" if len(sample_rates) > 1 else ""
+        for name, params in base:
+            amplitude = params.get("amplitude", 0.5) * volume
+            specs.append((f"{name}{suffix}.wav", dict(params, sample_rate=rate, amplitude=amplitude)))
+    return specs
+
+def pack_key(specs):
+    """Short hash of everything that decides a pack's contents."""
+    encoded = json.dumps({"synth_version": sounds.SYNTH_VERSION, "sounds": specs}, sort_keys=True)
+    return hashlib.sha256(encoded.encode()).hexdigest()[:12]
+
+def write_wav(path, pcm, sample_rate):
+    with wave.open(path, "w") as wav_file:
         wav_file.setnchannels(1)  # Mono
         wav_file.setsampwidth(2)  # 2 bytes per sample (16-bit)
         wav_file.setframerate(sample_rate)
-        wav_file.writeframes(sent_sound.tobytes())
+        wav_file.writeframes(pcm.tobytes())
 
-    # Save received sound
-    with wave.open('received.wav', 'w') as wav_file:
-        wav_file.setnchannels(1)  # Mono
-        wav_file.setsampwidth(2)  # 2 bytes per sample (16-bit)
-        wav_file.setframerate(sample_rate)
-        wav_file.writeframes(received_sound.tobytes())
+def build_pack(preset="chime", variants=0, sample_rates=(sounds.SAMPLE_RATE,), volume=1.0, output_dir=PACK_DIR,
+               force=False):
+    """
+    Render a sound pack into output_dir/<preset>-<hash>/ unless that pack
+    already exists. Every sound is rendered in one NumPy batch, and the pack
+    is written to a temporary directory and renamed into place, so a pack
+    directory is always complete.
 
-generate_notification_sounds()
+    :param force: Rebuild even if the pack already exists.
+    :return: (pack directory, True if it was written or False if it was current).
+    """
+    specs = pack_specs(preset, variants, sample_rates, volume)
+    pack_dir = os.path.join(output_dir, f"{preset}-{pack_key(specs)}")
+    manifest_path = os.path.join(pack_dir, "pack.json")
+    if os.path.exists(manifest_path) and not force:
+        return pack_dir, False
+
+    samples, lengths = sounds.render_specs([params for _, params in specs])
+    pcm = sounds.to_pcm(samples)
+
+    os.makedirs(output_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".pack-", dir=output_dir)
+    try:
+        for (name, params), row, length in zip(specs, pcm, lengths):
+            write_wav(os.path.join(staging, name), row[:length], params["sample_rate"])
+        manifest = {"preset": preset, "synth_version": sounds.SYNTH_VERSION,
+                    "sounds": {name: params for name, params in specs}}
+        with open(os.path.join(staging, "pack.json"), "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        if os.path.exists(pack_dir):
+            shutil.rmtree(pack_dir)
+        os.replace(staging, pack_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return pack_dir, True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render notification sound packs as WAV files.")
+    parser.add_argument("-p", "--preset", default="chime", choices=sorted(sounds.PRESETS),
+                        help="Sent and received sounds to start from.")
+    parser.add_argument("-n", "--variants", type=int, default=0, help="Extra received-chime variants in the pack.")
+    parser.add_argument("-r", "--sample-rates", default=str(sounds.SAMPLE_RATE),
+                        help="Comma-separated sample rates; each sound is rendered at every rate.")
+    parser.add_argument("--volume", type=float, default=1.0, help="Scale every sound's amplitude.")
+    parser.add_argument("-o", "--output", default=PACK_DIR, help="Directory packs are written to.")
+    parser.add_argument("--force", action="store_true", help="Rebuild the pack even if it is current.")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    sample_rates = [int(rate) for rate in args.sample_rates.split(",")]
+    pack_dir, built = build_pack(args.preset, args.variants, sample_rates, args.volume, args.output, args.force)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if built:
+        print(f"Wrote sound pack '{pack_dir}' in {elapsed_ms:.1f} ms.")
+    else:
+        print(f"Sound pack '{pack_dir}' is current; nothing written.")
+
+if __name__ == "__main__":
+    main()
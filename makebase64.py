@@ -1,43 +1,243 @@
 import argparse
 import base64
+import binascii
+import mmap
+import multiprocessing
 import os
 import sys
 
-def convert_to_base64(input_file, output_file):
+CHUNK_SIZE = 3 * 1024 * 1024  # Input bytes encoded per step; a multiple of 3 so chunks need no padding
+WHITESPACE = b" \t\r\n"
+
+
+# Streaming codec, usable on any iterable of byte chunks (file reads, socket
+# receives) with chunks of any size
+def encode_stream(chunks):
+    """
+    Base64-encode a stream of byte chunks. Bytes that do not fill a 3-byte
+    group are carried into the next chunk, so the joined output equals
+    base64.b64encode of the joined input.
+
+    :return: Generator of encoded chunks.
+    """
+    carry = b""
+    for chunk in chunks:
+        data = carry + chunk if carry else chunk
+        cut = len(data) - len(data) % 3
+        carry = bytes(data[cut:])
+        if cut:
+            yield base64.b64encode(data[:cut])
+    if carry:
+        yield base64.b64encode(carry)
+
+def decode_stream(chunks):
+    """
+    Decode a stream of Base64 chunks. Whitespace (such as line breaks of
+    wrapped input) is ignored, and characters that do not fill a 4-character
+    group are carried into the next chunk.
+
+    :return: Generator of decoded chunks.
+    :raises binascii.Error: On invalid or truncated input.
+    """
+    carry = b""
+    for chunk in chunks:
+        data = carry + bytes(chunk).translate(None, WHITESPACE)
+        cut = len(data) - len(data) % 4
+        carry = data[cut:]
+        if cut:
+            yield base64.b64decode(data[:cut], validate=True)
+    if carry:
+        raise binascii.Error(f"Truncated Base64 input: {len(carry)} trailing characters")
+
+def mapped_chunks(data, chunk_size=CHUNK_SIZE, start=0, end=None):
+    """
+    Slice a bytes-like object (such as an mmap) into chunks, copying one
+    chunk at a time. Pages of an mmap are handed back once consumed, so
+    resident memory stays around one chunk however large the file is.
+    """
+    end = len(data) if end is None else end
+    release = isinstance(data, mmap.mmap) and hasattr(mmap, "MADV_DONTNEED")
+    released = start - start % mmap.PAGESIZE
+    for offset in range(start, end, chunk_size):
+        stop = min(offset + chunk_size, end)
+        yield data[offset:stop]
+        if release:
+            done = stop - stop % mmap.PAGESIZE
+            if done > released:
+                data.madvise(mmap.MADV_DONTNEED, released, done - released)
+                released = done
+
+
+# Files
+def open_mapped(path):
+    """
+    Map a file read-only. Empty files cannot be mapped, so they come back as b"".
+
+    :return: (file object, mmap or b"").
+    """
+    infile = open(path, "rb")
+    if os.fstat(infile.fileno()).st_size == 0:
+        return infile, b""
+    data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, "MADV_SEQUENTIAL"):
+        data.madvise(mmap.MADV_SEQUENTIAL)  # Read ahead aggressively
+    return infile, data
+
+def encode_file(input_file, output_file, chunk_size=CHUNK_SIZE, processes=1):
+    """
+    Base64-encode a file with constant memory: the input is mapped and
+    encoded a chunk at a time. With processes > 1, 3-byte-aligned slices of
+    the input are encoded in parallel and written at their final offsets.
+
+    :param chunk_size: Input bytes per step; rounded down to a multiple of 3.
+    :param processes: Worker processes for large inputs.
+    :return: Bytes written.
+    """
+    chunk_size = max(3, chunk_size - chunk_size % 3)
+    size = os.path.getsize(input_file)
+    encoded_size = (size + 2) // 3 * 4
+    if processes > 1 and size > chunk_size:
+        slice_size = -(-size // processes)
+        slice_size += -slice_size % 3  # Every slice but the last must be 3-byte aligned
+        ranges = [(start, min(start + slice_size, size)) for start in range(0, size, slice_size)]
+        with open(output_file, "wb") as outfile:
+            outfile.truncate(encoded_size)
+        with multiprocessing.Pool(min(processes, len(ranges))) as pool:
+            pool.starmap(encode_range, [(input_file, output_file, start, end, chunk_size) for start, end in ranges])
+        return encoded_size
+
+    infile, data = open_mapped(input_file)
+    try:
+        with open(output_file, "wb") as outfile:
+            for encoded in encode_stream(mapped_chunks(data, chunk_size)):
+                outfile.write(encoded)
+    finally:
+        if data:
+            data.close()
+        infile.close()
+    return encoded_size
+
+def encode_range(input_file, output_file, start, end, chunk_size=CHUNK_SIZE):
+    """Worker: encode input bytes [start, end) into their place in the output file."""
+    infile, data = open_mapped(input_file)
+    out_fd = os.open(output_file, os.O_WRONLY)
+    try:
+        position = start // 3 * 4
+        for encoded in encode_stream(mapped_chunks(data, chunk_size, start, end)):
+            os.pwrite(out_fd, encoded, position)
+            position += len(encoded)
+    finally:
+        os.close(out_fd)
+        data.close()
+        infile.close()
+
+def decode_file(input_file, output_file, chunk_size=CHUNK_SIZE, processes=1):
+    """
+    Decode a Base64 file with constant memory. With processes > 1 the input
+    must be unwrapped (no whitespace except at the very end, as encode_file
+    writes it), since slices are decoded straight to their final offsets.
+
+    :return: Bytes written.
+    :raises binascii.Error: On invalid input.
+    """
+    chunk_size = max(4, chunk_size - chunk_size % 4)
+    infile, data = open_mapped(input_file)
+    try:
+        end = len(data)
+        while end and data[end - 1] in WHITESPACE:
+            end -= 1
+        if processes > 1 and end > chunk_size:
+            if end % 4:
+                raise binascii.Error("Parallel decoding needs unwrapped input; decode it with one process")
+            padding = data[end - 2:end].count(b"=")
+            decoded_size = end // 4 * 3 - padding
+            slice_size = -(-end // processes)
+            slice_size += -slice_size % 4
+            ranges = [(start, min(start + slice_size, end)) for start in range(0, end, slice_size)]
+            with open(output_file, "wb") as outfile:
+                outfile.truncate(decoded_size)
+            with multiprocessing.Pool(min(processes, len(ranges))) as pool:
+                pool.starmap(decode_range, [(input_file, output_file, start, stop, chunk_size) for start, stop in ranges])
+            return decoded_size
+
+        written = 0
+        with open(output_file, "wb") as outfile:
+            for decoded in decode_stream(mapped_chunks(data, chunk_size, 0, end)):
+                outfile.write(decoded)
+                written += len(decoded)
+        return written
+    finally:
+        if data:
+            data.close()
+        infile.close()
+
+def decode_range(input_file, output_file, start, end, chunk_size=CHUNK_SIZE):
+    """Worker: decode input characters [start, end) into their place in the output file."""
+    infile, data = open_mapped(input_file)
+    out_fd = os.open(output_file, os.O_WRONLY)
+    try:
+        position = start // 4 * 3
+        for chunk in mapped_chunks(data, chunk_size, start, end):
+            if len(chunk.translate(None, WHITESPACE)) != len(chunk):
+                raise binascii.Error("Parallel decoding needs unwrapped input; decode it with one process")
+            decoded = base64.b64decode(chunk, validate=True)
+            os.pwrite(out_fd, decoded, position)
+            position += len(decoded)
+    finally:
+        os.close(out_fd)
+        data.close()
+        infile.close()
+
+
+def convert_to_base64(input_file, output_file, processes=1):
     """
     Converts a binary file to a Base64-encoded file.
 
     :param input_file: Path to the input binary file.
     :param output_file: Path to the output Base64 file.
+    :param processes: Worker processes to split large files across.
     """
     try:
-        # Read the binary data
-        with open(input_file, "rb") as infile:
-            binary_data = infile.read()
+        encode_file(input_file, output_file, processes=processes)
+        print(f"Successfully converted '{input_file}' to Base64 and saved it as '{output_file}'.")
+    except FileNotFoundError:
+        print(f"Error: The file '{input_file}' does not exist.")
+    except PermissionError:
+        print(f"Error: Permission denied while accessing '{input_file}' or '{output_file}'.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
 
-        # Encode to Base64
-        base64_data = base64.b64encode(binary_data)
+def convert_from_base64(input_file, output_file, processes=1):
+    """
+    Converts a Base64-encoded file back to binary.
 
-        # Write the Base64 data to the output file
-        with open(output_file, "wb") as outfile:
-            outfile.write(base64_data)
-        
-        print(f"Successfully converted '{input_file}' to Base64 and saved it as '{output_file}'.")
+    :param input_file: Path to the input Base64 file.
+    :param output_file: Path to the output binary file.
+    :param processes: Worker processes to split large files across.
+    """
+    try:
+        decode_file(input_file, output_file, processes=processes)
+        print(f"Successfully decoded '{input_file}' from Base64 and saved it as '{output_file}'.")
     except FileNotFoundError:
         print(f"Error: The file '{input_file}' does not exist.")
     except PermissionError:
         print(f"Error: Permission denied while accessing '{input_file}' or '{output_file}'.")
+    except binascii.Error as e:
+        print(f"Error: '{input_file}' is not valid Base64: {e}")
     except Exception as e:
         print(f"An error occurred: {e}")
 
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(
-        description="Convert a binary file to a Base64-encoded file.",
-        usage="python makebase64file.py -i <input_file> -o <output_file>"
+        description="Convert a binary file to a Base64-encoded file, or back with --decode.",
+        usage="python makebase64.py [-d] [-j N] -i <input_file> -o <output_file>"
     )
-    parser.add_argument("-i", "--input", required=True, help="Path to the input binary file.")
-    parser.add_argument("-o", "--output", required=True, help="Path to the output Base64 file.")
+    parser.add_argument("-i", "--input", required=True, help="Path to the input file.")
+    parser.add_argument("-o", "--output", required=True, help="Path to the output file.")
+    parser.add_argument("-d", "--decode", action="store_true", help="Decode Base64 input back to binary.")
+    parser.add_argument("-j", "--processes", type=int, default=1,
+                        help="Split large files across this many processes (0 = one per core).")
 
     # Parse arguments
     args = parser.parse_args()
@@ -48,7 +248,11 @@ def main():
         sys.exit(1)
 
     # Call the conversion function
-    convert_to_base64(args.input, args.output)
+    processes = args.processes or os.cpu_count() or 1
+    if args.decode:
+        convert_from_base64(args.input, args.output, processes)
+    else:
+        convert_to_base64(args.input, args.output, processes)
 
 if __name__ == "__main__":
     main()
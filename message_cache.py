@@ -0,0 +1,210 @@
+import threading
+from bisect import bisect_left
+from collections import OrderedDict, deque
+
+import metrics
+from config import RECENT_CACHE_MAX_BYTES, RECENT_CACHE_PER_CONVERSATION
+
+
+ALL_MESSAGES = "All Messages"
+
+# Rough per-row overhead of a cached row tuple and its strings, in bytes
+ROW_OVERHEAD = 250
+
+
+class RecentMessages:
+    """
+    Ring buffer of the newest messages of one conversation.
+    Rows are stored as the same (id, timestamp, ip, port, message,
+    delivery_status, identity, incoming) tuples fetch_history_page returns,
+    ordered by (timestamp, id), and always form an unbroken run up to the
+    newest stored message.
+    """
+    __slots__ = ("rows", "size", "complete", "writes")
+
+    def __init__(self, maxlen):
+        self.rows = deque(maxlen=maxlen)
+        self.size = 0           # Approximate bytes held
+        self.complete = False   # True when rows hold the conversation's entire history
+        self.writes = 0         # Bumped on every append, to detect racing fills
+
+
+# Conversation key (IP or ALL_MESSAGES) -> RecentMessages, least recently used first
+recent_messages = OrderedDict()
+cache_lock = threading.Lock()
+cache_size = 0
+cache_counters = {"hits": 0, "misses": 0, "evictions": 0}
+# Conversation key -> id of the newest row known to be stored in it. Kept
+# apart from the rings so eviction doesn't lose it; a missing key means unknown.
+newest_ids = {}
+
+
+def conversation_key(selected_ip_port):
+    """Map a connection ("ip:port") or "All Messages" to its cache key."""
+    if selected_ip_port == ALL_MESSAGES:
+        return ALL_MESSAGES
+    return selected_ip_port.split(":")[0]
+
+def row_size(row):
+    return ROW_OVERHEAD + len(row[4])
+
+def cursor_of(row):
+    return (row[1], row[0])
+
+def evict(max_bytes=RECENT_CACHE_MAX_BYTES):
+    """Drop whole least recently used conversations until under the byte budget."""
+    global cache_size
+    while cache_size > max_bytes and recent_messages:
+        _, ring = recent_messages.popitem(last=False)
+        cache_size -= ring.size
+        cache_counters["evictions"] += 1
+
+def add_to_ring(key, row):
+    """
+    Add one row to a conversation's ring, keeping it a contiguous suffix.
+    Rows are usually the newest and are appended; one with an earlier
+    timestamp (stored late, or after a clock change) is inserted in order.
+    """
+    global cache_size
+    ring = recent_messages.get(key)
+    if ring is None:
+        # A just-written row is by itself the newest run of its conversation
+        ring = recent_messages[key] = RecentMessages(RECENT_CACHE_PER_CONVERSATION)
+    position = len(ring.rows)
+    if ring.rows and cursor_of(row) <= cursor_of(ring.rows[-1]):
+        position = bisect_left([cursor_of(cached) for cached in ring.rows], cursor_of(row))
+        if position < len(ring.rows) and ring.rows[position][0] == row[0]:
+            return  # Already seeded from the database
+        if position == 0 and not ring.complete:
+            return  # Older than the run the ring holds, which stays unbroken without it
+
+    if len(ring.rows) == ring.rows.maxlen:
+        ring.complete = False
+        if position == 0:
+            return  # Older than every row of a full ring
+        dropped = row_size(ring.rows.popleft())
+        ring.size -= dropped
+        cache_size -= dropped
+        position -= 1
+    ring.rows.insert(position, row)
+    ring.size += row_size(row)
+    ring.writes += 1
+    cache_size += row_size(row)
+    recent_messages.move_to_end(key)
+
+def add(row):
+    """
+    Record a message that was just committed to the database.
+    Called from the write path with the row's new id.
+    """
+    with cache_lock:
+        for key in (row[2], ALL_MESSAGES):
+            add_to_ring(key, row)
+            newest_ids[key] = max(newest_ids.get(key, 0), row[0])
+        evict()
+
+def newest_id(selected_ip_port):
+    """Id of the newest row stored in a conversation, or None if not known."""
+    with cache_lock:
+        return newest_ids.get(conversation_key(selected_ip_port))
+
+def note_newest(selected_ip_port, row_id):
+    """
+    Record the newest id a query found in a conversation. Rows committed
+    meanwhile are recorded by add() afterwards, so taking the maximum is safe.
+    """
+    key = conversation_key(selected_ip_port)
+    with cache_lock:
+        newest_ids[key] = max(newest_ids.get(key, 0), row_id)
+
+def get_page(selected_ip_port, before=None, limit=100):
+    """
+    Serve a history page from the cache if it holds every row of the page.
+
+    :return: List of rows, oldest first, or None on a miss.
+    """
+    key = conversation_key(selected_ip_port)
+    with cache_lock:
+        ring = recent_messages.get(key)
+        rows = None
+        if ring is not None and ring.rows:
+            cursors = [cursor_of(row) for row in ring.rows]
+            end = len(cursors) if before is None else bisect_left(cursors, before)
+            if end >= limit or ring.complete:
+                rows = list(ring.rows)[max(0, end - limit):end]
+
+        if rows is None:
+            cache_counters["misses"] += 1
+            return None
+        cache_counters["hits"] += 1
+        recent_messages.move_to_end(key)
+        return rows
+
+def fill_token(selected_ip_port):
+    """Capture a conversation's write count before querying SQLite for a fill."""
+    with cache_lock:
+        ring = recent_messages.get(conversation_key(selected_ip_port))
+        return ring.writes if ring else 0
+
+def fill(selected_ip_port, rows, limit, token):
+    """
+    Seed a conversation's ring from the newest page read from SQLite.
+    Skipped if messages were written to it since fill_token(), because the
+    page may already be missing the newest of them.
+    """
+    global cache_size
+    key = conversation_key(selected_ip_port)
+    with cache_lock:
+        ring = recent_messages.get(key)
+        if (ring.writes if ring else 0) != token:
+            return
+        if ring is not None:
+            cache_size -= ring.size
+
+        ring = RecentMessages(RECENT_CACHE_PER_CONVERSATION)
+        ring.rows.extend(rows[-RECENT_CACHE_PER_CONVERSATION:])
+        ring.size = sum(row_size(row) for row in ring.rows)
+        ring.complete = len(rows) < limit and len(ring.rows) == len(rows)
+        ring.writes = token
+        recent_messages[key] = ring
+        recent_messages.move_to_end(key)
+        cache_size += ring.size
+        evict()
+
+def invalidate(ips=None):
+    """
+    Forget cached rows after messages were deleted outside the write path.
+    The combined "All Messages" ring is always dropped as well.
+
+    :param ips: IPs whose conversations changed, or None to clear everything.
+    """
+    global cache_size
+    with cache_lock:
+        if ips is None:
+            keys = list(recent_messages)
+            newest_ids.clear()
+        else:
+            keys = [*ips, ALL_MESSAGES]
+        for key in keys:
+            newest_ids.pop(key, None)  # Deleting the newest rows lets SQLite hand their ids out again
+            ring = recent_messages.pop(key, None)
+            if ring is not None:
+                cache_size -= ring.size
+
+def cache_stats():
+    """Hit/miss/eviction counters plus current size, for diagnostics."""
+    with cache_lock:
+        lookups = cache_counters["hits"] + cache_counters["misses"]
+        return {
+            **cache_counters,
+            "hit_rate": cache_counters["hits"] / lookups if lookups else 0.0,
+            "conversations": len(recent_messages),
+            "messages": sum(len(ring.rows) for ring in recent_messages.values()),
+            "bytes": cache_size,
+        }
+
+
+metrics.gauge("recent_cache_hit_rate", "Share of history pages served from the recent-message cache",
+              function=lambda: cache_stats()["hit_rate"])
+metrics.gauge("recent_cache_bytes", "Approximate memory held by the recent-message cache",
+              function=lambda: cache_size)
@@ -0,0 +1,217 @@
+import json
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Default histogram buckets, in seconds (100us .. 5s)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Counter:
+    """
+    Monotonically increasing count.
+    Updates take no lock: under the GIL a lost increment is possible but
+    rare, which is an acceptable trade for a sub-microsecond hot path.
+    """
+    __slots__ = ("name", "help", "value")
+    kind = "counter"
+
+    def __init__(self, name, help_text=""):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    """
+    Value that goes up and down, either set directly or read from a function
+    when the metrics are rendered (for values owned by other modules).
+    """
+    __slots__ = ("name", "help", "value", "function")
+    kind = "gauge"
+
+    def __init__(self, name, help_text="", function=None):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self.function = function
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def snapshot(self):
+        return self.function() if self.function else self.value
+
+
+class Histogram:
+    """Distribution of observed values over fixed buckets, plus sum and count."""
+    __slots__ = ("name", "help", "buckets", "counts", "sum", "count")
+    kind = "histogram"
+
+    def __init__(self, name, help_text="", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket that holds it."""
+        if not self.count:
+            return None
+        target = q * self.count
+        running = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            running += bucket_count
+            if running >= target:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+# Registry of every metric, by name
+registry = {}
+registry_lock = threading.Lock()
+
+# Local stats endpoint, if started
+stats_server = None
+
+
+def get_or_create(cls, name, help_text, **kwargs):
+    with registry_lock:
+        metric = registry.get(name)
+        if metric is None:
+            metric = registry[name] = cls(name, help_text, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric '{name}' is already registered as a {metric.kind}.")
+        return metric
+
+def counter(name, help_text=""):
+    """Return the counter called name, creating it on first use."""
+    return get_or_create(Counter, name, help_text)
+
+def gauge(name, help_text="", function=None):
+    """Return the gauge called name, creating it on first use."""
+    return get_or_create(Gauge, name, help_text, function=function)
+
+def histogram(name, help_text="", buckets=DEFAULT_BUCKETS):
+    """Return the histogram called name, creating it on first use."""
+    return get_or_create(Histogram, name, help_text, buckets=buckets)
+
+def snapshot():
+    """Current value of every metric as a JSON-friendly dict."""
+    with registry_lock:
+        metrics = list(registry.values())
+    return {metric.name: metric.snapshot() for metric in metrics}
+
+def render_prometheus():
+    """Render every metric in the Prometheus text exposition format."""
+    with registry_lock:
+        metrics = sorted(registry.values(), key=lambda metric: metric.name)
+
+    lines = []
+    for metric in metrics:
+        name = f"pychatter_{metric.name}"
+        if metric.help:
+            lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        if metric.kind == "histogram":
+            running = 0
+            for bound, bucket_count in zip(metric.buckets, metric.counts):
+                running += bucket_count
+                lines.append(f'{name}_bucket{{le="{bound}"}} {running}')
+            lines.append(f'{name}_bucket{{le="+Inf"}} {metric.count}')
+            lines.append(f"{name}_sum {metric.sum}")
+            lines.append(f"{name}_count {metric.count}")
+        else:
+            lines.append(f"{name} {metric.snapshot()}")
+    return "\n".join(lines) + "\n"
+
+def format_snapshot(values=None):
+    """Human-readable multi-line summary, used by the GUI stats window."""
+    values = snapshot() if values is None else values
+    lines = []
+    for name in sorted(values):
+        value = values[name]
+        if isinstance(value, dict):
+            if value["count"]:
+                lines.append(
+                    f"{name}: n={value['count']}  mean={value['mean'] * 1000:.3f}ms  "
+                    f"p50<={value['p50'] * 1000:.3f}ms  p95<={value['p95'] * 1000:.3f}ms  p99<={value['p99'] * 1000:.3f}ms"
+                )
+            else:
+                lines.append(f"{name}: n=0")
+        elif isinstance(value, float):
+            lines.append(f"{name}: {value:.3f}")
+        else:
+            lines.append(f"{name}: {value}")
+    return "\n".join(lines)
+
+
+class StatsRequestHandler(BaseHTTPRequestHandler):
+    """Serves /metrics (Prometheus text) and / or /stats (JSON)."""
+
+    def do_GET(self):
+        if self.path.startswith("/metrics"):
+            body = render_prometheus().encode()
+            content_type = "text/plain; version=0.0.4"
+        elif self.path in ("/", "/stats", "/stats.json"):
+            body = json.dumps(snapshot(), indent=2, default=str).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the console
+
+def start_stats_server(port, host="127.0.0.1"):
+    """
+    Serve the metrics over HTTP on localhost in a background thread.
+    Returns the server so callers can shut it down.
+    """
+    global stats_server
+    if stats_server is None:
+        stats_server = ThreadingHTTPServer((host, port), StatsRequestHandler)
+        threading.Thread(target=stats_server.serve_forever, daemon=True).start()
+    return stats_server
+
+def stop_stats_server():
+    global stats_server
+    if stats_server is not None:
+        stats_server.shutdown()
+        stats_server.server_close()
+        stats_server = None
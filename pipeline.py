@@ -0,0 +1,274 @@
+import queue
+import re
+import threading
+import time
+import weakref
+
+import metrics
+from config import PIPELINE_BATCH_SIZE, PIPELINE_QUEUE_SIZE, PIPELINE_WORKERS
+from priority import PriorityLanes
+
+
+STAGES = ("decode", "filter", "enrich", "persist", "notify", "render")
+
+URL_PATTERN = re.compile(r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+")
+
+STOP = object()  # Queue sentinel telling a worker to exit
+
+
+class ChatMessage:
+    """
+    One message travelling through the pipeline. Plugins read and set
+    fields instead of parsing formatted log lines.
+    """
+    __slots__ = ("timestamp", "ip", "port", "raw", "text", "incoming", "delivery_status", "identity", "id",
+                 "links", "alerts", "priority")
+
+    def __init__(self, timestamp, ip, port, raw=b"", text=None, incoming=True, delivery_status="success", identity="",
+                 priority="interactive"):
+        self.timestamp = timestamp
+        self.ip = ip
+        self.port = port
+        self.raw = raw                  # Bytes as received; decode fills text
+        self.text = text
+        self.incoming = incoming
+        self.delivery_status = delivery_status
+        self.identity = identity        # Name of the identity (listener) that received it
+        self.id = None                  # Row id, set by persist
+        self.links = []                 # URLs in the text, set by extract_links
+        self.alerts = []                # Matched alert keywords
+        self.priority = priority        # Traffic class (see priority.py), decides its lane in every stage
+
+    def format(self):
+        """The line the log view shows for this message."""
+        identity = f" [{self.identity}]" if self.identity else ""
+        return f"[{self.timestamp}]{identity} {self.ip}:{self.port}: {self.text}"
+
+
+# Every running pipeline, so queue gauges cover all nodes in the process
+active_pipelines = weakref.WeakSet()
+
+stage_seconds = {
+    stage: metrics.histogram(f"pipeline_{stage}_seconds", f"Time one message spends in the {stage} stage's plugins")
+    for stage in STAGES
+}
+dropped_messages = metrics.counter("pipeline_dropped_total", "Messages dropped by a filter, a plugin error or a full lossy stage")
+for _stage in STAGES:
+    metrics.gauge(f"pipeline_{_stage}_queue", f"Messages waiting for the {_stage} stage",
+                  function=lambda stage=_stage: sum(p.queues[stage].qsize() for p in list(active_pipelines)))
+
+
+class Pipeline:
+    """
+    Staged processing for incoming messages: decode -> filter -> enrich ->
+    persist -> notify -> render. Each stage has its own queue and worker
+    threads and runs its registered plugins in order; stages without plugins
+    are skipped. A plugin is called with the ChatMessage and may return False
+    to drop it. Stages configured with 0 workers are run by their owner
+    through drain(), which is how the GUI renders on the Tk thread.
+
+    Every stage queue is a PriorityLanes, so a large message in the bulk
+    lane does not hold up interactive ones queued behind it.
+
+    Plugins registered with batch=True are called with a list of messages
+    instead: a worker of their stage takes whatever is waiting (up to
+    batch_size) in one go, which lets persist store a burst in one
+    transaction.
+    """
+
+    def __init__(self, workers=None, queue_size=PIPELINE_QUEUE_SIZE, log_callback=print, lossy=("render",),
+                 batch_size=PIPELINE_BATCH_SIZE):
+        """
+        :param workers: Stage -> worker thread count; defaults to PIPELINE_WORKERS.
+        :param queue_size: Messages each stage may hold (over all lanes) before submitters block.
+        :param log_callback: Receives plugin error reports.
+        :param lossy: Stages that drop messages instead of blocking when full.
+                      Rendering is lossy by default since messages are already
+                      stored and the next poll shows them.
+        :param batch_size: Messages a stage with batch plugins takes at once at most.
+        """
+        self.workers = dict(PIPELINE_WORKERS if workers is None else workers)
+        self.queues = {stage: PriorityLanes(queue_size) for stage in STAGES}
+        self.plugins = {stage: [] for stage in STAGES}
+        self.log_callback = log_callback
+        self.lossy = set(lossy)
+        self.batch_size = batch_size
+        self.threads = {stage: [] for stage in STAGES}
+        self.running = False
+        self.lock = threading.Lock()
+
+    def register(self, stage, plugin, name=None, batch=False):
+        """
+        Add a plugin to the end of a stage.
+
+        :param stage: One of STAGES.
+        :param plugin: Callable taking a ChatMessage; return False to drop it.
+        :param name: Name used in error reports; defaults to the function name.
+        :param batch: Call the plugin with a list of messages instead; returning
+                      False (or raising) drops the whole list.
+        """
+        if stage not in self.plugins:
+            raise ValueError(f"Unknown pipeline stage: {stage} (choose from {', '.join(STAGES)})")
+        self.plugins[stage].append((name or getattr(plugin, "__name__", repr(plugin)), plugin, batch))
+
+    def unregister(self, stage, name):
+        self.plugins[stage] = [entry for entry in self.plugins[stage] if entry[0] != name]
+
+    def start(self):
+        """Start the worker threads of every stage that has any."""
+        with self.lock:
+            if self.running:
+                return
+            for stage in STAGES:
+                for n in range(self.workers.get(stage, 1)):
+                    thread = threading.Thread(target=self.work, args=(stage,), name=f"pipeline-{stage}-{n}", daemon=True)
+                    thread.start()
+                    self.threads[stage].append(thread)
+            self.running = True
+            active_pipelines.add(self)
+
+    def stop(self):
+        """
+        Finish queued messages and stop the workers. Stages stop in order, so
+        everything submitted before this call reaches the last threaded stage.
+        """
+        with self.lock:
+            if not self.running:
+                return
+            for stage in STAGES:
+                for _ in self.threads[stage]:
+                    self.queues[stage].put_last(STOP)
+                for thread in self.threads[stage]:
+                    thread.join()
+                self.threads[stage] = []
+            self.running = False
+            active_pipelines.discard(self)
+
+    def submit(self, message, stage="decode"):
+        """Queue a message at a stage (decode for freshly received bytes)."""
+        self.forward(STAGES.index(stage), message)
+
+    def forward(self, index, message):
+        """Hand a message to the first stage from index on that has plugins."""
+        for stage in STAGES[index:]:
+            if self.plugins[stage]:
+                break
+        else:
+            return  # No stage left with work to do
+
+        size = len(message.raw) or len(message.text or "")
+        if not self.running and self.workers.get(stage, 1):
+            self.process(stage, message)  # Not started: run inline on the caller's thread
+        elif stage in self.lossy:
+            try:
+                self.queues[stage].put_nowait(message, message.priority, size)
+            except queue.Full:
+                dropped_messages.inc()
+        else:
+            self.queues[stage].put(message, priority=message.priority, size=size)
+
+    def work(self, stage):
+        stage_queue = self.queues[stage]
+        while True:
+            message = stage_queue.get()
+            if message is STOP:
+                return
+            if not any(batch for _, _, batch in self.plugins[stage]):
+                self.process(stage, message)
+                continue
+            messages = [message]
+            stopping = False
+            while len(messages) < self.batch_size:
+                try:
+                    message = stage_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if message is STOP:
+                    stopping = True
+                    break
+                messages.append(message)
+            self.process_batch(stage, messages)
+            if stopping:
+                return
+
+    def process(self, stage, message):
+        """Run a stage's plugins on one message, then pass it on unless dropped."""
+        self.process_batch(stage, [message])
+
+    def process_batch(self, stage, messages):
+        """
+        Run a stage's plugins on messages taken together, in order: a
+        per-message plugin on each message still kept, a batch plugin once
+        on all of them. Messages left are passed on.
+        """
+        started = time.perf_counter()
+        count = len(messages)
+        for name, plugin, batch in self.plugins[stage]:
+            if batch:
+                try:
+                    keep = plugin(messages) is not False
+                except Exception as e:
+                    keep = False
+                    self.log_callback(f"Error in {stage} plugin {name} for {len(messages)} message(s): {e}")
+                if not keep:
+                    dropped_messages.inc(len(messages))
+                    messages = []
+            else:
+                kept = []
+                for message in messages:
+                    try:
+                        if plugin(message) is not False:
+                            kept.append(message)
+                            continue
+                    except Exception as e:
+                        self.log_callback(f"Error in {stage} plugin {name} for message from {message.ip}:{message.port}: {e}")
+                    dropped_messages.inc()
+                messages = kept
+            if not messages:
+                break
+        per_message = (time.perf_counter() - started) / count
+        for _ in range(count):
+            stage_seconds[stage].observe(per_message)
+        for message in messages:
+            self.forward(STAGES.index(stage) + 1, message)
+
+    def drain(self, stage, limit=None):
+        """
+        Process messages waiting at a stage on the calling thread.
+
+        :param limit: Process at most this many; None for all waiting.
+        :return: Number of messages processed.
+        """
+        stage_queue = self.queues[stage]
+        done = 0
+        while limit is None or done < limit:
+            try:
+                message = stage_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.process(stage, message)
+            done += 1
+        return done
+
+
+# Stock plugins
+def decode_utf8(message):
+    """decode: turn received bytes into text; empty messages are dropped."""
+    message.text = message.raw.decode()
+    return bool(message.text)
+
+def extract_links(message):
+    """enrich: collect the URLs in the text."""
+    message.links = URL_PATTERN.findall(message.text)
+
+def keyword_alerts(keywords):
+    """
+    Build an enrich plugin that records which of the keywords a message
+    contains (case-insensitive, whole words).
+    """
+    patterns = [(keyword, re.compile(rf"\b{re.escape(keyword)}\b", re.IGNORECASE)) for keyword in keywords]
+
+    def match_keywords(message):
+        message.alerts = [keyword for keyword, pattern in patterns if pattern.search(message.text)]
+
+    return match_keywords
@@ -0,0 +1,130 @@
+import queue
+import threading
+from collections import deque
+
+from config import BULK_CHUNK_SIZE, BULK_THRESHOLD, PRIORITY_QUANTUM, PRIORITY_WEIGHTS
+
+
+# Traffic classes, most urgent first. Control is for protocol traffic such
+# as acks; interactive is typed chat; bulk is large pastes and transfers.
+PRIORITIES = ("control", "interactive", "bulk")
+
+
+def classify(size):
+    """Traffic class of a chat message of size bytes."""
+    return "bulk" if size > BULK_THRESHOLD else "interactive"
+
+def split_message(message, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Split text into pieces of at most chunk_size UTF-8 bytes, never inside
+    a character, so each piece can go out as its own frame.
+    """
+    encoded = message.encode()
+    if len(encoded) <= chunk_size:
+        return [message]
+    pieces = []
+    start = 0
+    while start < len(encoded):
+        end = min(start + chunk_size, len(encoded))
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1  # Back off to the start of a multi-byte character
+        pieces.append(encoded[start:end].decode())
+        start = end
+    return pieces
+
+
+class PriorityLanes:
+    """
+    A queue with one FIFO lane per traffic class, served by deficit round
+    robin: each turn a lane may dequeue up to PRIORITY_QUANTUM times its
+    weight in bytes, so control and interactive items get through quickly
+    while bulk still gets its share. Offers the queue.Queue methods the
+    pipeline and sender use (put, put_nowait, get, get_nowait, qsize).
+    """
+
+    def __init__(self, maxsize=0, weights=None, quantum=PRIORITY_QUANTUM):
+        """
+        :param maxsize: Items all lanes may hold together before put blocks (0 for no limit).
+        :param weights: Class -> weight; defaults to PRIORITY_WEIGHTS.
+        :param quantum: Bytes a lane of weight 1 may dequeue per turn.
+        """
+        self.maxsize = maxsize
+        self.weights = dict(PRIORITY_WEIGHTS if weights is None else weights)
+        self.quantum = quantum
+        self.lanes = {priority: deque() for priority in PRIORITIES}
+        self.deficits = {priority: 0 for priority in PRIORITIES}
+        self.last = deque()  # Items served only once every lane is empty (stop sentinels)
+        self.turn = 0        # Index of the lane whose turn it is
+        self.topped_up = False
+        self.count = 0
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+
+    def qsize(self):
+        with self.lock:
+            return self.count
+
+    def put(self, item, block=True, timeout=None, priority="interactive", size=1):
+        """
+        Queue an item in its class's lane.
+
+        :param priority: One of PRIORITIES; unknown classes count as interactive.
+        :param size: Bytes the item costs its lane's share.
+        :raises queue.Full: If not blocking (or the timeout passed) and the queue is full.
+        """
+        lane = self.lanes.get(priority, self.lanes["interactive"])
+        with self.not_full:
+            if self.maxsize > 0 and self.count >= self.maxsize:
+                if not block or not self.not_full.wait_for(lambda: self.count < self.maxsize, timeout):
+                    raise queue.Full
+            lane.append((max(1, size), item))
+            self.count += 1
+            self.not_empty.notify()
+
+    def put_nowait(self, item, priority="interactive", size=1):
+        self.put(item, False, priority=priority, size=size)
+
+    def put_last(self, item):
+        """Queue an item behind everything else, whatever is added later (never blocks)."""
+        with self.lock:
+            self.last.append(item)
+            self.count += 1
+            self.not_empty.notify()
+
+    def get(self, block=True, timeout=None):
+        """
+        :raises queue.Empty: If not blocking (or the timeout passed) and nothing is queued.
+        """
+        with self.not_empty:
+            if not self.count:
+                if not block or not self.not_empty.wait_for(lambda: self.count, timeout):
+                    raise queue.Empty
+            item = self.next_item()
+            self.count -= 1
+            self.not_full.notify()
+            return item
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def next_item(self):
+        """Pop the next item by deficit round robin; called with the lock held and count > 0."""
+        if not any(self.lanes.values()):
+            return self.last.popleft()
+        while True:
+            priority = PRIORITIES[self.turn]
+            lane = self.lanes[priority]
+            if lane:
+                if not self.topped_up:
+                    self.deficits[priority] += self.quantum * self.weights.get(priority, 1)
+                    self.topped_up = True
+                size, item = lane[0]
+                if size <= self.deficits[priority]:
+                    lane.popleft()
+                    self.deficits[priority] = self.deficits[priority] - size if lane else 0
+                    return item
+            else:
+                self.deficits[priority] = 0  # An idle lane does not bank credit
+            self.turn = (self.turn + 1) % len(PRIORITIES)
+            self.topped_up = False
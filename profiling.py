@@ -0,0 +1,181 @@
+import atexit
+import cProfile
+import datetime
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+from config import PROFILE_DIR, PROFILE_SLOW_MS
+
+
+# Functions (on pychatter) and ChatNode methods that profiling wraps when enabled
+HOT_PATHS = ("handle_client", "save_messages", "fetch_and_display_logs", "make_links_clickable", "poll_logs")
+
+MODES = ("slow", "cprofile", "tracemalloc")
+
+# Session state, only touched when profiling is enabled
+profile_settings = {"enabled": False, "slow_ms": PROFILE_SLOW_MS, "output_dir": PROFILE_DIR, "modes": ()}
+main_profiler = None
+thread_profilers = []           # Profilers of worker threads, merged on dump
+thread_state = threading.local()
+slow_log_lock = threading.Lock()
+
+
+def parse_modes(value):
+    """
+    Parse a comma-separated mode list such as "slow,cprofile".
+    "all" turns on every mode; unknown names raise ValueError.
+    """
+    if not value:
+        return ()
+    modes = [mode.strip().lower() for mode in value.split(",") if mode.strip()]
+    if "all" in modes:
+        return MODES
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        raise ValueError(f"Unknown profiling mode(s): {', '.join(unknown)} (choose from {', '.join(MODES)}, all)")
+    return tuple(modes)
+
+def format_args(args, kwargs, limit=200):
+    """Short repr of a call's arguments for the slow-call log."""
+    parts = [repr(arg) for arg in args] + [f"{key}={value!r}" for key, value in kwargs.items()]
+    text = ", ".join(parts)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+def log_slow_call(name, elapsed, args, kwargs):
+    line = (f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
+            f"{name} took {elapsed * 1000:.1f}ms ({threading.current_thread().name}): {format_args(args, kwargs)}")
+    print(f"Slow call: {line}")
+    with slow_log_lock:
+        with open(os.path.join(profile_settings["output_dir"], "slow_calls.log"), "a", encoding="utf-8") as log_file:
+            log_file.write(line + "\n")
+
+def thread_profiler():
+    """
+    cProfile only sees the thread that enabled it, so each worker thread gets
+    its own profiler, switched on around the wrapped calls it makes.
+    """
+    profiler = getattr(thread_state, "profiler", None)
+    if profiler is None:
+        profiler = thread_state.profiler = cProfile.Profile()
+        thread_profilers.append(profiler)
+    return profiler
+
+def timed(func, name=None):
+    """
+    Wrap a function so calls slower than the threshold are logged with their
+    arguments, and worker-thread calls are profiled when cProfile is on.
+    """
+    name = name or func.__qualname__
+    threshold = profile_settings["slow_ms"] / 1000
+    profile_threads = "cprofile" in profile_settings["modes"]
+    log_slow = "slow" in profile_settings["modes"]
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = None
+        if profile_threads and threading.current_thread() is not threading.main_thread() \
+                and not getattr(thread_state, "active", False):
+            profiler = thread_profiler()
+            thread_state.active = True
+            profiler.enable()
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            if profiler is not None:
+                profiler.disable()
+                thread_state.active = False
+            if log_slow and elapsed >= threshold:
+                log_slow_call(name, elapsed, args, kwargs)
+
+    wrapper.__wrapped_for_profiling__ = True
+    return wrapper
+
+def enable(owners, modes, slow_ms=PROFILE_SLOW_MS, output_dir=PROFILE_DIR, names=HOT_PATHS):
+    """
+    Turn on profiling for this session.
+
+    Hot-path functions are replaced on their module (or class) with timed
+    wrappers, so callers that look them up by name pick the wrappers up.
+    Nothing is wrapped unless this is called, so profiling costs nothing when
+    it is off.
+
+    :param owners: Modules and classes whose functions should be wrapped
+                   (pychatter and ChatNode); names they lack are skipped.
+    :param modes: Iterable of "slow", "cprofile" and/or "tracemalloc".
+    :param slow_ms: Calls at least this slow are logged.
+    :param output_dir: Directory for the slow-call log and profile dumps.
+    :param names: Function names on module to wrap.
+    """
+    global main_profiler
+    modes = tuple(modes)
+    if not modes or profile_settings["enabled"]:
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+    profile_settings.update(enabled=True, slow_ms=slow_ms, output_dir=output_dir, modes=modes)
+
+    if "slow" in modes or "cprofile" in modes:
+        for owner in owners:
+            for name in names:
+                func = getattr(owner, name, None)
+                if func is not None and not getattr(func, "__wrapped_for_profiling__", False):
+                    setattr(owner, name, timed(func, name))
+
+    if "cprofile" in modes:
+        main_profiler = cProfile.Profile()
+        main_profiler.enable()
+
+    if "tracemalloc" in modes:
+        tracemalloc.start(25)
+
+    atexit.register(finish)
+    print(f"Profiling enabled ({', '.join(modes)}); results go to '{output_dir}'.")
+
+def finish():
+    """Stop profiling and write the cProfile and tracemalloc results. Safe to call twice."""
+    global main_profiler
+    if not profile_settings["enabled"]:
+        return
+    profile_settings["enabled"] = False
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    output_dir = profile_settings["output_dir"]
+
+    if main_profiler is not None:
+        main_profiler.disable()
+        stats = pstats.Stats(main_profiler)
+        for profiler in thread_profilers:
+            profiler.create_stats()
+            if profiler.stats:
+                stats.add(profiler)
+        path = os.path.join(output_dir, f"cprofile-{stamp}.prof")
+        stats.dump_stats(path)
+
+        report = io.StringIO()
+        pstats.Stats(path, stream=report).sort_stats("cumulative").print_stats(40)
+        with open(os.path.join(output_dir, f"cprofile-{stamp}.txt"), "w", encoding="utf-8") as report_file:
+            report_file.write(report.getvalue())
+        print(f"cProfile results written to '{path}' (open with snakeviz or pstats).")
+        main_profiler = None
+
+    if tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        path = os.path.join(output_dir, f"tracemalloc-{stamp}.txt")
+        with open(path, "w", encoding="utf-8") as report_file:
+            report_file.write(f"Current traced memory: {current / 1024:.1f} KiB, peak: {peak / 1024:.1f} KiB\n\n")
+            report_file.write("Top allocations by line:\n")
+            for stat in snapshot.statistics("lineno")[:30]:
+                report_file.write(f"{stat}\n")
+            report_file.write("\nTop allocations by traceback:\n")
+            for stat in snapshot.statistics("traceback")[:5]:
+                report_file.write(f"{stat}\n")
+                report_file.writelines(f"    {line}\n" for line in stat.traceback.format())
+        print(f"tracemalloc results written to '{path}'.")
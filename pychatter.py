@@ -4,48 +4,105 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
 import sqlite3
-import threading
-import queue
-import socket
-import datetime
 import time
+import argparse
+import os
+import sys
+import threading
+from collections import OrderedDict, deque
 
 import ttkbootstrap as tb
 import pygame
 
+import maintenance
+import conversation_stats
+import message_cache
+import metrics
+import profiling
+import pipeline
+import input_history
+import sounds
+from capture import TrafficCapture
+from chat_node import ChatNode, init_db
 
 # Import the config file
-from config import AVAILABLE_COLORS, COLOR_MAPPINGS, DEFAULT_PORT
+from config import AVAILABLE_COLORS, COLOR_MAPPINGS, DEFAULT_PORT, DB_PATH, HISTORY_PAGE_SIZE, STATS_PORT, PROFILE_SLOW_MS, \
+    RENDER_BATCH, RENDER_INTERVAL_MS, ALERT_KEYWORDS, IDENTITIES, NOTIFY_COALESCE_MS, FLASH_INTERVAL_MS, TITLE_MAX_PEERS, \
+    LOG_MAX_LINES, LOG_MAX_CHARS, LOG_TRIM_FRACTION, LOG_MAX_STATUS_LINES, LOG_VIEWS_MAX, LISTENER_SHARDS
 
 
-# Global variables for message history
-message_history = []
-history_index = -1  # Tracks the position in the history
+# Ctrl-R search state of the message box; the history itself lives in input_history.py
+history_search = {"active": False, "prefix": "", "match": None, "original": ""}
 
-# Global variable to hold the server socket
-server_socket_instance = None
-server_thread_stop_event = threading.Event()  # Event to signal the server thread to stop
+# The chat nodes (listener, sender, database) this window drives, by identity
+# name ("" is the default identity); see chat_node.py. node is the one
+# messages are sent as.
+nodes = {}
+node = None
 
 # for sound
-last_sound_time = 0  # Tracks the last time a sound was played
+last_sound_time = 0  # Tracks the last time a sound was played; Tk thread only
 sound_effects = {}
 
+# Notification scheduler state, only touched on the Tk thread. "pending"
+# counts messages since the last alert and "peers" holds their IPs;
+# "alert_timer" and "flash_timer" are the after() ids of the one coalescing
+# timer and the one title blink timer.
+APP_TITLE = "Chat Application"
+notifications = {"pending": 0, "peers": set(), "alert_timer": None, "flash_timer": None, "flash_on": False,
+                 "title": APP_TITLE, "stats_version": -1}
+
 # Log Polling
-server_active = False
 latest_log_timestamp = None
 
+# Paging state of the log view: which connection is shown, the (timestamp, id)
+# cursor of the oldest rendered message for paging back, and the highest
+# rendered id, which the live tail follows (see fetch_new_rows).
+# "rows" holds (cursor, lines, chars, segments) of every rendered row, oldest
+# first, so the buffer can be trimmed by whole rows and re-rendered without
+# formatting it again; "detached" means rows newer than "newest_id" were
+# trimmed and the view no longer follows new messages.
+log_view = {"selected": None, "oldest": None, "newest_id": None, "exhausted": False,
+            "rows": deque(), "lines": 0, "chars": 0, "detached": False, "transient": 0}
+
+# Views of conversations shown before, least recently shown first: a copy of
+# log_view plus "position" (first visible index) and "following" (scrolled
+# to the end). Switching back renders the saved rows instead of querying.
+saved_log_views = OrderedDict()
+
+# "ip:port" -> color of saved connections, read once; save_connection refreshes it
+connection_colors_cache = None
+
+# Connection keys ("ip:port") in listbox order; the listbox text carries unread badges
+listbox_connections = []
+listbox_stats_version = -1
+
+# Ids of messages this session that matched ALERT_KEYWORDS, highlighted when rendered
+alerted_messages = set()
+
+# Background deletion started by clear_logs; "deleted"/"total" are written by
+# the worker thread and read by the Tk thread's progress updates
+purge = {"thread": None, "ip": None, "deleted": 0, "total": 0, "stop_event": None, "error": None}
+
+# Metrics for the GUI hot paths (engine metrics live in chat_node.py; shown in the Stats window)
+log_render_seconds = metrics.histogram("log_render_seconds", "Time to render a full page in fetch_and_display_logs")
+log_update_seconds = metrics.histogram("log_update_seconds", "Time to append new rows or prepend an older page")
+log_switch_seconds = metrics.histogram("log_switch_seconds", "Time to switch to a conversation with a saved view")
+
 # Colors
 def fetch_connection_colors():
     """
-    Fetch the connection colors from the database.
-    Returns a dictionary mapping 'ip:port' to the assigned color.
+    Fetch the connection colors, from the database on first use and from
+    memory afterwards. Returns a dictionary mapping 'ip:port' to the assigned color.
     """
-    conn = sqlite3.connect("chat_app.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT ip, port, color FROM connections")
-    connection_colors = {f"{ip}:{port}": color for ip, port, color in cursor.fetchall()}
-    conn.close()
-    return connection_colors
+    global connection_colors_cache
+    if connection_colors_cache is None:
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute("SELECT ip, port, color FROM connections")
+        connection_colors_cache = {f"{ip}:{port}": color for ip, port, color in cursor.fetchall()}
+        conn.close()
+    return dict(connection_colors_cache)
 
 def assign_color(item):
     """
@@ -98,20 +155,20 @@ def assign_color_to_selected(color, connections_listbox, log_text, current_log_l
     selection = connections_listbox.curselection()
     if selection:
         selected_index = selection[0]  # Get the current selection index
-        selected_connection = connections_listbox.get(selected_index)
+        selected_connection = get_listbox_connection(connections_listbox, selected_index)
+        if selected_connection == "All Messages":
+            print("Cannot assign a color to All Messages.")
+            return
         ip, port = selected_connection.split(":")
         save_connection(ip, int(port), color)  # Save the color to the database
 
-        # Refresh the listbox and dropdown menu
+        # Refresh the listbox and dropdown menu (keeps the selection)
         refresh_connections(connections_listbox, custom_dropdown)
 
         # Update the log text with new color settings
         connection_colors = fetch_connection_colors()
         initialize_color_tags(log_text)
         fetch_and_display_logs(log_text, connection_colors, selected_connection)
-
-        # Reselect the previously selected item in the listbox
-        connections_listbox.selection_set(selected_index)
     else:
         print("No connection selected to assign color.")  # Debugging message for no selection
 
@@ -131,40 +188,9 @@ def initialize_color_tags(log_text):
         log_text.tag_configure("white bold", foreground="#FFFFFF", font="TkDefaultFont 10 bold")
 
 
-# SQLite Database Setup
-def init_db():
-    conn = sqlite3.connect("chat_app.db")
-    cursor = conn.cursor()
-
-    # Check if the connections table exists
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS connections (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        ip TEXT,
-        port INTEGER,
-        color TEXT,
-        UNIQUE(ip, port)
-    )
-    """)
-
-    # Ensure the messages table exists with its current schema
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS messages (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT,
-        ip TEXT,
-        port INTEGER,
-        message TEXT,
-        delivery_status TEXT DEFAULT 'success'
-    )
-    """)
-
-    conn.commit()
-    conn.close()
-
 # only used if we need to update, kept for knowledge
 def update_db_schema():
-    conn = sqlite3.connect("chat_app.db")
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
 
     # Check if the delivery_status column exists, and add it if not
@@ -180,149 +206,63 @@ def update_db_schema():
 
 
 # Client/Server Related
-def send_message(ip, port, message, log_callback):
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
-            client_socket.connect((ip, port))
-            client_socket.sendall(message.encode())
-            timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            log_callback(f"[{timestamp}] {ip}:{port}: {message}")
-            save_message(timestamp, ip, port, message, delivery_status="success")
-    except Exception as e:
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_callback(f"[{timestamp}] Failed to send message to {ip}:{port}. Error: {e}")
-        save_message(timestamp, ip, port, message, delivery_status="failure")
-        messagebox.showerror("Error", f"Failed to send message: {e}")
+def send_message(ip, port, message):
+    """
+    Queue a message as the selected identity. It is sent in the background
+    (large pastes as bulk traffic, in chunks) and the outcome is reported on
+    the Tk thread.
+    """
+    node.queue_message(ip, port, message, callback=lambda error: app.after(0, lambda: report_send(error)))
+
+def report_send(error):
+    """Play the sent sound, or report a failed delivery."""
+    if error is None:
+        play_notification('sent')
+    else:
+        messagebox.showerror("Error", f"Failed to send message: {error}")
 
-def start_server_with_default(server_port_entry, message_queue, log_callback):
+def select_identity(identity):
+    """Send further messages as the given identity."""
+    global node
+    node = nodes[identity]
+
+def servers_running():
+    return any(chat_node.running for chat_node in nodes.values())
+
+def start_server_with_default(server_port_entry):
     """
-    Start the server and enable the polling mechanism.
+    Start every identity's listener: the default identity on the entered
+    port, the others on their configured ports.
     """
-    global server_active
     port = server_port_entry.get()
     try:
         port = int(port) if port else DEFAULT_PORT
-        if server_active:
-            log_callback("Server is already running.")
-            return  # Prevent starting a new server instance
-        start_server(port, message_queue, log_callback)
-        server_active = True  # Set the flag to indicate the server is running
-        log_callback("Server started successfully.")
     except ValueError:
         messagebox.showerror("Error", "Port must be a valid number")
-    except Exception as e:
-        log_callback(f"Error starting server: {e}")
-
-def start_server(listen_port, message_queue, log_callback):
-    """
-    Starts a server to listen on a given port for incoming connections.
-    Ensures no duplicate server starts and handles client connections in separate threads.
-    
-    :param listen_port: Port number for the server to listen on.
-    :param message_queue: Queue for passing received messages.
-    :param log_callback: Function to log messages or errors.
-    """
-    global server_socket_instance, server_thread_stop_event
-
-    def server_thread():
-        """
-        The main server loop that listens for incoming connections
-        and starts a new thread to handle each client.
-        """
-        try:
-            # Create and configure the server socket
-            server_socket_instance = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            server_socket_instance.bind(("0.0.0.0", listen_port))
-            server_socket_instance.listen(10)  # Allow up to 10 pending connections
-            log_callback(f"Server listening on port {listen_port}...")
-
-            while not server_thread_stop_event.is_set():
-                try:
-                    server_socket_instance.settimeout(1.0)  # Timeout for accept()
-                    conn, addr = server_socket_instance.accept()  # Wait for a connection
-                    log_callback(f"New connection from {addr[0]}:{addr[1]}")
-                    # Start a new thread to handle the client
-                    threading.Thread(target=handle_client, args=(conn, addr), daemon=True).start()
-                except socket.timeout:
-                    continue  # Allow the loop to check for `server_thread_stop_event`
-                except Exception as e:
-                    log_callback(f"Error accepting client: {e}")
-        except Exception as e:
-            log_callback(f"Fatal server error: {e}")
-        finally:
-            # Ensure the server socket is properly closed
-            if server_socket_instance:
-                server_socket_instance.close()
-                server_socket_instance = None
-            log_callback("Server thread exiting.")
-
-    def handle_client(conn, addr):
-        """
-        Handles communication with a single client.
-        Receives data, logs the message, and saves it to the database.
-        """
-        try:
-            data = conn.recv(1024).decode()
-            if data:
-                timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                log_callback(f"[{timestamp}] {addr[0]}:{addr[1]}: {data}")
-                message_queue.put((timestamp, addr[0], addr[1], data))
-                save_message(timestamp, addr[0], addr[1], data)
-        except Exception as e:
-            log_callback(f"Error handling client {addr}: {e}")
-        finally:
-            conn.close()
-
-    # Ensure no duplicate server starts
-    if server_active:
-        log_callback("Server is already active.")
         return
-
-    # Clear the stop event and start the server thread
-    server_thread_stop_event.clear()
-    threading.Thread(target=server_thread, daemon=True).start()
-    log_callback("Server thread started.")
-
-def stop_server(log_callback):
-    global server_thread_stop_event, server_socket_instance
-    server_thread_stop_event.set()
-    if server_socket_instance:
-        try:
-            server_socket_instance.close()
-        except Exception as e:
-            log_callback(f"Error closing server socket: {e}")
-        finally:
-            server_socket_instance = None
-    log_callback("Server stopping...")
-
-def toggle_server_status(start_button, server_port_entry, message_queue, log_callback, connections_listbox, log_text, current_log_label, freeze_logs):
-    global server_active
-
-    if server_active:  # Stop the server
-        stop_server(log_callback)
+    for identity, chat_node in nodes.items():
+        if chat_node.running:
+            chat_node.log("Server is already running.")
+            continue  # Prevent starting a new server instance
+        if chat_node.start(port if identity == "" else None):
+            chat_node.log("Server started successfully.")
+
+def toggle_server_status(start_button, server_port_entry, connections_listbox, log_text, current_log_label, freeze_logs):
+    if servers_running():  # Stop the servers
+        for chat_node in nodes.values():
+            chat_node.stop()
         start_button.config(text="Start Server", style="ServerStopped.TButton")
-        server_active = False
-    else:  # Start the server
-        start_server_with_default(server_port_entry, message_queue, log_callback)
-        if server_active:  # Server started successfully
+    else:  # Start the servers
+        start_server_with_default(server_port_entry)
+        if servers_running():  # At least one listener started
             start_button.config(text="Server Running", style="ServerRunning.TButton")
             poll_logs(connections_listbox, log_text, current_log_label, freeze_logs)
 
 
 
 # Database Save Functions
-def save_message(timestamp, ip, port, message, delivery_status="success"):
-    conn = sqlite3.connect("chat_app.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO messages (timestamp, ip, port, message, delivery_status) VALUES (?, ?, ?, ?, ?)",
-        (timestamp, ip, port, message, delivery_status)
-    )
-    conn.commit()
-    conn.close()
-
 def get_connections():
-    conn = sqlite3.connect("chat_app.db")
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     cursor.execute("SELECT ip, port, color FROM connections")
     connections = cursor.fetchall()
@@ -333,15 +273,19 @@ def save_connection(ip, port, color=None):
     """
     Save or update a connection's details in the database.
     Ensures each combination of ip:port is unique, and updates the color if necessary.
+    Saved log views are dropped, since their rows carry the old colors.
     """
+    global connection_colors_cache
     if not color.startswith("#"):
         color = COLOR_MAPPINGS.get(color, "#FFFFFF")  # Fallback to white if invalid
-    conn = sqlite3.connect("chat_app.db")
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     try:
         cursor.execute("INSERT OR IGNORE INTO connections (ip, port, color) VALUES (?, ?, ?)", (ip, port, color))
         cursor.execute("UPDATE connections SET color = ? WHERE ip = ? AND port = ?", (color, ip, port))
         conn.commit()
+        connection_colors_cache = None
+        saved_log_views.clear()
     except sqlite3.Error as e:
         messagebox.showerror("Database Error", f"Failed to save connection: {e}")
     finally:
@@ -351,15 +295,68 @@ def save_connection(ip, port, color=None):
 # Log Helpers/Modifiers
 
 # Simplified Flashing Functions will not hook into windows orange icon on taskbar
-def flash_title(app, state=True):
+def unread_title():
+    """The window title: total unread and the peers with the most unread messages."""
+    total = conversation_stats.total_unread()
+    if not total:
+        return APP_TITLE
+    unread = conversation_stats.unread_by_ip()
+    peers = ", ".join(f"{ip} ({count})" for ip, count in unread[:TITLE_MAX_PEERS])
+    if len(unread) > TITLE_MAX_PEERS:
+        peers += f", +{len(unread) - TITLE_MAX_PEERS} more"
+    return f"[{total}] {peers} - {APP_TITLE}"
+
+def update_title(force=False):
+    """Refresh the title's unread summary when the conversation stats changed."""
+    if not force and notifications["stats_version"] == conversation_stats.stats_version:
+        return
+    notifications["stats_version"] = conversation_stats.stats_version
+    notifications["title"] = unread_title()
+    if not notifications["flash_on"]:
+        app.title(notifications["title"])
+
+def queue_notification(ip):
+    """
+    Note an incoming message from ip. The first message of a burst arms the
+    single coalescing timer; the rest only bump the count, so a burst costs
+    one timer, one sound and one title update.
+    """
+    notifications["pending"] += 1
+    notifications["peers"].add(ip)
+    if notifications["alert_timer"] is None:
+        notifications["alert_timer"] = app.after(NOTIFY_COALESCE_MS, fire_notification)
+
+def fire_notification():
+    """Alert once for everything queued during the window."""
+    notifications["alert_timer"] = None
+    if not notifications["pending"]:
+        return
+    notifications["pending"] = 0
+    peers = notifications["peers"]
+    notifications["peers"] = set()
+    sound = 'received'
+    if len(peers) == 1:
+        # A single talker gets the chime of its connection colour, stored as hex like the sounds are keyed
+        ip = next(iter(peers))
+        colour = next((color for key, color in fetch_connection_colors().items() if key.split(":")[0] == ip), None)
+        if colour:
+            sound = f"received:{colour}"
+    play_notification(sound)
+    update_title(force=True)
+    if notifications["flash_timer"] is None and not app.focus_get():
+        flash_title()
+
+def flash_title():
     """
-    Blink the application title bar text to alert the user.
+    Blink the title while the window is unfocused. Only one blink timer
+    exists at a time; it stops itself once the window has focus.
     """
-    if app.focus_get():  # Stop flashing if the app regains focus
-        app.title("Chat Application")
+    if app.focus_get():
+        stop_flashing_on_focus()
         return
-    app.title("New Message!" if state else "Chat Application")
-    app.after(500, lambda: flash_title(app, not state))
+    notifications["flash_on"] = not notifications["flash_on"]
+    app.title(f"New Message! {notifications['title']}" if notifications["flash_on"] else notifications["title"])
+    notifications["flash_timer"] = app.after(FLASH_INTERVAL_MS, flash_title)
 
 def flash_taskbar(hwnd, count=5):
     """
@@ -402,22 +399,21 @@ def stop_flashing_taskbar(app_name):
         )
         ctypes.windll.user32.FlashWindowEx(ctypes.byref(flash_info))
 
-def start_flashing_title():
-    """
-    Start flashing the window title to alert the user of new messages.
-    """
-    if not app.focus_get():
-        flash_title(app)
-
 def stop_flashing_on_focus(event=None):
     """
-    Stop flashing and reset the title when the app regains focus.
+    Stop flashing and put the unread summary back when the app regains focus.
     """
-    app.title("Chat Application")  # Reset title to default
+    if notifications["flash_timer"] is not None:
+        app.after_cancel(notifications["flash_timer"])
+        notifications["flash_timer"] = None
+    notifications["flash_on"] = False
+    app.title(notifications["title"])
 
-def make_links_clickable(log_text):
+def make_links_clickable(log_text, start_index="1.0", end_index="end"):
     """
     Identify URLs in the log_text widget and make them clickable.
+    Only the given range is rescanned, so pages added to either end of
+    the log do not pay for the text that is already tagged.
     """
     url_pattern = r"http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+"
     
@@ -440,39 +436,44 @@ def make_links_clickable(log_text):
     log_text.tag_unbind("hyperlink", "<Button-1>")
     log_text.tag_bind("hyperlink", "<Button-1>", open_url)
 
-    # Search for URLs in the log_text
-    log_text.tag_remove("hyperlink", "1.0", "end")
-    start = "1.0"
-    while True:
-        match = re.search(url_pattern, log_text.get(start, "end"))
-        if not match:
-            break
-        start_index = f"{start}+{match.start()}c"
-        end_index = f"{start}+{match.end()}c"
-        log_text.tag_add("hyperlink", start_index, end_index)
-        start = end_index
+    # Search for URLs in the requested range of log_text
+    log_text.tag_remove("hyperlink", start_index, end_index)
+    text = log_text.get(start_index, end_index)
+    for match in re.finditer(url_pattern, text):
+        log_text.tag_add("hyperlink", f"{start_index}+{match.start()}c", f"{start_index}+{match.end()}c")
 
-def log_callback(log_text, message):
+def log_callback(log_text, message, tags=()):
     """
-    Log callback with distinct sounds for sent and received messages.
-    No sounds for server messages or errors.
+    Show a status line or message at the end of the log view.
+    Sounds and title flashing are left to the notification scheduler (see queue_notification).
     """
     log_text["state"] = "normal"
-    log_text.insert("end", message + "\n")
+    # Transient lines are replaced by the stored rows on the next poll
+    log_text.insert("end", message + "\n", ("transient", *tags))
+    log_view["transient"] += 1
+    if log_view["transient"] > LOG_MAX_STATUS_LINES:
+        # No poll is clearing them (server stopped or logs frozen); drop the oldest
+        oldest = log_text.tag_nextrange("transient", "1.0")
+        if oldest:
+            log_text.delete(*oldest)
+        log_view["transient"] -= 1
     log_text["state"] = "disabled"
     log_text.see("end")
-    
-    # Skip sounds for server messages and errors
-    if message.startswith("Server") or "Failed to send message" in message:
-        pass
-    # Check if this is an actual message with timestamp
-    elif "[" in message and "]" in message:
-        # Check if it's a sent message (they end with the actual message text)
-        # or a received message (they end with the IP:port)
-        is_sent = not bool(re.search(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}:\d+$', message))
-        play_notification('sent' if is_sent else 'received')
-    
-    start_flashing_title()
+
+# Pipeline plugins for received messages (see pipeline.py)
+def render_incoming(log_text, message):
+    """render: show the message right away and queue a notification (runs on the Tk thread)."""
+    if message.alerts:
+        alerted_messages.add(message.id)
+    log_callback(log_text, message.format(), ("alert",) if message.alerts else ())
+    queue_notification(message.ip)
+
+def render_pending(log_text):
+    """Render messages the pipeline has queued for the Tk thread, a batch per tick."""
+    for chat_node in nodes.values():
+        chat_node.pipeline.drain("render", RENDER_BATCH)
+    log_text.after(RENDER_INTERVAL_MS, lambda: render_pending(log_text))
+    update_title()  # Only when the stats changed
 
 
 
@@ -482,36 +483,99 @@ def clear_logs(connections_listbox, log_text, current_log_label):
         messagebox.showerror("Error", "No connection selected to clear logs.")
         return
 
-    ip_port = connections_listbox.get(selection[0])
+    ip_port = get_listbox_connection(connections_listbox, selection[0])
+    if ip_port == "All Messages":
+        messagebox.showerror("Error", "Select a single connection to clear its logs.")
+        return
+    if purge["thread"] is not None:
+        messagebox.showerror("Error", f"Logs for {purge['ip']} are still being deleted.")
+        return
     ip, _ = ip_port.split(":")  # Extract only the IP
     response = messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete all logs for {ip}?")
     if response:
-        # Delete all logs for the selected IP, regardless of the port
-        conn = sqlite3.connect("chat_app.db")
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM messages WHERE ip = ?", (ip,))
-        conn.commit()
-        conn.close()
+        # Delete all logs for the selected IP, regardless of the port, in the background
+        start_purge(ip, connections_listbox, log_text, current_log_label)
+
+def start_purge(ip, connections_listbox, log_text, current_log_label):
+    """
+    Delete an IP's messages on a worker thread in short batches (see
+    maintenance.purge_conversation), showing progress in a small window
+    whose Cancel button stops after the current batch.
+    """
+    stop_event = threading.Event()
+    purge.update(ip=ip, deleted=0, total=0, stop_event=stop_event, error=None)
 
-        # Clear the log display area
-        log_text["state"] = "normal"
-        log_text.delete("1.0", "end")
-        log_text["state"] = "disabled"
+    def record_progress(deleted, total):
+        purge["deleted"], purge["total"] = deleted, total
+
+    def run():
+        try:
+            purge["deleted"] = maintenance.purge_conversation(ip, DB_PATH, progress=record_progress, stop_event=stop_event)
+        except Exception as e:
+            purge["error"] = e
+
+    window = tk.Toplevel(log_text)
+    window.title("Deleting logs")
+    window.resizable(False, False)
+    status_label = ttk.Label(window, text=f"Deleting logs for {ip}...")
+    status_label.pack(padx=10, pady=(10, 5))
+    progress_bar = ttk.Progressbar(window, length=300, mode="determinate")
+    progress_bar.pack(padx=10, pady=5)
+    cancel_button = ttk.Button(window, text="Cancel")
+    cancel_button.config(command=lambda: (stop_event.set(), cancel_button.config(text="Cancelling...", state="disabled")))
+    cancel_button.pack(pady=(5, 10))
+    window.protocol("WM_DELETE_WINDOW", cancel_button.invoke)
+
+    purge["thread"] = threading.Thread(target=run, name="purge", daemon=True)
+    purge["thread"].start()
+
+    def update_progress():
+        if purge["thread"].is_alive():
+            if purge["total"]:
+                progress_bar.config(maximum=purge["total"], value=purge["deleted"])
+                status_label.config(text=f"Deleting logs for {ip}: {purge['deleted']:,} of {purge['total']:,}")
+            window.after(100, update_progress)
+        else:
+            window.destroy()
+            finish_purge(connections_listbox, log_text, current_log_label)
 
-        # Update the current log label
-        current_log_label.config(text="Logs for: None")
+    update_progress()
+
+def finish_purge(connections_listbox, log_text, current_log_label):
+    """Refresh the views after a purge ended and report how it went."""
+    ip = purge["ip"]
+    cancelled = purge["stop_event"].is_set()
+    purge["thread"] = None
+    purge["stop_event"] = None
+    forget_log_views(ip)
+    update_connection_badges(connections_listbox)
+
+    # Clear the log display area
+    log_text["state"] = "normal"
+    log_text.delete("1.0", "end")
+    log_text["state"] = "disabled"
+    reset_log_view()
+
+    # Update the current log label
+    current_log_label.config(text="Logs for: None")
+    if purge["error"] is not None:
+        messagebox.showerror("Error", f"Deleting logs for {ip} failed after {purge['deleted']:,} messages: {purge['error']}")
+    elif cancelled:
+        messagebox.showinfo("Logs Deleted", f"Stopped after deleting {purge['deleted']:,} of {purge['total']:,} logs for {ip}.")
+    else:
         messagebox.showinfo("Logs Deleted", f"All logs for {ip} have been deleted.")
 
 def poll_logs(connections_listbox, log_text, current_log_label, freeze_logs):
     """
-    Periodically check for new logs and update the log_text widget based on the selected filter.
-    Only displays the latest 25 logs.
+    Periodically check for new logs and append them to the log_text widget.
+    Only rows newer than the last rendered message are fetched; switching
+    the selected connection triggers a fresh first page instead.
     Respects the freeze_logs toggle to pause polling if needed.
     """
-    global latest_log_timestamp, server_active
+    global latest_log_timestamp
 
     # Skip polling if the server is not active or logs are frozen
-    if not server_active or freeze_logs.get():
+    if not servers_running() or freeze_logs.get():
         log_text.after(1000, lambda: poll_logs(connections_listbox, log_text, current_log_label, freeze_logs))
         return
 
@@ -520,106 +584,393 @@ def poll_logs(connections_listbox, log_text, current_log_label, freeze_logs):
 
     selection = connections_listbox.curselection()
     if not selection:
+        update_connection_badges(connections_listbox)
         log_text.after(1000, lambda: poll_logs(connections_listbox, log_text, current_log_label, freeze_logs))
         return
 
-    selected_ip_port = connections_listbox.get(selection[0])
-    fetch_and_display_logs(log_text, connection_colors, selected_ip_port)
+    selected_ip_port = get_listbox_connection(connections_listbox, selection[0])
+    switch_log_view(log_text, connection_colors, selected_ip_port)
+
+    # The open conversation is being read; everything else keeps its badge
+    if selected_ip_port != "All Messages":
+        conversation_stats.mark_read(selected_ip_port.split(":")[0], DB_PATH)
+    update_connection_badges(connections_listbox)
+    update_title()
 
     log_text.after(1000, lambda: poll_logs(connections_listbox, log_text, current_log_label, freeze_logs))
 
-def fetch_and_display_logs(
-    log_text,
-    connection_colors,
-    selected_ip_port="All Messages",
-    limit=100  # Increased default limit
-):
+def fetch_history_page(selected_ip_port="All Messages", before=None, limit=HISTORY_PAGE_SIZE):
     """
-    Fetch logs from the database and display them in the log_text widget.
-    Displays both outgoing and incoming messages for the selected connection.
-    Messages are shown oldest to newest, with abbreviated IPs.
+    Fetch one page of message history using keyset pagination.
+
+    Rows are ordered by (timestamp, id), which is what the messages indexes
+    cover, so every page is a single index range scan no matter how far back
+    it starts. A connection's view holds every message exchanged with its IP
+    by any identity (outgoing rows use the saved port, incoming rows the
+    peer's source port).
+    Recent pages are served from message_cache when it holds all their rows.
+
+    :param selected_ip_port: "ip:port" of a connection or "All Messages".
+    :param before: (timestamp, id) cursor; return the page just older than it.
+    :param limit: Maximum number of rows in the page.
+    :return: List of (id, timestamp, ip, port, message, delivery_status, identity, incoming), oldest first.
+    """
+    rows = message_cache.get_page(selected_ip_port, before, limit)
+    if rows is not None:
+        return rows
+
+    newest_page = before is None
+    if newest_page:
+        token = message_cache.fill_token(selected_ip_port)
+
+    conditions, params = [], []
+    if selected_ip_port != "All Messages":
+        ip, _ = selected_ip_port.split(":")
+        conditions.append("ip = ?")
+        params.append(ip)
+
+    if before is not None:
+        conditions.append("(timestamp, id) < (?, ?)")
+        params.extend(before)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+        SELECT id, timestamp, ip, port, message, delivery_status, identity, incoming
+        FROM messages
+        {where}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
     """
-    # Tag configuration remains the same...
+    params.append(limit)
 
-    conn = sqlite3.connect("chat_app.db")
-    cursor = conn.cursor()
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        rows = conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
 
-    if selected_ip_port == "All Messages":
-        # First, get total count
-        cursor.execute("SELECT COUNT(*) FROM messages")
-        total_messages = cursor.fetchone()[0]
-        
-        # Then get the messages with a larger limit
-        query = """
-            SELECT timestamp, ip, port, message, delivery_status
-            FROM messages
-            ORDER BY timestamp DESC
-            LIMIT ?
-        """
-        cursor.execute(query, (limit,))
-        logs = cursor.fetchall()
-        logs = sorted(logs, key=lambda x: x[0])  # Sort chronologically
-    else:
-        ip, port = selected_ip_port.split(":")
-        port = int(port)
+    rows.reverse()  # Always hand back chronological order
+    if newest_page:
+        message_cache.fill(selected_ip_port, rows, limit, token)
+    return rows
 
-        # Get messages for specific connection with a larger limit
-        outgoing_query = """
-            SELECT timestamp, ip, port, message, delivery_status
-            FROM messages
-            WHERE ip = ? AND port = ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-        """
-        cursor.execute(outgoing_query, (ip, port, limit))
-        outgoing_logs = cursor.fetchall()
+def fetch_new_rows(selected_ip_port="All Messages", after_id=0, limit=HISTORY_PAGE_SIZE):
+    """
+    Fetch rows stored after the row with id after_id, in the order they were
+    committed, for the live tail.
 
-        incoming_query = """
-            SELECT timestamp, ip, port, message, delivery_status
+    The tail follows ids rather than (timestamp, id): timestamps are taken
+    when a message arrives but rows are committed later, in batches and from
+    several writers, so a row can be stored with an earlier timestamp than
+    rows already shown. Ids grow in commit order, so none is skipped.
+
+    No query is run when message_cache knows nothing newer than after_id
+    was stored, which is the common case for a view being restored or polled.
+
+    :return: List of (id, timestamp, ip, port, message, delivery_status, identity, incoming), by id.
+    """
+    known = message_cache.newest_id(selected_ip_port)
+    if known is not None and known <= after_id:
+        return []
+
+    conditions, params = ["id > ?"], [after_id]
+    if selected_ip_port != "All Messages":
+        ip, _ = selected_ip_port.split(":")
+        conditions.append("ip = ?")
+        params.append(ip)
+    params.append(limit)
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        rows = conn.execute(f"""
+            SELECT id, timestamp, ip, port, message, delivery_status, identity, incoming
             FROM messages
-            WHERE ip = ? AND port != ?
-            ORDER BY timestamp DESC
+            WHERE {' AND '.join(conditions)}
+            ORDER BY id
             LIMIT ?
-        """
-        cursor.execute(incoming_query, (ip, port, limit))
-        incoming_logs = cursor.fetchall()
-
-        # Combine and sort chronologically
-        logs = sorted(outgoing_logs + incoming_logs, key=lambda x: x[0])
+        """, params).fetchall()
+    finally:
+        conn.close()
 
-    conn.close()
+    if len(rows) < limit:  # The whole tail: nothing newer was stored when this ran
+        message_cache.note_newest(selected_ip_port, rows[-1][0] if rows else after_id)
+    return rows
 
-    log_text["state"] = "normal"
-    log_text.delete("1.0", "end")
+def insert_log_rows(log_text, rows, connection_colors, index="end"):
+    """
+    Render history rows into log_text at the given index, oldest first, in
+    a single insert. The caller is responsible for toggling the widget state.
 
+    :return: (cursor, lines, chars, segments) of each inserted row, for
+             log_view["rows"]; segments are the row's (text, tags) pairs
+             flattened as Text.insert takes them.
+    """
     server_ports = {int(key.split(":")[1]) for key in connection_colors}
     base_ip_colors = {key.split(":")[0]: color for key, color in connection_colors.items()}
+    tag_names = set(log_text.tag_names())
 
-    for timestamp, msg_ip, msg_port, message, delivery_status in logs:
+    extents = []
+    for row_id, timestamp, msg_ip, msg_port, message, delivery_status, identity, incoming in rows:
         msg_port = int(msg_port)
         connection_key = f"{msg_ip}:{msg_port}"
         color = connection_colors.get(connection_key, None) or base_ip_colors.get(msg_ip, "white")
         resolved_color = COLOR_MAPPINGS.get(color, color)
 
-        if resolved_color not in log_text.tag_names():
+        if resolved_color not in tag_names:
             log_text.tag_configure(resolved_color, foreground=resolved_color)
+            tag_names.add(resolved_color)
 
-        timestamp_line = f"{timestamp} {msg_ip}: "
-        log_text.insert("end", timestamp_line, resolved_color)
-
+        timestamp_line = f"{timestamp} [{identity}] {msg_ip}: " if identity else f"{timestamp} {msg_ip}: "
         status_display = f" (FAILED)" if delivery_status == "failure" else ""
-        is_outgoing = msg_port in server_ports
+        # Rows from before direction was stored fall back to the port heuristic
+        is_outgoing = not incoming if incoming is not None else msg_port in server_ports
 
         if is_outgoing:
-            log_text.insert("end", f"{message}{status_display}\n", "white bold")
+            message_tags = "white bold"
+        elif row_id in alerted_messages:
+            message_tags = (resolved_color, "alert")
         else:
-            log_text.insert("end", f"{message}{status_display}\n", resolved_color)
+            message_tags = resolved_color
+        segments = (timestamp_line, resolved_color, f"{message}{status_display}\n", message_tags)
+
+        extents.append(((timestamp, row_id), message.count("\n") + 1,
+                        len(timestamp_line) + len(message) + len(status_display) + 1, segments))
+
+    insert_segments(log_text, index, extents)
+    return extents
+
+def insert_segments(log_text, index, extents):
+    """Insert the rendered segments of rows at index with one Text.insert call."""
+    if extents:
+        log_text.insert(index, *(part for extent in extents for part in extent[3]))
+
+def reset_log_view(selected=None):
+    log_view.update(selected=selected, oldest=None, newest_id=None, exhausted=False,
+                    rows=deque(), lines=0, chars=0, detached=False, transient=0)
+
+def add_log_extents(extents, at_start=False):
+    """Account for rows just rendered at the start or end of the view."""
+    if at_start:
+        log_view["rows"].extendleft(reversed(extents))
+    else:
+        log_view["rows"].extend(extents)
+    log_view["lines"] += sum(extent[1] for extent in extents)
+    log_view["chars"] += sum(extent[2] for extent in extents)
+
+def over_log_limits(fraction=1.0):
+    return log_view["lines"] > LOG_MAX_LINES * fraction or log_view["chars"] > LOG_MAX_CHARS * fraction
+
+def trim_log_view(log_text, from_end=False):
+    """
+    Keep the rendered history within LOG_MAX_LINES and LOG_MAX_CHARS.
+    Once over either cap, whole rows are removed from one end in a single
+    delete (their color, hyperlink and alert tags go with the text) until the
+    view is back under (1 - LOG_TRIM_FRACTION) of the caps. The paging cursor
+    on that end moves inward, so scrolling back reloads the rows from SQLite.
+    The caller is responsible for toggling the widget state.
+
+    :param from_end: Trim the newest rows (after loading older pages) instead of the oldest.
+    :return: Number of rows trimmed.
+    """
+    if not over_log_limits():
+        return 0
+
+    rows = log_view["rows"]
+    trimmed = trimmed_lines = 0
+    while len(rows) > 1 and over_log_limits(1 - LOG_TRIM_FRACTION):
+        _, lines, chars, _ = rows.pop() if from_end else rows.popleft()
+        log_view["lines"] -= lines
+        log_view["chars"] -= chars
+        trimmed += 1
+        trimmed_lines += lines
+
+    if from_end:
+        # Drops any transient lines below the rows as well
+        log_text.delete(f"{log_view['lines'] + 1}.0", "end")
+        log_view["newest_id"] = max(extent[0][1] for extent in rows)
+        log_view["detached"] = True
+        log_view["transient"] = 0
+    else:
+        first_visible = log_text.index("@0,0")
+        log_text.delete("1.0", f"{trimmed_lines + 1}.0")
+        # Keep the line the user was looking at in place if it survived
+        line, column = first_visible.split(".")
+        if int(line) > trimmed_lines:
+            log_text.yview(f"{int(line) - trimmed_lines}.{column}")
+        log_view["oldest"] = rows[0][0]
+        log_view["exhausted"] = False
+    return trimmed
+
+def save_log_view(log_text):
+    """Keep the shown conversation's rendered rows and scroll position for switching back."""
+    selected = log_view["selected"]
+    if selected is None:
+        return
+    saved_log_views[selected] = dict(log_view, transient=0, position=log_text.index("@0,0"),
+                                     following=log_text.yview()[1] >= 1.0)
+    saved_log_views.move_to_end(selected)
+    while len(saved_log_views) > LOG_VIEWS_MAX:
+        saved_log_views.popitem(last=False)
 
+def restore_log_view(log_text, selected_ip_port):
+    """
+    Show a saved view again: its rows go back in with one insert of their
+    stored segments, without a query or formatting.
+
+    :return: False if the conversation has no saved view.
+    """
+    saved = saved_log_views.pop(selected_ip_port, None)
+    if saved is None:
+        return False
+    position = saved.pop("position")
+    following = saved.pop("following")
+
+    log_text["state"] = "normal"
+    log_text.delete("1.0", "end")
+    log_view.update(saved)
+    insert_segments(log_text, "1.0", log_view["rows"])
     make_links_clickable(log_text)
+    log_text["state"] = "disabled"
+    if following:
+        log_text.see("end")
+    else:
+        log_text.yview(position)
+    return True
+
+def forget_log_views(ip=None):
+    """Drop saved views showing ip (its own and "All Messages"), or every saved view."""
+    if ip is None:
+        saved_log_views.clear()
+        return
+    for key in [key for key in saved_log_views if key == "All Messages" or key.split(":")[0] == ip]:
+        del saved_log_views[key]
 
+def switch_log_view(log_text, connection_colors, selected_ip_port):
+    """
+    Show another conversation. The current view is saved (see save_log_view);
+    a conversation shown before comes back from its saved view and then
+    catches up on messages that arrived meanwhile. That only queries SQLite
+    when message_cache has seen a newer row stored than the view shows (see
+    fetch_new_rows). Only conversations without a saved view are fetched
+    and rendered from scratch.
+    """
+    if selected_ip_port == log_view["selected"]:
+        append_new_logs(log_text, connection_colors, selected_ip_port)
+        return
+
+    started = time.perf_counter()
+    save_log_view(log_text)
+    if not restore_log_view(log_text, selected_ip_port):
+        fetch_and_display_logs(log_text, connection_colors, selected_ip_port)
+        return
+    append_new_logs(log_text, connection_colors, selected_ip_port)
+    log_switch_seconds.observe(time.perf_counter() - started)
+
+def fetch_and_display_logs(
+    log_text,
+    connection_colors,
+    selected_ip_port="All Messages",
+    limit=HISTORY_PAGE_SIZE
+):
+    """
+    Fetch the newest page of logs and display it in the log_text widget.
+    Displays both outgoing and incoming messages for the selected connection.
+    Messages are shown oldest to newest, with abbreviated IPs.
+    Older pages are added on demand by load_older_logs.
+    """
+    started = time.perf_counter()
+    logs = fetch_history_page(selected_ip_port, limit=limit)
+
+    log_text["state"] = "normal"
+    log_text.delete("1.0", "end")
+    reset_log_view(selected_ip_port)
+    add_log_extents(insert_log_rows(log_text, logs, connection_colors))
+    make_links_clickable(log_text)
     log_text["state"] = "disabled"
     log_text.see("end")
 
+    log_view["oldest"] = (logs[0][1], logs[0][0]) if logs else None
+    log_view["newest_id"] = max(row[0] for row in logs) if logs else None
+    log_view["exhausted"] = len(logs) < limit
+    log_render_seconds.observe(time.perf_counter() - started)
+
+def load_older_logs(log_text, connection_colors, selected_ip_port, limit=HISTORY_PAGE_SIZE):
+    """
+    Prepend the page of logs just older than the oldest one on screen.
+    Keeps the currently visible line in place while the page is inserted,
+    and trims the newest rows if the view grows past its caps.
+    Returns the number of rows added.
+    """
+    if selected_ip_port != log_view["selected"] or log_view["exhausted"] or log_view["oldest"] is None:
+        return 0
+
+    started = time.perf_counter()
+    logs = fetch_history_page(selected_ip_port, before=log_view["oldest"], limit=limit)
+    log_view["exhausted"] = len(logs) < limit
+    if not logs:
+        return 0
+
+    first_visible = log_text.index("@0,0")
+    lines_before = int(log_text.index("end-1c").split(".")[0])
+
+    log_text["state"] = "normal"
+    add_log_extents(insert_log_rows(log_text, logs, connection_colors, "1.0"), at_start=True)
+    added_lines = int(log_text.index("end-1c").split(".")[0]) - lines_before
+    make_links_clickable(log_text, "1.0", f"{added_lines + 1}.0")
+
+    # Keep the line the user was looking at at the top of the view
+    line, column = first_visible.split(".")
+    log_text.yview(f"{int(line) + added_lines}.{column}")
+
+    log_view["oldest"] = (logs[0][1], logs[0][0])
+    trim_log_view(log_text, from_end=True)
+    log_text["state"] = "disabled"
+    log_update_seconds.observe(time.perf_counter() - started)
+    return len(logs)
+
+def append_new_logs(log_text, connection_colors, selected_ip_port, limit=HISTORY_PAGE_SIZE, catch_up=False):
+    """
+    Append rows stored since the newest one on screen, replacing any transient
+    status lines written by log_callback, and trim the oldest rows if the
+    view grows past its caps. Returns the number of rows added.
+
+    While the view is detached (scrolled back past trimmed newer rows) this
+    only catches up when asked with catch_up, i.e. when the user scrolls to
+    the bottom; polling leaves it alone.
+    """
+    if log_view["detached"] and not catch_up:
+        return 0
+
+    started = time.perf_counter()
+    if log_view["newest_id"] is None:
+        logs = fetch_history_page(selected_ip_port, limit=limit)
+    else:
+        logs = fetch_new_rows(selected_ip_port, log_view["newest_id"], limit)
+    if not logs:
+        return 0
+
+    log_text["state"] = "normal"
+    transient = log_text.tag_ranges("transient")
+    for start, end in reversed(list(zip(transient[0::2], transient[1::2]))):
+        log_text.delete(start, end)
+    log_view["transient"] = 0
+
+    start_index = log_text.index("end-1c")
+    add_log_extents(insert_log_rows(log_text, logs, connection_colors))
+    make_links_clickable(log_text, start_index, "end")
+
+    if log_view["oldest"] is None:
+        log_view["oldest"] = (logs[0][1], logs[0][0])
+    log_view["newest_id"] = max(log_view["newest_id"] or 0, max(row[0] for row in logs))
+    if catch_up and len(logs) < limit:
+        log_view["detached"] = False  # Back at the live end
+    trim_log_view(log_text)
+    log_text["state"] = "disabled"
+    if not catch_up:
+        log_text.see("end")
+    log_update_seconds.observe(time.perf_counter() - started)
+    return len(logs)
+
 
 # Sound System
 def play_background_music(music_file, volume=0.5, loop=True):
@@ -661,7 +1012,7 @@ def set_volume(volume, channel=None):
 
 def init_sound():
     """
-    Initialize the pygame mixer with optimal settings and load sent/received sounds.
+    Initialize the pygame mixer with optimal settings and create the notification sounds.
     Returns True if initialization successful, False otherwise.
     """
     global sound_effects  # Explicitly use the global dictionary
@@ -676,14 +1027,15 @@ def init_sound():
         # Set up multiple channels for different sound types
         pygame.mixer.set_num_channels(8)  # Allow up to 8 simultaneous sounds
         
-        # Pre-load both notification sounds
+        # Synthesize the notification sounds in memory for the mixer's format:
+        # sent, received, and a received chime per connection colour
         try:
-            sound_effects['sent'] = pygame.mixer.Sound("sent.wav")
-            sound_effects['received'] = pygame.mixer.Sound("received.wav")
-            
-            # Set their volumes (can be adjusted as needed)
-            sound_effects['sent'].set_volume(0.3)
-            sound_effects['received'].set_volume(0.3)
+            frequency, size, channels = pygame.mixer.get_init()
+            if size != -16:
+                raise ValueError(f"unsupported mixer sample format {size}")
+            for name, buffer in sounds.notification_buffers(frequency, channels).items():
+                sound_effects[name] = pygame.mixer.Sound(buffer=buffer)
+                sound_effects[name].set_volume(0.3)  # Can be adjusted as needed
             
             print("Notification sounds loaded successfully")
         except Exception as e:
@@ -697,9 +1049,11 @@ def init_sound():
 
 def play_notification(sound_type='received', cooldown=0.1):
     """
-    Play either sent or received notification sound.
+    Play either sent or received notification sound. Call it on the Tk
+    thread only; last_sound_time is not locked.
     
-    :param sound_type: Type of sound to play ('sent' or 'received')
+    :param sound_type: Type of sound to play ('sent', 'received' or 'received:<hex colour>';
+                       an unknown colour falls back to 'received')
     :param cooldown: Minimum time between sounds
     """
     global last_sound_time, sound_effects
@@ -708,6 +1062,8 @@ def play_notification(sound_type='received', cooldown=0.1):
     if now - last_sound_time < cooldown:
         return
     
+    if sound_type not in sound_effects:
+        sound_type = sound_type.split(":")[0]
     try:
         if pygame.mixer.get_init() and sound_type in sound_effects:
             sound_effects[sound_type].play()
@@ -728,7 +1084,6 @@ def cleanup_sound():
 
 # Message History
 def send_and_clear(ip_dropdown, message_entry, log_text):
-    global history_index
     message = message_entry.get()
     if not message.strip():  # Skip sending empty messages
         return
@@ -743,34 +1098,86 @@ def send_and_clear(ip_dropdown, message_entry, log_text):
         return
 
     # Send the message
-    send_message(
-        ip, port, message,
-        lambda msg: log_callback(log_text, msg)
-    )
-    # Add to history and reset history index
-    message_history.append(message)
-    history_index = len(message_history)  # Reset to allow new input
+    send_message(ip, port, message)
+    # Add to the connection's history, which also resets Up/Down to a new line
+    input_history.add(f"{ip}:{port}", message, DB_PATH)
 
     # Clear the entry and reset focus
     message_entry.delete(0, tk.END)
     message_entry.focus()
 
-def navigate_history(event, message_entry):
-    global history_index
-    if not message_history:
-        return  # No history to navigate
-
-    if event.keysym == "Up":
-        history_index = max(0, history_index - 1)
-    elif event.keysym == "Down":
-        history_index = min(len(message_history), history_index + 1)
+def navigate_history(event, message_entry, ip_dropdown):
+    """Step through the selected connection's sent lines with Up and Down."""
+    connection = ip_dropdown.get()
+    if ":" not in connection:
+        return  # No connection selected, so no history to navigate
+    history_search["active"] = False
 
-    # Update the message entry if within bounds
-    if 0 <= history_index < len(message_history):
-        message_entry.delete(0, tk.END)
-        message_entry.insert(0, message_history[history_index])
-    elif history_index == len(message_history):  # Reset for new input
+    line = input_history.step(connection, -1 if event.keysym == "Up" else 1, DB_PATH)
+    if line is not None:
         message_entry.delete(0, tk.END)
+        message_entry.insert(0, line)
+
+def bind_history_search(message_entry, ip_dropdown, search_label):
+    """
+    Ctrl-R reverse incremental search through the selected connection's
+    input history, like a shell: typing narrows the prefix, Ctrl-R again
+    steps to older matches, Escape restores the original text and any
+    other key (Return included) keeps the match and carries on.
+    """
+    def show(failing=False):
+        match = history_search["match"]
+        label = "failing reverse-i-search" if failing else "reverse-i-search"
+        search_label.config(text=f"({label})`{history_search['prefix']}': {match[1] if match else ''}")
+        if match and not failing:
+            message_entry.delete(0, tk.END)
+            message_entry.insert(0, match[1])
+
+    def find(before=None):
+        connection = ip_dropdown.get()
+        match = input_history.search(connection, history_search["prefix"], before, DB_PATH) if ":" in connection else None
+        if match:
+            history_search["match"] = match
+        show(failing=match is None)
+
+    def end_search():
+        history_search["active"] = False
+        search_label.grid_remove()
+
+    def on_ctrl_r(event):
+        if history_search["active"]:
+            match = history_search["match"]
+            find(before=match[0] if match else None)
+        else:
+            history_search.update(active=True, prefix="", match=None, original=message_entry.get())
+            search_label.grid()
+            find()
+        return "break"
+
+    def on_key(event):
+        if not history_search["active"]:
+            return None
+        if event.keysym == "Escape":
+            message_entry.delete(0, tk.END)
+            message_entry.insert(0, history_search["original"])
+            end_search()
+            return "break"
+        if event.keysym == "BackSpace":
+            history_search["prefix"] = history_search["prefix"][:-1]
+            find()
+            return "break"
+        if event.char and event.char.isprintable() and not event.state & 0x4:  # 0x4: Control held
+            history_search["prefix"] += event.char
+            find()
+            return "break"
+        if event.keysym.startswith(("Shift", "Control", "Alt", "Caps")):
+            return None  # Modifier on its own
+        end_search()  # Accept the match and let the key do its usual job
+        return None
+
+    message_entry.bind("<Control-r>", on_ctrl_r)
+    message_entry.bind("<KeyPress>", on_key, add="+")
+    message_entry.bind("<FocusOut>", lambda event: end_search(), add="+")
 
 
 
@@ -827,38 +1234,86 @@ def on_connection_select(event, connections_listbox, log_text, current_log_label
 
     selection = connections_listbox.curselection()
     if selection:
-        selected_ip_port = connections_listbox.get(selection[0])
+        selected_ip_port = get_listbox_connection(connections_listbox, selection[0])
 
         if selected_ip_port == "All Messages":
             current_log_label.config(text="Logs for: All Messages")
         else:
             ip, port = selected_ip_port.split(":")
             current_log_label.config(text=f"Logs for: {ip}:{port}")
+            conversation_stats.mark_read(ip, DB_PATH)
+            update_connection_badges(connections_listbox)
+            update_title()
 
         # Update the custom dropdown variable if provided
         if custom_dropdown_var:
             custom_dropdown_var.set(selected_ip_port)  # Update the StringVar directly
 
-        # Fetch and display logs
-        fetch_and_display_logs(log_text, connection_colors, selected_ip_port)
+        # Show the conversation, from its saved view if it has one
+        switch_log_view(log_text, connection_colors, selected_ip_port)
+
+def get_listbox_connection(connections_listbox, index):
+    """
+    Return the "ip:port" key (or "All Messages") for a listbox row.
+    Row text may carry an unread badge, so the key comes from listbox_connections.
+    """
+    index = int(index)
+    if index < len(listbox_connections):
+        return listbox_connections[index]
+    return connections_listbox.get(index)
+
+def format_connection_label(key):
+    """Listbox text for a connection: its key plus an unread badge if any."""
+    if key == "All Messages":
+        unread = conversation_stats.total_unread()
+    else:
+        stats = conversation_stats.get_stats(key.split(":")[0])
+        unread = stats.unread_count if stats else 0
+    return f"{key} ({unread})" if unread else key
+
+def update_connection_badges(connections_listbox, connection_colors=None):
+    """
+    Re-sort the listbox by recent activity and refresh unread badges.
+    Reads only the in-memory conversation stats, so it is cheap to call from
+    the poll loop; it does nothing when the stats have not changed.
+    """
+    global listbox_stats_version
+    if connection_colors is None and conversation_stats.stats_version == listbox_stats_version:
+        return
+    listbox_stats_version = conversation_stats.stats_version
+
+    if connection_colors is None:
+        # Keep each row's color while reordering
+        connection_colors = {
+            key: connections_listbox.itemcget(idx, "fg")
+            for idx, key in enumerate(listbox_connections) if key != "All Messages"
+        }
+
+    selection = connections_listbox.curselection()
+    selected_key = get_listbox_connection(connections_listbox, selection[0]) if selection else None
+
+    keys = ["All Messages"] + conversation_stats.sort_by_activity(list(connection_colors))
+    listbox_connections[:] = keys
+    connections_listbox.delete(0, "end")
+    for idx, key in enumerate(keys):
+        connections_listbox.insert("end", format_connection_label(key))
+        color = "#FFFFFF" if key == "All Messages" else connection_colors[key]  # Default white for "All Messages"
+        if color and color.startswith("#"):  # Ensure the color is a valid hex
+            connections_listbox.itemconfig(idx, {"fg": color})
+
+    if selected_key in keys:
+        connections_listbox.selection_set(keys.index(selected_key))
 
 def refresh_connections(connections_listbox, custom_dropdown=None, selected_connection=None):
     """
     Refresh the connections listbox and update the custom dropdown with saved connections and colors.
+    The listbox is ordered by most recent activity, with "All Messages" first.
     """
     # Fetch all connections with their colors
     connections = [(f"{ip}:{port}", color) for ip, port, color in get_connections()]
-    connections_listbox.delete(0, "end")
-
-    # Add "All Messages" option
-    connections_listbox.insert("end", "All Messages")
-    connections_listbox.itemconfig(0, {"fg": "#FFFFFF"})  # Default white for "All Messages"
 
     # Populate the listbox with connections and their assigned colors
-    for idx, (conn, color) in enumerate(connections, start=1):
-        connections_listbox.insert("end", conn)
-        if color.startswith("#"):  # Ensure the color is a valid hex
-            connections_listbox.itemconfig(idx, {"fg": color})
+    update_connection_badges(connections_listbox, dict(connections))
 
     # Update the custom dropdown if provided
     if custom_dropdown:
@@ -894,7 +1349,7 @@ def bind_log_click(log_text, selected_connection, message_entry):
                 clicked_ip = ip_match.group(1)
                 
                 # Query database for the IP
-                conn = sqlite3.connect("chat_app.db")
+                conn = sqlite3.connect(DB_PATH)
                 cursor = conn.cursor()
                 cursor.execute("SELECT ip, port FROM connections WHERE ip = ? LIMIT 1", (clicked_ip,))
                 result = cursor.fetchone()
@@ -919,10 +1374,41 @@ def bind_log_click(log_text, selected_connection, message_entry):
 
 
 
+def open_stats_window(app):
+    """
+    Show a window with the live metrics, refreshed every second while open.
+    """
+    window = tk.Toplevel(app)
+    window.title("Stats")
+    window.geometry("700x400")
+    stats_text = tk.Text(window, wrap="none", state="disabled")
+    stats_text.pack(fill="both", expand=True)
+
+    def refresh():
+        if not window.winfo_exists():
+            return
+        stats_text["state"] = "normal"
+        stats_text.delete("1.0", "end")
+        stats_text.insert("end", metrics.format_snapshot())
+        stats_text["state"] = "disabled"
+        window.after(1000, refresh)
+
+    refresh()
+    return window
+
+
 # gui
-def create_gui():
+def create_gui(chat_nodes=None):
+    """
+    Build the main window around one or more chat nodes (identities).
+
+    :param chat_nodes: Nodes to drive, all on the window's database; defaults
+                       to a single default identity on DB_PATH that keeps the
+                       window's caches and summaries up to date.
+    """
+    global node, nodes, app
     app = tb.Window(themename="darkly")
-    app.title("Chat Application")
+    app.title(APP_TITLE)
     app.geometry("1000x800")
 
     # Define styles for the server button
@@ -962,21 +1448,50 @@ def create_gui():
 
     log_text = tk.Text(right_frame, wrap="word", state="disabled")
     log_scroll = ttk.Scrollbar(right_frame, orient="vertical", command=log_text.yview)
-    log_text["yscrollcommand"] = log_scroll.set
     log_text.grid(row=1, column=0, sticky="nsew")
     log_scroll.grid(row=1, column=1, sticky="ns")
 
-    # Add scroll handler for historical logs
-    def on_scrollbar_release(event):
-        first_visible = log_text.yview()[0]
-        if first_visible < 0.1:  # If we're near the top
-            current_selection = connections_listbox.curselection()
-            if current_selection:
-                selected_ip_port = connections_listbox.get(current_selection[0])
-                fetch_and_display_logs(log_text, fetch_connection_colors(), selected_ip_port, limit=500)
-
-    # Bind the scrollbar release event
-    log_scroll.bind("<ButtonRelease-1>", on_scrollbar_release)
+    # The nodes report status lines and messages into the log view
+    nodes = {chat_node.identity: chat_node for chat_node in (chat_nodes or [ChatNode(DB_PATH, update_views=True)])}
+    node = next(iter(nodes.values()))
+    for chat_node in nodes.values():
+        chat_node.log_callback = lambda msg: log_callback(log_text, msg)
+        if ALERT_KEYWORDS:
+            chat_node.pipeline.register("enrich", pipeline.keyword_alerts(ALERT_KEYWORDS))
+        chat_node.pipeline.register("render", lambda message: render_incoming(log_text, message), "render_incoming")
+    log_text.tag_configure("alert", background=COLOR_MAPPINGS["Sandy Brown"], foreground=COLOR_MAPPINGS["Charcoal Gray"])
+    log_text.after(RENDER_INTERVAL_MS, lambda: render_pending(log_text))
+    update_title(force=True)  # Unread left over from the last session
+
+    # Load the next older page whenever the view reaches the top, however it
+    # got there, and trimmed newer rows again when it reaches the bottom
+    page_pending = [False]
+
+    def load_page(newer):
+        page_pending[0] = False
+        current_selection = connections_listbox.curselection()
+        if current_selection:
+            selected_ip_port = get_listbox_connection(connections_listbox, current_selection[0])
+            if newer:
+                if selected_ip_port == log_view["selected"]:
+                    append_new_logs(log_text, fetch_connection_colors(), selected_ip_port, catch_up=True)
+            else:
+                load_older_logs(log_text, fetch_connection_colors(), selected_ip_port)
+
+    def on_log_scroll(first, last):
+        log_scroll.set(first, last)
+        at_top = float(first) <= 0.0 and float(last) < 1.0
+        at_bottom = float(last) >= 1.0 and float(first) > 0.0
+        if page_pending[0]:
+            return
+        if at_top and not log_view["exhausted"]:
+            page_pending[0] = True
+            log_text.after_idle(lambda: load_page(newer=False))
+        elif at_bottom and log_view["detached"]:
+            page_pending[0] = True
+            log_text.after_idle(lambda: load_page(newer=True))
+
+    log_text["yscrollcommand"] = on_log_scroll
 
     # Log controls
     log_control_frame = ttk.Frame(right_frame)
@@ -999,21 +1514,38 @@ def create_gui():
     )
     freeze_logs_button.pack(side="left", padx=5)
 
+    stats_button = ttk.Button(log_control_frame, text="Stats", command=lambda: open_stats_window(app))
+    stats_button.pack(side="left", padx=5)
+
     # Input Bar
     message_entry = ttk.Entry(input_frame, width=80)
     message_entry.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
     send_button = ttk.Button(input_frame, text="Send",
                               command=lambda: send_message(selected_connection.get().split(":")[0],
                                                            int(selected_connection.get().split(":")[1]),
-                                                           message_entry.get(),
-                                                           lambda msg: log_callback(log_text, msg)))
+                                                           message_entry.get()))
     send_button.grid(row=0, column=1, padx=5, pady=5)
 
+    # With several identities, choose which one messages are sent as
+    if len(nodes) > 1:
+        identity_names = {name or "default": name for name in nodes}
+        send_as = tk.StringVar(value=next(iter(identity_names)))
+        send_as_menu = ttk.Combobox(input_frame, textvariable=send_as, values=list(identity_names),
+                                    state="readonly", width=12)
+        send_as_menu.grid(row=0, column=2, padx=5, pady=5)
+        send_as_menu.bind("<<ComboboxSelected>>", lambda event: select_identity(identity_names[send_as.get()]))
+
     # Configure send button and key bindings
     send_button.configure(command=lambda: send_and_clear(selected_connection, message_entry, log_text))
     app.bind("<Return>", lambda event: send_and_clear(selected_connection, message_entry, log_text))
-    message_entry.bind("<Up>", lambda event: navigate_history(event, message_entry))
-    message_entry.bind("<Down>", lambda event: navigate_history(event, message_entry))
+    message_entry.bind("<Up>", lambda event: navigate_history(event, message_entry, selected_connection))
+    message_entry.bind("<Down>", lambda event: navigate_history(event, message_entry, selected_connection))
+
+    # Ctrl-R history search, with its prompt shown under the message box while active
+    search_label = ttk.Label(input_frame, text="")
+    search_label.grid(row=1, column=0, columnspan=3, padx=5, sticky="w")
+    search_label.grid_remove()
+    bind_history_search(message_entry, selected_connection, search_label)
 
     input_frame.grid_columnconfigure(0, weight=1)
 
@@ -1039,8 +1571,7 @@ def create_gui():
         config_frame,
         text="Start Server",
         command=lambda: toggle_server_status(
-            start_button, server_port_entry, message_queue,
-            lambda msg: log_callback(log_text, msg),
+            start_button, server_port_entry,
             connections_listbox, log_text, current_log_label, freeze_logs  # Pass freeze_logs here
         ),
         style="ServerStopped.TButton",  # Use the "stopped" style initially
@@ -1081,19 +1612,57 @@ def create_gui():
     return app
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Peer-to-peer chat client.")
+    parser.add_argument("--stats-port", type=int, default=STATS_PORT,
+                        help="Serve metrics on http://127.0.0.1:<port>/ (JSON) and /metrics (Prometheus).")
+    parser.add_argument("--profile", default=os.environ.get("PYCHATTER_PROFILE", ""),
+                        help="Comma-separated profiling modes: slow, cprofile, tracemalloc or all.")
+    parser.add_argument("--slow-ms", type=float, default=float(os.environ.get("PYCHATTER_SLOW_MS", PROFILE_SLOW_MS)),
+                        help="Log hot-path calls slower than this many milliseconds (with --profile slow).")
+    parser.add_argument("--capture", metavar="FILE",
+                        help="Record all received and sent messages to FILE for replay.py.")
+    parser.add_argument("--shards", type=int, default=LISTENER_SHARDS, metavar="N",
+                        help="Spread incoming connections over N listener processes (SO_REUSEPORT).")
+    args = parser.parse_args()
+    try:
+        args.profile = profiling.parse_modes(args.profile)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
 # go boldly forth
 if __name__ == "__main__":
     #update_db_schema()
+    args = parse_args()
+    # Wrap hot paths before anything calls them; nothing is wrapped when off
+    profiling.enable([ChatNode, sys.modules[__name__]], args.profile, args.slow_ms)
     try:
-        init_db()
+        if args.stats_port:
+            metrics.start_stats_server(args.stats_port)
+        init_db(DB_PATH)
+        conversation_stats.load_stats(DB_PATH)
+        maintenance.start_maintenance(db_path=DB_PATH)
         if init_sound():
             # Optional: Start background music
             # play_background_music("background.mp3", volume=0.3)
-            
-            message_queue = queue.Queue(maxsize=10)
-            app = create_gui()
+            identities = [ChatNode(DB_PATH, update_views=True, shards=args.shards)]
+            identities += [ChatNode(DB_PATH, port, update_views=True, identity=name, shards=args.shards)
+                           for name, port in IDENTITIES.items()]
+            if args.capture:
+                shared_capture = TrafficCapture(args.capture)  # One file for every identity
+                for chat_node in identities:
+                    chat_node.start_capture(shared_capture)
+            app = create_gui(identities)
             app.mainloop()
     except Exception as e:
         print(f"Unhandled exception: {e}")
     finally:
-        cleanup_sound()
\ No newline at end of file
+        if purge["stop_event"] is not None:
+            purge["stop_event"].set()  # The batch in progress commits or rolls back; the rest stays
+        for chat_node in nodes.values():
+            chat_node.close()
+        maintenance.stop_maintenance()
+        cleanup_sound()
+        profiling.finish()
\ No newline at end of file
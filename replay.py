@@ -0,0 +1,234 @@
+import argparse
+import datetime
+import json
+import os
+import queue
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import capture
+from bench_throughput import current_commit, free_port, peak_rss_mb, percentile, wait_for_listener
+from chat_node import ChatNode, init_db, unpack_batch
+
+
+def peer_addresses(messages):
+    """
+    Give every recorded peer IP its own loopback source address
+    (127.0.x.y), so replayed traffic keeps its per-peer conversations.
+    """
+    addresses = {}
+    for message in messages:
+        if message.ip not in addresses:
+            n = len(addresses)
+            addresses[message.ip] = f"127.0.{n // 250}.{n % 250 + 1}"
+    return addresses
+
+def message_count(message):
+    """Chat messages in a captured record: a coalesced write holds several."""
+    return len(unpack_batch(message.payload))
+
+def deliver(port, payload, source, host="127.0.0.1"):
+    """Send one payload the way a peer does: connect, send, close."""
+    try:
+        client_socket = socket.create_connection((host, port), source_address=(source, 0) if source else None)
+    except OSError:
+        if not source:
+            raise
+        client_socket = socket.create_connection((host, port))  # Platform without 127/8 loopback sources
+    with client_socket:
+        client_socket.sendall(payload)
+
+def replay(messages, port, speed=1.0, outbound_node=None, sink_port=None, senders=8, spread_peers=True,
+           host="127.0.0.1"):
+    """
+    Play captured messages against a listener.
+
+    Inbound messages are sent to host:port as their peers sent them.
+    Outbound messages go through outbound_node.send_message to sink_port,
+    exercising the send and persistence path; without a node they are skipped.
+
+    :param speed: 1 for real time, 10 for ten times faster, 0 for as fast as possible.
+    :param senders: Threads delivering inbound messages, so slow connects do not delay the schedule.
+    :return: Dict with counts, duration and how late messages went out relative to the schedule.
+    """
+    addresses = peer_addresses(messages) if spread_peers else {}
+    work = queue.Queue(maxsize=senders * 4)
+    counts = {"inbound": 0, "outbound": 0, "skipped": 0, "errors": 0}
+    lateness = []
+    lock = threading.Lock()
+
+    def sender():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            payload, source = item
+            try:
+                deliver(port, payload, source, host)
+            except OSError:
+                with lock:
+                    counts["errors"] += 1
+
+    threads = [threading.Thread(target=sender, daemon=True) for _ in range(senders)]
+    for thread in threads:
+        thread.start()
+
+    started = time.perf_counter()
+    for message in messages:
+        if speed:
+            due = started + message.offset / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            lateness.append(max(0.0, time.perf_counter() - due))
+
+        if message.direction == capture.INBOUND:
+            work.put((message.payload, addresses.get(message.ip)))
+            counts["inbound"] += message_count(message)
+        elif outbound_node is not None and sink_port:
+            outbound_node.send_message("127.0.0.1", sink_port, message.payload.decode("utf-8", "replace"))
+            counts["outbound"] += 1
+        else:
+            counts["skipped"] += 1
+
+    for _ in threads:
+        work.put(None)
+    for thread in threads:
+        thread.join()
+
+    late_ms = sorted(value * 1000 for value in lateness)
+    return {
+        **counts,
+        "duration_s": round(time.perf_counter() - started, 3),
+        "schedule_lateness_ms": {
+            "p50": round(percentile(late_ms, 50), 3) if late_ms else None,
+            "p99": round(percentile(late_ms, 99), 3) if late_ms else None,
+            "max": round(late_ms[-1], 3) if late_ms else None,
+        },
+    }
+
+
+def run_replay(capture_path, speed=1.0, outbound=False, senders=8, spread_peers=True, timeout=60.0, port=None):
+    """
+    Replay a capture against a fresh local node with its own database and
+    wait until everything delivered has been persisted.
+
+    :param port: Replay against an already running listener on this port
+                 instead of starting a node (nothing is measured on its side).
+    """
+    messages = list(capture.read_capture(capture_path))
+    if not messages:
+        raise ValueError(f"'{capture_path}' holds no messages.")
+
+    persisted = []
+    persisted_lock = threading.Lock()
+    all_persisted = threading.Event()
+    expected = {"count": 0}
+
+    def on_persisted(row):
+        if row[7]:  # Count received rows; outbound copies are stored by the sender side
+            with persisted_lock:
+                persisted.append(time.perf_counter())
+                if expected["count"] and len(persisted) >= expected["count"]:
+                    all_persisted.set()
+
+    workdir = tempfile.mkdtemp(prefix="pychatter-replay-")
+    node = sink = None
+    log_lines = []
+    try:
+        if port is None:
+            db_path = os.path.join(workdir, "replay.db")
+            init_db(db_path)
+            port = free_port()
+            node = ChatNode(db_path, port, log_callback=log_lines.append, message_callback=on_persisted)
+            if not node.start():
+                raise RuntimeError(f"Could not start a listener: {log_lines[-1] if log_lines else 'unknown error'}")
+            wait_for_listener(port)
+
+        sender_node = None
+        sink_port = None
+        if outbound:
+            # Outbound traffic is sent through a second node to a sink listener
+            sink_port = free_port()
+            sink = ChatNode(os.path.join(workdir, "sink.db"), sink_port, log_callback=log_lines.append)
+            sink.init_db()
+            sink.start()
+            wait_for_listener(sink_port)
+            sender_node = ChatNode(os.path.join(workdir, "sink.db"), log_callback=log_lines.append)
+
+        expected["count"] = sum(message_count(message) for message in messages if message.direction == capture.INBOUND)
+        started = time.perf_counter()
+        result = replay(messages, port, speed, sender_node, sink_port, senders, spread_peers)
+        if node is not None:
+            with persisted_lock:
+                if len(persisted) >= expected["count"]:
+                    all_persisted.set()
+            all_persisted.wait(timeout)
+        with persisted_lock:
+            persisted_count = len(persisted)
+            finished = max(persisted) if persisted else time.perf_counter()
+    finally:
+        for chat_node in (node, sink):
+            if chat_node is not None:
+                chat_node.close()
+
+    recorded_span = messages[-1].offset - messages[0].offset
+    elapsed = finished - started
+    return {
+        "benchmark": "replay",
+        "capture": os.path.abspath(capture_path),
+        "commit": current_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "params": {"speed": speed, "outbound": outbound, "senders": senders, "spread_peers": spread_peers},
+        "messages": len(messages),
+        "recorded_span_s": round(recorded_span, 3),
+        **result,
+        "persisted": persisted_count if node is not None else None,
+        "persisted_msgs_per_s": round(persisted_count / elapsed, 1) if node is not None and elapsed > 0 else None,
+        "rss_peak_mb": round(peak_rss_mb(), 1) if peak_rss_mb() is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a traffic capture (python pychatter.py --capture FILE) against a local node.")
+    parser.add_argument("capture", help="Capture file to replay.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--speed", type=float, default=1.0, help="Playback speed: 1 = real time, 10 = ten times faster.")
+    mode.add_argument("--fast", action="store_true", help="Ignore the recorded timing and send as fast as possible.")
+    parser.add_argument("--outbound", action="store_true", help="Also replay sent messages through a node's send path.")
+    parser.add_argument("--senders", type=int, default=8, help="Threads delivering inbound messages.")
+    parser.add_argument("--same-source", action="store_true",
+                        help="Send every peer's messages from 127.0.0.1 instead of one loopback address per peer.")
+    parser.add_argument("--port", type=int, help="Replay against a listener already running on this port (e.g. the GUI).")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for messages to be persisted.")
+    parser.add_argument("-o", "--output", help="Write the JSON result here (default: bench_results/replay-<commit>-<time>.json).")
+    args = parser.parse_args()
+
+    result = run_replay(args.capture, 0 if args.fast else args.speed, args.outbound, args.senders,
+                        not args.same_source, args.timeout, args.port)
+
+    output = args.output
+    if not output:
+        os.makedirs("bench_results", exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join("bench_results", f"replay-{result['commit'] or 'nogit'}-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as outfile:
+        json.dump(result, outfile, indent=2)
+
+    lateness = result["schedule_lateness_ms"]
+    print(f"Replayed {result['inbound']} inbound and {result['outbound']} outbound messages "
+          f"(recorded over {result['recorded_span_s']}s) in {result['duration_s']}s")
+    if result["persisted"] is not None:
+        print(f"{result['persisted']}/{result['inbound']} persisted ({result['persisted_msgs_per_s']} msg/s)")
+    if lateness["p50"] is not None:
+        print(f"Schedule lateness ms: p50 {lateness['p50']}  p99 {lateness['p99']}  max {lateness['max']}")
+    if result["errors"]:
+        print(f"WARNING: {result['errors']} messages could not be delivered")
+    print(f"Saved results to '{output}'.")
+
+if __name__ == "__main__":
+    main()
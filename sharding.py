@@ -0,0 +1,137 @@
+import multiprocessing
+import queue
+import signal
+import socket
+import sys
+import threading
+import time
+
+# Events shard processes send their coordinator: (kind, shard number, value)
+SHARD_READY = "ready"      # value: True if the shard's listener is up
+SHARD_LOG = "log"          # value: a status line
+SHARD_MESSAGE = "message"  # value: a persisted message row
+SHARD_EXIT = "exit"        # value: None
+
+READY_TIMEOUT = 10.0  # seconds a shard may take to bind before start() gives up on it
+STOP_TIMEOUT = 5.0    # seconds a shard may take to finish its messages after stop()
+
+
+def reuse_port_supported():
+    """True where several processes can listen on one port (Linux, BSD, macOS)."""
+    return hasattr(socket, "SO_REUSEPORT") and not sys.platform.startswith("win")
+
+def shard_main(db_path, port, host, backlog, identity, shard, events, stop_event):
+    """
+    Shard process: listen on the shared port and persist what arrives,
+    reporting status lines and stored rows to the coordinator until told to stop.
+    """
+    from chat_node import ChatNode  # Imported here: chat_node imports this module
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C is the coordinator's to handle
+    node = ChatNode(db_path, port, host=host, backlog=backlog, identity=identity, reuse_port=True,
+                    log_callback=lambda text: events.put((SHARD_LOG, shard, text)),
+                    message_callback=lambda row: events.put((SHARD_MESSAGE, shard, row)))
+    started = node.start()
+    events.put((SHARD_READY, shard, started))
+    if started:
+        stop_event.wait()
+    node.close()
+    events.put((SHARD_EXIT, shard, None))
+
+
+class ListenerShards:
+    """
+    Listener processes sharing one port through SO_REUSEPORT, so the kernel
+    spreads incoming connections across them and decoding and storing run
+    outside the coordinator's GIL. Each shard runs its own ChatNode on the
+    coordinator node's database; status lines and stored rows come back
+    over a multiprocessing queue and are handed to node.relay_stored on a
+    relay thread, so the coordinator's notify and render plugins still see
+    every message.
+    """
+
+    def __init__(self, node, count):
+        """
+        :param node: The coordinating ChatNode; its database, host, backlog and identity are used.
+        :param count: Shard processes to run.
+        """
+        self.node = node
+        self.count = count
+        self.context = multiprocessing.get_context("spawn")  # Don't fork a process that runs Tk and threads
+        self.events = None
+        self.stop_event = None
+        self.processes = []
+        self.relay_thread = None
+
+    def start(self, port):
+        """
+        Start the shards and wait until each has bound the port.
+
+        :return: True if every shard is listening; otherwise the shards are stopped again.
+        """
+        self.events = self.context.Queue()
+        self.stop_event = self.context.Event()
+        self.processes = [
+            self.context.Process(target=shard_main, name=f"pychatter-shard-{shard}", daemon=True,
+                                 args=(self.node.db_path, port, self.node.host, self.node.backlog,
+                                       self.node.identity, shard, self.events, self.stop_event))
+            for shard in range(self.count)
+        ]
+        for process in self.processes:
+            process.start()
+
+        ready = {}
+        deadline = time.monotonic() + READY_TIMEOUT
+        while len(ready) < self.count and time.monotonic() < deadline:
+            try:
+                kind, shard, value = self.events.get(timeout=0.1)
+            except queue.Empty:
+                if not any(process.is_alive() for shard, process in enumerate(self.processes) if shard not in ready):
+                    break  # A shard died before reporting (failed import, killed)
+                continue
+            if kind == SHARD_READY:
+                ready[shard] = value
+            else:
+                self.handle(kind, value)
+
+        self.relay_thread = threading.Thread(target=self.relay, name="shard-relay", daemon=True)
+        self.relay_thread.start()
+        if len(ready) < self.count or not all(ready.values()):
+            self.node.log(f"Only {sum(ready.values())} of {self.count} listener shards started.")
+            self.stop()
+            return False
+        return True
+
+    def stop(self):
+        """Let every shard finish the messages it holds, then end the relay thread."""
+        if self.stop_event is None:
+            return
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(STOP_TIMEOUT)
+            if process.is_alive():
+                self.node.log(f"Listener shard {process.name} did not stop in time; terminating it.")
+                process.terminate()
+                process.join()
+        self.events.put(None)  # Everything the shards sent is queued ahead of this
+        self.relay_thread.join()
+        self.processes = []
+        self.stop_event = None
+
+    def relay(self):
+        """Relay thread: pass shard events on to the coordinating node."""
+        while True:
+            event = self.events.get()
+            if event is None:
+                return
+            kind, shard, value = event
+            self.handle(kind, value)
+
+    def handle(self, kind, value):
+        try:
+            if kind == SHARD_MESSAGE:
+                self.node.relay_stored(value)
+            elif kind == SHARD_LOG and self.node.log_callback:
+                self.node.log_callback(value)  # Already tagged with the identity by the shard's node
+        except Exception as e:
+            print(f"Error relaying a shard event: {e}")  # The log callback itself may be what failed
@@ -0,0 +1,130 @@
+import functools
+
+import numpy as np
+
+from config import AVAILABLE_COLORS, COLOR_MAPPINGS
+
+
+SAMPLE_RATE = 44100
+SYNTH_VERSION = 1  # Bump when render() changes how the same parameters sound
+
+# Parameters of render() for each notification sound, by preset name. These
+# are the sounds make_wavs.py used to hard-code: "chime" is the default,
+# "ding", "soft-click" and "click" are the alternatives.
+PRESETS = {
+    "chime": {
+        "sent": {"frequency": 800, "duration": 0.1, "tone_duration": 0.02, "attack": 0.02, "decay": 200, "amplitude": 0.75},
+        "received": {"frequency": 1000, "duration": 0.1, "harmonic": 1.7, "harmonic_mix": 0.4, "decay": 40, "amplitude": 0.5},
+    },
+    "ding": {
+        "sent": {"frequency": 1000, "duration": 0.1, "tone_duration": 0.02, "decay": 200, "amplitude": 0.3},
+        "received": {"frequency": 1000, "duration": 0.1, "decay": 20, "amplitude": 0.3},
+    },
+    "soft-click": {
+        "sent": {"frequency": 800, "duration": 0.05, "tone_duration": 0.02, "attack": 0.02, "decay": 200, "amplitude": 0.25},
+        "received": {"frequency": 800, "duration": 0.05, "tone_duration": 0.02, "attack": 0.02, "decay": 200,
+                     "amplitude": 0.25, "reverse": True},
+    },
+    "click": {
+        "sent": {"frequency": 800, "duration": 0.05, "tone_duration": 0.02, "attack": 0.02, "decay": 200, "amplitude": 0.75},
+        "received": {"frequency": 800, "duration": 0.05, "tone_duration": 0.02, "attack": 0.02, "decay": 200,
+                     "amplitude": 0.75, "reverse": True},
+    },
+}
+
+# Semitone steps of a major pentatonic scale; tone variants walk up it so
+# neighbouring variants stay distinct without clashing
+PENTATONIC_STEPS = (0, 2, 4, 7, 9)
+COLOUR_BASE_FREQUENCY = 523.25  # C5
+
+
+def render(frequency, duration, sample_rate=SAMPLE_RATE, tone_duration=np.nan, harmonic=1.0, harmonic_mix=0.0,
+           attack=0.0, decay=0.0, amplitude=0.5, reverse=False):
+    """
+    Render a batch of sounds in one NumPy pass. Every parameter is a scalar
+    or a sequence with one value per sound, broadcast against each other.
+    Each sound is a sine plus an optional harmonic, shaped by a linear
+    attack and an exponential decay.
+
+    :param frequency: Main tone in Hz.
+    :param duration: Length of the sound in seconds.
+    :param sample_rate: Samples per second.
+    :param tone_duration: Seconds of tone before silence (NaN for the whole duration).
+    :param harmonic: Ratio of the second tone's frequency to the main one.
+    :param harmonic_mix: Share of the second tone, 0 for none.
+    :param attack: Seconds of linear fade-in, 0 for none.
+    :param decay: Exponential fade-out rate, 0 for none.
+    :param amplitude: Peak level, at most 1.
+    :param reverse: Play the sound backwards, so it swells into the end.
+    :return: (samples, lengths): float samples of shape (sounds, longest) with
+             zeros past each sound's end, and each sound's length in samples.
+    """
+    (frequency, duration, sample_rate, tone_duration, harmonic, harmonic_mix, attack, decay, amplitude,
+     reverse) = np.broadcast_arrays(*(np.atleast_1d(np.asarray(value, dtype=float)) for value in (
+        frequency, duration, sample_rate, tone_duration, harmonic, harmonic_mix, attack, decay, amplitude, reverse)))
+    lengths = (duration * sample_rate).astype(int)
+    tone_lengths = np.where(np.isnan(tone_duration), lengths, (np.nan_to_num(tone_duration) * sample_rate).astype(int))
+
+    n = np.arange(lengths.max())
+    t = n / sample_rate[:, None]
+    tone = ((1 - harmonic_mix[:, None]) * np.sin(2 * np.pi * frequency[:, None] * t)
+            + harmonic_mix[:, None] * np.sin(2 * np.pi * frequency[:, None] * harmonic[:, None] * t))
+    envelope = np.exp(-decay[:, None] * t)
+    envelope *= np.where(attack[:, None] > 0, np.clip(t / np.where(attack > 0, attack, 1)[:, None], 0, 1), 1)
+    samples = np.where(n < tone_lengths[:, None], tone * envelope * amplitude[:, None], 0.0)
+
+    if reverse.any():
+        index = np.where(reverse[:, None] > 0, lengths[:, None] - 1 - n, n)
+        samples = np.take_along_axis(samples, np.clip(index, 0, len(n) - 1), axis=1)
+    samples[n >= lengths[:, None]] = 0.0
+    return samples, lengths
+
+def render_specs(specs, sample_rate=SAMPLE_RATE):
+    """
+    Render a list of render() keyword dicts as one batch.
+
+    :return: (samples, lengths) as from render().
+    """
+    defaults = {"tone_duration": np.nan, "harmonic": 1.0, "harmonic_mix": 0.0, "attack": 0.0, "decay": 0.0,
+                "amplitude": 0.5, "reverse": False, "sample_rate": sample_rate}
+    keys = ("frequency", "duration", *defaults)
+    columns = {key: [spec.get(key, defaults.get(key)) for spec in specs] for key in keys}
+    return render(**columns)
+
+def scale_frequencies(count, base=COLOUR_BASE_FREQUENCY, octaves=None):
+    """
+    Frequencies of count tones rising through the pentatonic scale from base.
+
+    :param octaves: Wrap back to base after this many octaves (None to keep rising).
+    """
+    index = np.arange(count)
+    if octaves:
+        index = index % (octaves * len(PENTATONIC_STEPS))
+    semitones = np.take(PENTATONIC_STEPS, index % len(PENTATONIC_STEPS)) + 12 * (index // len(PENTATONIC_STEPS))
+    return base * 2.0 ** (semitones / 12)
+
+def to_pcm(samples, channels=1):
+    """Convert float samples to interleaved signed 16-bit PCM with the same signal on every channel."""
+    pcm = (np.clip(samples, -1, 1) * 32767).astype(np.int16)
+    return np.repeat(pcm, channels, axis=-1) if channels > 1 else pcm
+
+@functools.lru_cache(maxsize=None)
+def notification_buffers(sample_rate=SAMPLE_RATE, channels=2, preset="chime"):
+    """
+    Raw PCM of every notification sound, ready for pygame.mixer.Sound(buffer=...).
+    Computed once per mixer format; the preset's sounds and a received chime
+    for every connection colour come out of one render() batch.
+
+    :return: Name -> bytes: "sent", "received" and "received:<hex colour>" per
+             colour, keyed by the hex value connections are stored with (e.g. "received:#FF0000").
+             Treat the dict as read-only; it is shared by every caller.
+    """
+    sounds = PRESETS[preset]
+    colour_chime = dict(PRESETS["chime"]["received"])
+    specs = [sounds["sent"], sounds["received"]]
+    specs += [dict(colour_chime, frequency=frequency) for frequency in scale_frequencies(len(AVAILABLE_COLORS))]
+    samples, lengths = render_specs(specs, sample_rate)
+    pcm = to_pcm(samples, channels)
+
+    names = ["sent", "received"] + [f"received:{COLOR_MAPPINGS[colour]}" for colour in AVAILABLE_COLORS]
+    return {name: row[:length * channels].tobytes() for name, row, length in zip(names, pcm, lengths)}
@@ -0,0 +1,101 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from chat_node import BATCH_MAGIC, ChatNode, init_db, pack_batch, unpack_batch
+
+
+class LegacyPeer:
+    """
+    A listener that behaves like a peer from before batching: every
+    connection is one message, stored exactly as its bytes arrived.
+    """
+
+    def __init__(self):
+        self.server_socket = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server_socket.getsockname()[1]
+        self.received = []
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.server_socket.accept()
+            except OSError:
+                return  # Closed
+            with conn:
+                chunks = []
+                while chunk := conn.recv(65536):
+                    chunks.append(chunk)
+            self.received.append(b"".join(chunks))
+
+    def close(self):
+        self.server_socket.close()
+
+
+class CoalescingTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="pychatter-test-")
+        self.db_path = os.path.join(self.workdir, "chat.db")
+        init_db(self.db_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def send_burst(self, node, port, messages):
+        done = threading.Semaphore(0)
+        errors = []
+        for message in messages:
+            node.queue_message("127.0.0.1", port, message, callback=lambda error: (errors.append(error), done.release()))
+        for _ in messages:
+            self.assertTrue(done.acquire(timeout=10))
+        node.close()
+        return errors
+
+    def test_legacy_peer_receives_readable_messages_by_default(self):
+        peer = LegacyPeer()
+        messages = [f"line {n}" for n in range(20)]
+        try:
+            errors = self.send_burst(ChatNode(self.db_path), peer.port, messages)
+        finally:
+            peer.close()
+        self.assertEqual(errors, [None] * len(messages))
+        self.assertEqual([payload.decode() for payload in peer.received], messages)
+        self.assertFalse(any(payload.startswith(BATCH_MAGIC) for payload in peer.received))
+
+    def test_coalesced_burst_is_split_by_the_receiver(self):
+        stored = []
+        all_stored = threading.Event()
+        messages = [f"line {n}" for n in range(20)]
+
+        def on_stored(row):
+            stored.append(row[4])
+            if len(stored) == len(messages):
+                all_stored.set()
+
+        receiver = ChatNode(self.db_path, 0, message_callback=on_stored, host="127.0.0.1")
+        self.assertTrue(receiver.start())
+        port = receiver.server_socket.getsockname()[1]
+        try:
+            sender = ChatNode(os.path.join(self.workdir, "sender.db"), coalesce_max_messages=100)
+            sender.init_db()
+            self.send_burst(sender, port, messages)
+            self.assertTrue(all_stored.wait(10))
+        finally:
+            receiver.close()
+        self.assertEqual(stored, messages)
+
+    def test_unpack_batch(self):
+        payloads = [b"one", b"", "two é".encode()]
+        self.assertEqual(unpack_batch(pack_batch(payloads)), payloads)
+        self.assertEqual(unpack_batch(b"plain"), [b"plain"])
+        truncated = pack_batch([b"abcdef"])[:-2]
+        self.assertEqual(unpack_batch(truncated), [truncated])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import history_io
+from chat_node import init_db
+
+
+MESSAGES = [
+    ("2024-01-01 10:00:00", "10.0.0.1", 6443, "héllo", "success", "öps", 1),
+    ("2024-01-01 10:00:01", "10.0.0.1", 6443, "reply", "failed", "", 0),
+    ("2024-01-01 10:00:02", "10.0.0.2", 6444, "from an old row", "success", "", None),
+]
+
+
+class HistoryRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="pychatter-test-")
+        self.source = self.new_db("source.db")
+        conn = sqlite3.connect(self.source)
+        conn.executemany("INSERT INTO messages (timestamp, ip, port, message, delivery_status, identity, incoming) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)", MESSAGES)
+        conn.execute("INSERT INTO connections (ip, port, color) VALUES ('10.0.0.1', 6443, '#FF0000')")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def new_db(self, name):
+        path = os.path.join(self.workdir, name)
+        init_db(path)
+        return path
+
+    def stored_messages(self, db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute("SELECT timestamp, ip, port, message, delivery_status, identity, incoming "
+                                "FROM messages ORDER BY id").fetchall()
+        finally:
+            conn.close()
+
+    def import_file(self, name, content, mode="w"):
+        path = os.path.join(self.workdir, name)
+        with open(path, mode) as outfile:
+            outfile.write(content)
+        target = self.new_db(f"{name}.db")
+        history_io.import_history(path, db_path=target)
+        return self.stored_messages(target)
+
+    def test_every_format_keeps_identity_and_direction(self):
+        for fmt in history_io.FORMATS:
+            with self.subTest(fmt=fmt):
+                path = os.path.join(self.workdir, f"history.{fmt}")
+                self.assertEqual(history_io.export_history(path, fmt, self.source), len(MESSAGES) + 1)
+                target = self.new_db(f"{fmt}.db")
+                self.assertEqual(history_io.import_history(path, fmt, target), len(MESSAGES) + 1)
+                self.assertEqual(self.stored_messages(target), MESSAGES)
+
+    def test_old_jsonl_imports_with_defaults(self):
+        record = {"table": "messages", "timestamp": "2024-01-01 10:00:00", "ip": "10.0.0.1", "port": 6443,
+                  "message": "old", "delivery_status": "success"}
+        self.assertEqual(self.import_file("old.jsonl", json.dumps(record) + "\n"),
+                         [("2024-01-01 10:00:00", "10.0.0.1", 6443, "old", "success", "", None)])
+
+    def test_old_csv_imports_with_defaults(self):
+        content = ("table,timestamp,ip,port,message,delivery_status,color\n"
+                   "messages,2024-01-01 10:00:00,10.0.0.1,6443,old,success,\n")
+        self.assertEqual(self.import_file("old.csv", content),
+                         [("2024-01-01 10:00:00", "10.0.0.1", 6443, "old", "success", "", None)])
+
+    def test_version_1_binary_imports_with_defaults(self):
+        timestamp, ip, status, message = b"2024-01-01 10:00:00", b"10.0.0.1", b"success", b"old"
+        content = (history_io.BINARY_MAGIC_V1
+                   + history_io.RECORD_HEADER_V1.pack(b"M", 6443, len(timestamp), len(ip), len(status), len(message))
+                   + timestamp + ip + status + message)
+        self.assertEqual(self.import_file("old.bin", content, "wb"),
+                         [("2024-01-01 10:00:00", "10.0.0.1", 6443, "old", "success", "", None)])
+
+    def test_truncated_binary_record_is_rejected(self):
+        record = history_io.pack_record(b"M", "2024-01-01 10:00:00", "10.0.0.1", 6443, "success", "hello", "", 1)
+        with self.assertRaises(ValueError):
+            list(history_io.read_binary(io.BytesIO(history_io.BINARY_MAGIC + record[:-2])))
+        with self.assertRaises(ValueError):
+            list(history_io.read_binary(io.BytesIO(history_io.BINARY_MAGIC + record[:3])))
+
+
+if __name__ == "__main__":
+    unittest.main()
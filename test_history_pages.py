@@ -0,0 +1,106 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import message_cache
+import pychatter
+from chat_node import ChatNode, init_db
+
+
+def row(row_id, timestamp, ip="10.0.0.1"):
+    return (row_id, timestamp, ip, 6443, "text", "success", "", 1)
+
+
+class HistoryPagesTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="pychatter-test-")
+        self.db_path = os.path.join(self.workdir, "chat.db")
+        init_db(self.db_path)
+        self.saved_db_path = pychatter.DB_PATH
+        pychatter.DB_PATH = self.db_path
+        message_cache.invalidate()
+        self.node = ChatNode(self.db_path, update_views=True)
+
+    def tearDown(self):
+        pychatter.DB_PATH = self.saved_db_path
+        message_cache.invalidate()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def store(self, timestamp, ip="10.0.0.1"):
+        return self.node.save_message(timestamp, ip, 6443, f"at {timestamp}", incoming=True)
+
+    def test_pages_walk_back_by_timestamp_without_gaps(self):
+        ids = [self.store(f"2024-01-01 10:00:{n:02d}") for n in range(25)]
+        self.store("2024-01-01 10:00:30", ip="10.0.0.2")
+        message_cache.invalidate()
+
+        seen = []
+        before = None
+        while True:
+            page = pychatter.fetch_history_page("10.0.0.1:6443", before, limit=10)
+            if not page:
+                break
+            seen[:0] = [entry[0] for entry in page]
+            before = (page[0][1], page[0][0])
+        self.assertEqual(seen, ids)
+
+    def test_new_rows_include_a_late_row_with_an_earlier_timestamp(self):
+        first = self.store("2024-01-01 10:00:05")
+        late = self.store("2024-01-01 10:00:01")
+        self.assertEqual([entry[0] for entry in pychatter.fetch_new_rows("10.0.0.1:6443", first)], [late])
+
+    def test_new_rows_need_no_query_when_nothing_was_stored(self):
+        newest = self.store("2024-01-01 10:00:00")
+        os.rename(self.db_path, self.db_path + ".moved")  # A query would now fail on an empty database
+        try:
+            self.assertEqual(pychatter.fetch_new_rows("10.0.0.1:6443", newest), [])
+        finally:
+            os.rename(self.db_path + ".moved", self.db_path)
+
+    def test_live_tail_plan_uses_an_index(self):
+        conn = sqlite3.connect(self.db_path)
+        plan = [step[3] for step in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM messages WHERE id > ? AND ip = ? ORDER BY id LIMIT 100", (0, "10.0.0.1"))]
+        conn.close()
+        self.assertFalse(any(step.startswith("SCAN") or "TEMP B-TREE" in step for step in plan), plan)
+
+
+class RecentMessagesTest(unittest.TestCase):
+    def setUp(self):
+        message_cache.invalidate()
+
+    def tearDown(self):
+        message_cache.invalidate()
+
+    def cached_ids(self, key="10.0.0.1"):
+        return [entry[0] for entry in message_cache.recent_messages[key].rows]
+
+    def test_late_row_is_inserted_in_order(self):
+        for entry in (row(1, "10:00"), row(2, "10:02"), row(3, "10:01")):
+            message_cache.add(entry)
+        self.assertEqual(self.cached_ids(), [1, 3, 2])
+        self.assertEqual(self.cached_ids(message_cache.ALL_MESSAGES), [1, 3, 2])
+        message_cache.add(row(3, "10:01"))  # Seen again
+        self.assertEqual(self.cached_ids(), [1, 3, 2])
+
+    def test_row_older_than_the_cached_run_is_left_out(self):
+        message_cache.add(row(1, "10:00"))
+        message_cache.add(row(2, "09:00"))
+        self.assertEqual(self.cached_ids(), [1])
+
+    def test_full_ring_keeps_its_size_accounted(self):
+        size = message_cache.RECENT_CACHE_PER_CONVERSATION
+        for n in range(size + 5):
+            message_cache.add(row(n + 1, f"{n:08d}"))
+        message_cache.add(row(size + 100, f"{size:08d}"))
+        ring = message_cache.recent_messages["10.0.0.1"]
+        self.assertEqual(len(ring.rows), size)
+        cursors = [message_cache.cursor_of(entry) for entry in ring.rows]
+        self.assertEqual(cursors, sorted(cursors))
+        self.assertEqual(message_cache.cache_size, sum(ring.size for ring in message_cache.recent_messages.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
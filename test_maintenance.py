@@ -0,0 +1,79 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import maintenance
+from chat_node import init_db
+
+
+def fill_messages(db_path, ip, count):
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO messages (timestamp, ip, port, message, delivery_status) VALUES (?, ?, 6443, ?, 'success')",
+                     [(f"2024-01-01 10:{n // 60 % 60:02d}:{n % 60:02d}", ip, "x" * 500) for n in range(count)])
+    conn.commit()
+    conn.close()
+
+def pragma(db_path, name):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f"PRAGMA {name}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+class PurgeTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="pychatter-test-")
+        self.db_path = os.path.join(self.workdir, "chat.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def test_purge_deletes_one_conversation_and_frees_its_pages(self):
+        init_db(self.db_path)
+        fill_messages(self.db_path, "10.0.0.1", 3000)
+        fill_messages(self.db_path, "10.0.0.2", 10)
+        progress = []
+        deleted = maintenance.purge_conversation("10.0.0.1", self.db_path, batch_size=1000, pause=0,
+                                                 progress=lambda done, total: progress.append((done, total)))
+        self.assertEqual(deleted, 3000)
+        self.assertEqual(progress, [(1000, 3000), (2000, 3000), (3000, 3000)])
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("SELECT ip, COUNT(*) FROM messages GROUP BY ip").fetchall(), [("10.0.0.2", 10)])
+        conn.close()
+        self.assertEqual(pragma(self.db_path, "freelist_count"), 0)
+
+    def test_purge_stops_when_asked(self):
+        init_db(self.db_path)
+        fill_messages(self.db_path, "10.0.0.1", 3000)
+        stop_event = threading.Event()
+        deleted = maintenance.purge_conversation("10.0.0.1", self.db_path, batch_size=1000, pause=0,
+                                                 progress=lambda done, total: stop_event.set(), stop_event=stop_event)
+        self.assertEqual(deleted, 1000)
+
+    def test_vacuum_returns_on_a_database_without_incremental_auto_vacuum(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY, timestamp TEXT, ip TEXT, port INTEGER, "
+                     "message TEXT, delivery_status TEXT)")
+        conn.commit()
+        conn.close()
+        fill_messages(self.db_path, "10.0.0.1", 3000)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("DELETE FROM messages")
+        conn.commit()
+        conn.close()
+        self.assertGreater(pragma(self.db_path, "freelist_count"), 0)
+
+        result = []
+        thread = threading.Thread(target=lambda: result.append(maintenance.vacuum_incrementally(self.db_path, pause=0)),
+                                  daemon=True)
+        thread.start()
+        thread.join(5)
+        self.assertEqual(result, [0])
+
+
+if __name__ == "__main__":
+    unittest.main()
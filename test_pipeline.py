@@ -0,0 +1,27 @@
+import unittest
+
+from config import PIPELINE_WORKERS
+from pipeline import STAGES, ChatMessage, Pipeline, decode_utf8
+
+
+class PipelineOrderTest(unittest.TestCase):
+    def test_stages_before_persist_cannot_reorder(self):
+        for stage in STAGES[:STAGES.index("persist") + 1]:
+            self.assertLessEqual(PIPELINE_WORKERS.get(stage, 1), 1, stage)
+
+    def test_messages_are_persisted_in_arrival_order(self):
+        stored = []
+        pipeline = Pipeline(log_callback=lambda text: None)
+        pipeline.register("decode", decode_utf8)
+        pipeline.register("enrich", lambda message: None)
+        pipeline.register("persist", lambda messages: stored.extend(message.text for message in messages), batch=True)
+        pipeline.start()
+        for n in range(2000):
+            pipeline.submit(ChatMessage("2024-01-01 10:00:00", "10.0.0.1", 6443, raw=str(n).encode(),
+                                        priority="interactive"))
+        pipeline.stop()
+        self.assertEqual(stored, [str(n) for n in range(2000)])
+
+
+if __name__ == "__main__":
+    unittest.main()
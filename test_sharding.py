@@ -0,0 +1,47 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+import sharding
+from bench_throughput import run_benchmark
+from chat_node import ChatNode, init_db
+
+
+@unittest.skipUnless(sharding.reuse_port_supported(), "SO_REUSEPORT is not available")
+class ShardingTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="pychatter-test-")
+        self.db_path = os.path.join(self.workdir, "chat.db")
+        init_db(self.db_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def test_failed_shard_start_stops_the_pipeline(self):
+        with socket.create_server(("127.0.0.1", 0)) as blocker:  # Holds the port without SO_REUSEPORT
+            port = blocker.getsockname()[1]
+            node = ChatNode(self.db_path, port, host="127.0.0.1", shards=2, log_callback=lambda text: None)
+            self.assertFalse(node.start())
+        self.assertFalse(node.pipeline.running)
+        self.assertEqual([thread.name for thread in threading.enumerate() if thread.name.startswith("pipeline-")], [])
+
+    def test_benchmark_counts_shard_cpu_time(self):
+        result = run_benchmark(peers=1, messages=5, sizes=[32], shards=2, timeout=30)
+        shutil.rmtree(os.path.dirname(result["db_path"]), ignore_errors=True)
+        self.assertEqual(result["messages_persisted"], 5)
+        self.assertGreater(result["shard_cpu_seconds"], 0)
+        self.assertGreaterEqual(result["cpu_seconds"], result["shard_cpu_seconds"])
+        self.assertIsNotNone(result["shard_rss_peak_mb"])
+
+    def test_benchmark_without_shards_reports_no_shard_metrics(self):
+        result = run_benchmark(peers=1, messages=5, sizes=[32], timeout=30)
+        shutil.rmtree(os.path.dirname(result["db_path"]), ignore_errors=True)
+        self.assertIsNone(result["shard_cpu_seconds"])
+        self.assertIsNone(result["shard_rss_peak_mb"])
+
+
+if __name__ == "__main__":
+    unittest.main()